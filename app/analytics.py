@@ -1,131 +1,1302 @@
-from datetime import datetime
+import csv
+import os
+from datetime import date, datetime, time, timedelta
 from io import StringIO
-from typing import List, Optional
+from typing import Callable, Iterator, List, Optional
 
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import DateTime, String, cast, func, select, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from . import models
+from . import approx, cache, columnar, models, parallel, profiling, rollup
+from .database import MONTHLY_PARTITIONS, sync_session_of
 
 try:
+    import numpy as np
     import pandas as pd
 except ImportError as exc:  # pragma: no cover
     raise RuntimeError("pandas is required for analytics features.") from exc
 
+# "sql" aggregates inside the database; "pandas" loads order lines and groups in
+# Python. The pandas path is kept as a fallback and for parity checks. "parallel"
+# runs the pandas path over date shards in a process pool (see app/parallel.py).
+# "columnar" runs it on a Parquet replica of the order lines (see app/columnar.py),
+# and sales exports read that replica too when it is the configured engine.
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql").lower()
+ENGINES = ("sql", "pandas", "parallel", "columnar")
+INTERVALS = ("daily", "weekly", "monthly")
+PANDAS_FREQUENCIES = {"daily": "D", "weekly": "W", "monthly": "ME"}
+PANELS = ("sales_over_time", "top_products", "category_summary")
+# "approx" answers from the reservoir sample and product sketches (see app/approx.py)
+# in time independent of the range, and adds 95% error bounds to each value.
+ACCURACIES = ("exact", "approx")
+MAX_ROLLING_WINDOWS = 6
+
+# Rows fetched per round trip while exporting, and the size at which buffered CSV
+# text is flushed to the client.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+EXPORT_COLUMNS = [
+    "order_date",
+    "product_id",
+    "product_name",
+    "category",
+    "quantity",
+    "unit_price",
+    "revenue",
+]
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def _bucket_expression(dialect: str, interval: str, column=None):
+    """Return a SQL expression truncating ``column`` to the bucket start.
+
+    ``column`` defaults to ``Order.order_date``. Weeks start on Monday and months
+    on the first day, on both backends.
+    """
+    column = models.Order.order_date if column is None else column
+    if dialect == "sqlite":
+        modifiers = {
+            "daily": (),
+            "weekly": ("weekday 0", "-6 days"),
+            "monthly": ("start of month",),
+        }[interval]
+        return func.date(column, *modifiers)
+    if dialect == "postgresql":
+        unit = {"daily": "day", "weekly": "week", "monthly": "month"}[interval]
+        return func.date_trunc(unit, cast(column, DateTime))
+    return None
+
+
+def _resolve_engine(db: Session, engine: Optional[str]) -> str:
+    name = (engine or ANALYTICS_ENGINE).lower()
+    if name not in ENGINES:
+        raise HTTPException(status_code=400, detail="Engine must be sql, pandas, parallel, or columnar.")
+    if name == "sql" and _bucket_expression(_dialect(db), "daily") is None:
+        return "pandas"
+    return name
+
+
+def _use_approx(db: Session, accuracy: Optional[str]) -> bool:
+    name = (accuracy or "exact").lower()
+    if name not in ACCURACIES:
+        raise HTTPException(status_code=400, detail="Accuracy must be exact or approx.")
+    # Without the summaries, or a SQL bucket expression, approx requests are answered exactly.
+    return name == "approx" and approx.USE_APPROX and _resolve_engine(db, "sql") == "sql"
+
+
+def _as_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def _next_bucket(start: datetime, interval: str) -> datetime:
+    if interval == "daily":
+        return start + timedelta(days=1)
+    if interval == "weekly":
+        return start + timedelta(weeks=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _bucket_label(start: datetime, interval: str) -> datetime:
+    # Match the pandas resample labels: weeks end on Sunday and months on their last day.
+    if interval == "daily":
+        return start
+    return _next_bucket(start, interval) - timedelta(days=1)
+
+
+def _apply_date_filters(query, start_date: Optional[datetime], end_date: Optional[datetime]):
+    if start_date:
+        query = query.filter(models.Order.order_date >= start_date)
+    if end_date:
+        query = query.filter(models.Order.order_date <= end_date)
+    return query
+
+
+def _apply_line_filters(query, start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Repeat the date bounds on ``order_items`` so its monthly partitions are pruned too.
+
+    The planner does not carry range conditions across the join, so without this
+    every order-line partition would be probed.
+    """
+    if not MONTHLY_PARTITIONS:
+        return query
+    if start_date:
+        query = query.filter(models.OrderItem.order_date >= start_date)
+    if end_date:
+        query = query.filter(models.OrderItem.order_date <= end_date)
+    return query
+
+
+def _uses_rollup(start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """The rollup can answer when both bounds fall on whole-day boundaries."""
+    if not rollup.USE_DAILY_ROLLUP:
+        return False
+    if start_date and start_date.time() != time.min:
+        return False
+    if end_date and end_date.time() != time.max:
+        return False
+    return True
+
+
+def _apply_day_filters(query, start_date: Optional[datetime], end_date: Optional[datetime]):
+    if start_date:
+        query = query.filter(models.DailySalesRollup.day >= start_date.date())
+    if end_date:
+        query = query.filter(models.DailySalesRollup.day <= end_date.date())
+    return query
+
+
+def _revenue_expression():
+    return func.sum(models.OrderItem.quantity * models.OrderItem.unit_price)
+
+
+SALES_FRAME_COLUMNS = [
+    "order_date",
+    "quantity",
+    "unit_price",
+    "product_id",
+    "product_name",
+    "category",
+]
+
+
+def _empty_sales_frame() -> pd.DataFrame:
+    return pd.DataFrame(columns=SALES_FRAME_COLUMNS)
+
 
 def _fetch_sales_rows(
     db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
 ) -> pd.DataFrame:
-    query = (
-        db.query(
-            models.Order.order_date.label("order_date"),
-            models.OrderItem.quantity.label("quantity"),
-            models.OrderItem.unit_price.label("unit_price"),
-            models.Product.id.label("product_id"),
-            models.Product.name.label("product_name"),
-            models.Product.category.label("category"),
+    """Load the order lines of a date range into typed columns.
+
+    Only the fact columns are streamed (in ``EXPORT_BATCH_SIZE`` batches, straight
+    into numpy buffers); product names and categories come from one read of the
+    products table and are attached as categoricals via the product id.
+    """
+    order_date = models.Order.order_date
+    if _dialect(db) == "sqlite":
+        # Skip the per-row string -> datetime processor; numpy parses the ISO text in bulk.
+        order_date = type_coerce(order_date, String)
+    statement = (
+        select(
+            order_date,
+            models.OrderItem.quantity,
+            models.OrderItem.unit_price,
+            models.OrderItem.product_id,
         )
+        .select_from(models.Order)
         .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
-        .join(models.Product, models.Product.id == models.OrderItem.product_id)
     )
-
     if start_date:
-        query = query.filter(models.Order.order_date >= start_date)
+        statement = statement.where(models.Order.order_date >= start_date)
     if end_date:
-        query = query.filter(models.Order.order_date <= end_date)
+        statement = statement.where(models.Order.order_date <= end_date)
+    statement = _apply_line_filters(statement, start_date, end_date)
 
-    rows = query.all()
-    if not rows:
-        return pd.DataFrame(
-            columns=[
-                "order_date",
-                "quantity",
-                "unit_price",
-                "product_id",
-                "product_name",
-                "category",
-            ]
-        )
-
-    # Convert SQLAlchemy Row objects to dictionaries
-    rows_dict = [dict(row._mapping) for row in rows]
-    df = pd.DataFrame(rows_dict)
-    df["order_date"] = pd.to_datetime(df["order_date"])
+    dates, quantities, prices, product_ids = [], [], [], []
+    with profiling.phase("fetch"):
+        # Core execution on the session's connection avoids ORM row processing.
+        result = db.connection().execute(
+            statement, execution_options={"stream_results": True, "yield_per": EXPORT_BATCH_SIZE}
+        )
+        for rows in result.partitions():
+            with profiling.phase("rows"):
+                count = len(rows)
+                columns = list(zip(*rows))
+                dates.append(_datetime_column(columns[0]))
+                quantities.append(np.fromiter(columns[1], dtype=np.int32, count=count))
+                prices.append(np.fromiter(columns[2], dtype=np.float64, count=count))
+                product_ids.append(np.fromiter(columns[3], dtype=np.int32, count=count))
+    if not dates:
+        return _empty_sales_frame()
+
+    with profiling.phase("dataframe"):
+        return _sales_frame(
+            db,
+            np.concatenate(dates),
+            np.concatenate(quantities),
+            np.concatenate(prices),
+            np.concatenate(product_ids),
+        )
+
+
+def _product_rows(db: Session, product_id: np.ndarray) -> list:
+    return db.execute(
+        select(models.Product.id, models.Product.name, models.Product.category).where(
+            models.Product.id.in_(np.unique(product_id).tolist())
+        )
+    ).all()
+
+
+def _sales_frame(
+    db: Session,
+    order_date: np.ndarray,
+    quantity: np.ndarray,
+    unit_price: np.ndarray,
+    product_id: np.ndarray,
+) -> pd.DataFrame:
+    """The ``_fetch_sales_rows`` frame for the given fact columns."""
+    products = _product_rows(db, product_id)
+    df = pd.DataFrame(
+        {"order_date": order_date, "quantity": quantity, "unit_price": unit_price, "product_id": product_id},
+        copy=False,
+    )
+    df["product_name"] = _lookup_categorical(product_id, products, 1)
+    df["category"] = _lookup_categorical(product_id, products, 2)
     df["revenue"] = df["quantity"] * df["unit_price"]
     return df
 
 
-def sales_over_time(
+def _columnar_sales_rows(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> pd.DataFrame:
+    """The ``_fetch_sales_rows`` frame, read from the Parquet replica."""
+    with profiling.phase("fetch"):
+        table = columnar.read_lines(db, start_date, end_date, ["order_date", "quantity", "unit_price", "product_id"])
+    if not table.num_rows:
+        return _empty_sales_frame()
+    with profiling.phase("dataframe"):
+        return _sales_frame(
+            db,
+            table["order_date"].to_numpy(),
+            table["quantity"].to_numpy(),
+            table["unit_price"].to_numpy(),
+            table["product_id"].to_numpy(),
+        )
+
+
+def _sales_rows(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime], engine: str
+) -> pd.DataFrame:
+    if engine == "columnar":
+        return _columnar_sales_rows(db, start_date, end_date)
+    return _fetch_sales_rows(db, start_date, end_date)
+
+
+def _datetime_column(values: tuple) -> np.ndarray:
+    if isinstance(values[0], str):
+        return np.array(values, dtype="datetime64[us]")
+    return pd.to_datetime(list(values)).to_numpy(dtype="datetime64[us]")
+
+
+def _lookup_categorical(product_id: np.ndarray, products: list, field: int) -> pd.Categorical:
+    """Map product ids to a product attribute without materializing one string per row."""
+    labels = sorted({product[field] for product in products})
+    code_of_label = {label: code for code, label in enumerate(labels)}
+    ids = np.array([product[0] for product in products], dtype=np.int32)
+    codes = np.array([code_of_label[product[field]] for product in products], dtype=np.int32)
+    order = np.argsort(ids)
+    positions = order[np.searchsorted(ids, product_id, sorter=order)]
+    return pd.Categorical.from_codes(codes[positions], categories=labels)
+
+
+def _shard_aggregates(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    interval: str,
+    panels: tuple,
+) -> dict:
+    """Unrounded per-bucket, per-product and per-category sums of one shard.
+
+    Runs in a ``parallel`` worker. Summing them again across shards gives the
+    same totals as grouping all the shards' order lines at once.
+    """
+    df = _fetch_sales_rows(db, start_date, end_date)
+    if df.empty:
+        return {}
+    partials = {}
+    with profiling.phase("aggregate"):
+        if "sales_over_time" in panels:
+            partials["sales_over_time"] = (
+                df.groupby(pd.Grouper(key="order_date", freq=PANDAS_FREQUENCIES[interval]))["revenue"]
+                .sum()
+                .reset_index()
+            )
+        if "top_products" in panels:
+            partials["top_products"] = (
+                df.groupby(["product_id", "product_name", "category"], observed=True)[["revenue", "quantity"]]
+                .sum()
+                .reset_index()
+            )
+        if "category_summary" in panels:
+            partials["category_summary"] = (
+                df.groupby("category", observed=True)[["revenue", "quantity"]].sum().reset_index()
+            )
+    return partials
+
+
+def _parallel_frames(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    interval: str,
+    panels: tuple,
+) -> dict:
+    """Shard partials concatenated per panel, ready for the ``_pandas_*`` functions."""
+    shards = parallel.map_shards(_shard_aggregates, db, start_date, end_date, interval, panels)
+    frames = {}
+    for panel in panels:
+        parts = [partials[panel] for partials in shards if panel in partials]
+        frames[panel] = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    return frames
+
+
+def _sql_sales_over_time(
     db: Session, interval: str, start_date: Optional[datetime], end_date: Optional[datetime]
 ) -> List[dict]:
-    freq_map = {"daily": "D", "weekly": "W", "monthly": "M"}
-    if interval not in freq_map:
-        raise HTTPException(status_code=400, detail="Interval must be daily, weekly, or monthly.")
+    if _uses_rollup(start_date, end_date):
+        rollup_table = models.DailySalesRollup
+        bucket = _bucket_expression(_dialect(db), interval, rollup_table.day).label("bucket")
+        query = db.query(bucket, func.sum(rollup_table.revenue).label("revenue"))
+        query = _apply_day_filters(query, start_date, end_date)
+    else:
+        bucket = _bucket_expression(_dialect(db), interval).label("bucket")
+        query = (
+            db.query(bucket, _revenue_expression().label("revenue"))
+            .select_from(models.Order)
+            .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+        )
+        query = _apply_date_filters(query, start_date, end_date)
+        query = _apply_line_filters(query, start_date, end_date)
+    rows = query.group_by(bucket).order_by(bucket).all()
+    return _revenue_points({row.bucket: float(row.revenue or 0) for row in rows}, interval)
 
-    df = _fetch_sales_rows(db, start_date, end_date)
+
+def _revenue_points(revenue_by_bucket: dict, interval: str) -> List[dict]:
+    if not revenue_by_bucket:
+        return []
+
+    totals = {_as_datetime(bucket): revenue for bucket, revenue in revenue_by_bucket.items()}
+    points = []
+    current, last = min(totals), max(totals)
+    # Empty buckets inside the range are reported as zero, like pandas resampling.
+    while current <= last:
+        points.append(
+            {
+                "period_start": _bucket_label(current, interval),
+                "revenue": round(totals.get(current, 0.0), 2),
+            }
+        )
+        current = _next_bucket(current, interval)
+    return points
+
+
+def _approx_sales_over_time(
+    db: Session, interval: str, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> List[dict]:
+    bucket = _bucket_expression(_dialect(db), interval, models.SalesSample.order_date)
+    estimates = approx.sample_estimates(db, bucket, start_date, end_date)
+    if not estimates:
+        return []
+
+    totals = {_as_datetime(key): estimate for key, estimate in estimates.items()}
+    points = []
+    current, last = min(totals), max(totals)
+    while current <= last:
+        estimate = totals.get(current, approx.Estimate(0.0, 0.0, 0.0, 0.0))
+        points.append(
+            {
+                "period_start": _bucket_label(current, interval),
+                "revenue": round(estimate.revenue, 2),
+                "revenue_error": round(estimate.revenue_error, 2),
+            }
+        )
+        current = _next_bucket(current, interval)
+    return points
+
+
+def _pandas_sales_over_time(df: pd.DataFrame, interval: str) -> List[dict]:
     if df.empty:
         return []
 
-    grouped = (
-        df.set_index("order_date")
-        .groupby(pd.Grouper(freq=freq_map[interval]))
-        .agg({"revenue": "sum"})
-        .reset_index()
-    )
-    grouped["revenue"] = grouped["revenue"].round(2)
+    with profiling.phase("aggregate"):
+        grouped = (
+            df.set_index("order_date")
+            .groupby(pd.Grouper(freq=PANDAS_FREQUENCIES[interval]))
+            .agg({"revenue": "sum"})
+            .reset_index()
+        )
+        grouped["revenue"] = grouped["revenue"].round(2)
     return [
         {"period_start": row.order_date.to_pydatetime(), "revenue": float(row.revenue)}
         for row in grouped.itertuples()
     ]
 
 
-def top_products(
+@cache.cached("sales_over_time")
+def sales_over_time(
+    db: Session,
+    interval: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+) -> List[dict]:
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail="Interval must be daily, weekly, or monthly.")
+
+    if _use_approx(db, accuracy):
+        return _approx_sales_over_time(db, interval, start_date, end_date)
+    engine = _resolve_engine(db, engine)
+    if engine == "sql":
+        return _sql_sales_over_time(db, interval, start_date, end_date)
+    if engine == "parallel":
+        frames = _parallel_frames(db, start_date, end_date, interval, ("sales_over_time",))
+        return _pandas_sales_over_time(frames["sales_over_time"], interval)
+    return _pandas_sales_over_time(_sales_rows(db, start_date, end_date, engine), interval)
+
+
+def _daily_revenue(db: Session, engine: str) -> pd.Series:
+    """Unrounded revenue per day over all orders, indexed by day."""
+    if engine == "sql":
+        if rollup.USE_DAILY_ROLLUP:
+            day = models.DailySalesRollup.day
+            query = db.query(day.label("day"), func.sum(models.DailySalesRollup.revenue))
+        else:
+            day = _bucket_expression(_dialect(db), "daily")
+            query = (
+                db.query(day.label("day"), _revenue_expression())
+                .select_from(models.Order)
+                .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+            )
+        rows = query.group_by(day).all()
+        return pd.Series(
+            [float(revenue or 0) for _, revenue in rows],
+            index=pd.DatetimeIndex([_as_datetime(value) for value, _ in rows]),
+            dtype=float,
+        )
+    if engine == "parallel":
+        frame = _parallel_frames(db, None, None, "daily", ("sales_over_time",))["sales_over_time"]
+    else:
+        frame = _sales_rows(db, None, None, engine)
+    if frame.empty:
+        return pd.Series(dtype=float)
+    return frame.groupby(pd.Grouper(key="order_date", freq="D"))["revenue"].sum()
+
+
+@cache.cached("daily_prefix_sums")
+def _daily_prefix_sums(db: Session, engine: str) -> tuple:
+    """``(first_day, sums)`` where ``sums[i]`` is the revenue of the ``i`` days from ``first_day``.
+
+    Any run of days then sums in O(1), so each extra window or comparison
+    period costs one subtraction per bucket. Cached per data version.
+    """
+    daily = _daily_revenue(db, engine)
+    if daily.empty:
+        return None, np.zeros(1)
+    daily = daily.sort_index()
+    days = pd.date_range(daily.index[0], daily.index[-1], freq="D")
+    values = daily.groupby(level=0).sum().reindex(days, fill_value=0.0).to_numpy()
+    return days[0].to_pydatetime(), np.concatenate(([0.0], np.cumsum(values)))
+
+
+def parse_windows(text: str) -> tuple:
+    """Parse a comma-separated list of rolling window lengths in days."""
+    try:
+        windows = tuple(sorted({int(value) for value in text.split(",") if value.strip()}))
+    except ValueError:
+        windows = ()
+    if not windows or len(windows) > MAX_ROLLING_WINDOWS or not 1 <= windows[0] <= windows[-1] <= 366:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Windows must be 1 to {MAX_ROLLING_WINDOWS} day counts between 1 and 366.",
+        )
+    return windows
+
+
+def _previous_year(day: datetime) -> datetime:
+    # 29 February compares with the 28th.
+    return day.replace(year=day.year - 1, day=min(day.day, 28) if day.month == 2 else day.day)
+
+
+def _change(current: float, previous: float) -> Optional[float]:
+    return round((current - previous) / previous, 4) if previous else None
+
+
+@cache.cached("sales_trends")
+def sales_trends(
+    db: Session,
+    interval: str,
+    windows: tuple,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: Optional[str] = None,
+) -> List[dict]:
+    """Revenue per bucket with trailing windows and week/year-earlier comparisons.
+
+    Works on whole days: bounds select the days they fall on, and buckets cut
+    by them are partial, as in ``sales_over_time``. ``rolling`` holds the
+    revenue of the ``n`` days up to each bucket's last day, for every ``n`` in
+    ``windows``, and may reach back before ``start_date``. ``previous_week`` and
+    ``previous_year`` are the same days shifted back 7 days and one calendar
+    year. Everything is read from the cached daily prefix sums.
+    """
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail="Interval must be daily, weekly, or monthly.")
+    first_day, sums = _daily_prefix_sums(db, _resolve_engine(db, engine))
+    if first_day is None:
+        return []
+    last_day = first_day + timedelta(days=len(sums) - 2)
+
+    def revenue(start: datetime, end: datetime) -> float:
+        low = min(max((start - first_day).days, 0), len(sums) - 1)
+        high = min(max((end - first_day).days + 1, 0), len(sums) - 1)
+        return float(sums[high] - sums[low]) if high > low else 0.0
+
+    range_start = _as_datetime(start_date.date()) if start_date else first_day
+    range_end = _as_datetime(end_date.date()) if end_date else last_day
+    # The series never extends past the first and last day with sales.
+    range_start, range_end = max(range_start, first_day), min(range_end, last_day)
+    if range_start > range_end:
+        return []
+
+    bucket = range_start
+    if interval == "weekly":
+        bucket -= timedelta(days=bucket.weekday())
+    elif interval == "monthly":
+        bucket = bucket.replace(day=1)
+    points = []
+    while bucket <= range_end:
+        following = _next_bucket(bucket, interval)
+        start, end = max(bucket, range_start), min(following - timedelta(days=1), range_end)
+        current = revenue(start, end)
+        previous_week = revenue(start - timedelta(weeks=1), end - timedelta(weeks=1))
+        previous_year = revenue(_previous_year(start), _previous_year(end))
+        points.append(
+            {
+                "period_start": _bucket_label(bucket, interval),
+                "revenue": round(current, 2),
+                "rolling": {
+                    f"{days}d": round(revenue(end - timedelta(days=days - 1), end), 2) for days in windows
+                },
+                "previous_week": round(previous_week, 2),
+                "week_over_week": _change(current, previous_week),
+                "previous_year": round(previous_year, 2),
+                "year_over_year": _change(current, previous_year),
+            }
+        )
+        bucket = following
+    return points
+
+
+def _sql_top_products(
     db: Session, limit: int, start_date: Optional[datetime], end_date: Optional[datetime]
 ) -> List[dict]:
-    df = _fetch_sales_rows(db, start_date, end_date)
+    columns = (
+        models.Product.id.label("product_id"),
+        models.Product.name.label("product_name"),
+        models.Product.category.label("category"),
+    )
+    if _uses_rollup(start_date, end_date):
+        rollup_table = models.DailySalesRollup
+        revenue = func.sum(rollup_table.revenue).label("revenue")
+        query = db.query(
+            *columns, revenue, func.sum(rollup_table.quantity).label("quantity")
+        ).join(rollup_table, models.Product.id == rollup_table.product_id)
+        query = _apply_day_filters(query, start_date, end_date)
+    else:
+        revenue = _revenue_expression().label("revenue")
+        query = (
+            db.query(*columns, revenue, func.sum(models.OrderItem.quantity).label("quantity"))
+            .select_from(models.Order)
+            .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+            .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        )
+        query = _apply_date_filters(query, start_date, end_date)
+        query = _apply_line_filters(query, start_date, end_date)
+    rows = (
+        query.group_by(models.Product.id, models.Product.name, models.Product.category)
+        .order_by(revenue.desc(), models.Product.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "product_id": row.product_id,
+            "product_name": row.product_name,
+            "category": row.category,
+            "revenue": round(float(row.revenue), 2),
+            "quantity": int(row.quantity),
+        }
+        for row in rows
+    ]
+
+
+def _approx_top_products(
+    db: Session, limit: int, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> List[dict]:
+    estimates = approx.product_estimates(db, start_date, end_date)
+    ranked = sorted(estimates.items(), key=lambda item: (-item[1].revenue, item[0]))[:limit]
+    products = {
+        row.id: row
+        for row in db.query(models.Product.id, models.Product.name, models.Product.category).filter(
+            models.Product.id.in_([product_id for product_id, _ in ranked])
+        )
+    }
+    return [
+        {
+            "product_id": product_id,
+            "product_name": products[product_id].name,
+            "category": products[product_id].category,
+            "revenue": round(estimate.revenue, 2),
+            "quantity": int(round(estimate.quantity)),
+            "revenue_error": round(estimate.revenue_error, 2),
+            "quantity_error": round(estimate.quantity_error, 2),
+        }
+        for product_id, estimate in ranked
+        if product_id in products
+    ]
+
+
+def _pandas_top_products(df: pd.DataFrame, limit: int) -> List[dict]:
     if df.empty:
         return []
 
-    grouped = (
-        df.groupby(["product_id", "product_name", "category"])
-        .agg({"revenue": "sum", "quantity": "sum"})
-        .reset_index()
-        .sort_values(by="revenue", ascending=False)
-        .head(limit)
-    )
-    grouped["revenue"] = grouped["revenue"].round(2)
+    with profiling.phase("aggregate"):
+        grouped = (
+            df.groupby(["product_id", "product_name", "category"], observed=True)
+            .agg({"revenue": "sum", "quantity": "sum"})
+            .reset_index()
+            .sort_values(by="revenue", ascending=False)
+            .head(limit)
+        )
+        grouped["revenue"] = grouped["revenue"].round(2)
     return grouped.to_dict(orient="records")
 
 
-def category_summary(
+@cache.cached("top_products")
+def top_products(
+    db: Session,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+) -> List[dict]:
+    if _use_approx(db, accuracy):
+        return _approx_top_products(db, limit, start_date, end_date)
+    engine = _resolve_engine(db, engine)
+    if engine == "sql":
+        return _sql_top_products(db, limit, start_date, end_date)
+    if engine == "parallel":
+        frames = _parallel_frames(db, start_date, end_date, "monthly", ("top_products",))
+        return _pandas_top_products(frames["top_products"], limit)
+    return _pandas_top_products(_sales_rows(db, start_date, end_date, engine), limit)
+
+
+def _sql_category_rows(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]):
+    if _uses_rollup(start_date, end_date):
+        rollup_table = models.DailySalesRollup
+        category = rollup_table.category.label("category")
+        query = db.query(
+            category,
+            func.sum(rollup_table.revenue).label("revenue"),
+            func.sum(rollup_table.quantity).label("quantity"),
+        )
+        query = _apply_day_filters(query, start_date, end_date)
+    else:
+        category = models.Product.category.label("category")
+        query = (
+            db.query(
+                category,
+                _revenue_expression().label("revenue"),
+                func.sum(models.OrderItem.quantity).label("quantity"),
+            )
+            .select_from(models.Order)
+            .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+            .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        )
+        query = _apply_date_filters(query, start_date, end_date)
+        query = _apply_line_filters(query, start_date, end_date)
+    return query.group_by(category).order_by(category).all()
+
+
+def _format_categories(rows) -> List[dict]:
+    return [
+        {
+            "category": row["category"],
+            "revenue": round(float(row["revenue"]), 2),
+            "quantity": int(row["quantity"]),
+        }
+        for row in rows
+    ]
+
+
+def _sql_category_summary(
     db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
 ) -> List[dict]:
-    df = _fetch_sales_rows(db, start_date, end_date)
+    return _format_categories(row._asdict() for row in _sql_category_rows(db, start_date, end_date))
+
+
+def _approx_category_summary(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> List[dict]:
+    estimates = approx.sample_estimates(db, models.SalesSample.category, start_date, end_date)
+    return [
+        {
+            "category": category,
+            "revenue": round(estimate.revenue, 2),
+            "quantity": int(round(estimate.quantity)),
+            "revenue_error": round(estimate.revenue_error, 2),
+            "quantity_error": round(estimate.quantity_error, 2),
+        }
+        for category, estimate in sorted(estimates.items())
+    ]
+
+
+def _pandas_category_summary(df: pd.DataFrame) -> List[dict]:
     if df.empty:
         return []
 
-    grouped = df.groupby("category").agg({"revenue": "sum", "quantity": "sum"}).reset_index()
-    grouped["revenue"] = grouped["revenue"].round(2)
+    with profiling.phase("aggregate"):
+        grouped = (
+            df.groupby("category", observed=True)
+            .agg({"revenue": "sum", "quantity": "sum"})
+            .reset_index()
+        )
+        grouped["revenue"] = grouped["revenue"].round(2)
     return grouped.to_dict(orient="records")
 
 
-def sales_csv(
+@cache.cached("category_summary")
+def category_summary(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+) -> List[dict]:
+    if _use_approx(db, accuracy):
+        return _approx_category_summary(db, start_date, end_date)
+    engine = _resolve_engine(db, engine)
+    if engine == "sql":
+        return _sql_category_summary(db, start_date, end_date)
+    if engine == "parallel":
+        frames = _parallel_frames(db, start_date, end_date, "monthly", ("category_summary",))
+        return _pandas_category_summary(frames["category_summary"])
+    return _pandas_category_summary(_sales_rows(db, start_date, end_date, engine))
+
+
+def _order_totals(
     db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
-) -> str:
-    df = _fetch_sales_rows(db, start_date, end_date)
-    if df.empty:
-        return ""
+) -> tuple:
+    """Order and distinct customer counts, read from the orders table alone."""
+    query = db.query(
+        func.count(models.Order.id), func.count(func.distinct(models.Order.customer_id))
+    )
+    return tuple(_apply_date_filters(query, start_date, end_date).one())
 
-    buffer = StringIO()
-    export_columns = [
-        "order_date",
-        "product_id",
-        "product_name",
-        "category",
-        "quantity",
-        "unit_price",
-        "revenue",
+
+def _dashboard_totals(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    revenue: float,
+    quantity: int,
+) -> dict:
+    order_count, distinct_customers = _order_totals(db, start_date, end_date)
+    return {
+        "order_count": int(order_count),
+        "distinct_customers": int(distinct_customers),
+        "revenue": round(revenue, 2),
+        "quantity": int(quantity),
+        "average_order_value": round(revenue / order_count, 2) if order_count else 0.0,
+    }
+
+
+def _sql_line_panels(
+    db: Session,
+    interval: str,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+) -> tuple:
+    """Sales over time, top products and categories from one pass over the order lines.
+
+    A single GROUP BY (bucket, product) is folded into the three panels here,
+    instead of joining and scanning the lines once per panel.
+    """
+    bucket = _bucket_expression(_dialect(db), interval).label("bucket")
+    query = (
+        db.query(
+            bucket,
+            models.OrderItem.product_id,
+            models.Product.category,
+            _revenue_expression(),
+            func.sum(models.OrderItem.quantity),
+        )
+        .select_from(models.Order)
+        .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+    )
+    query = _apply_date_filters(query, start_date, end_date)
+    query = _apply_line_filters(query, start_date, end_date)
+    query = query.group_by(bucket, models.OrderItem.product_id, models.Product.category)
+
+    revenue_by_bucket: dict = {}
+    products: dict = {}
+    categories: dict = {}
+    for row_bucket, product_id, category, revenue, quantity in query:
+        revenue, quantity = float(revenue or 0), int(quantity or 0)
+        revenue_by_bucket[row_bucket] = revenue_by_bucket.get(row_bucket, 0.0) + revenue
+        for totals, key in ((products, (product_id, category)), (categories, category)):
+            entry = totals.setdefault(key, [0.0, 0])
+            entry[0] += revenue
+            entry[1] += quantity
+
+    ranked = sorted(products.items(), key=lambda item: (-item[1][0], item[0][0]))[:limit]
+    names = dict(
+        db.query(models.Product.id, models.Product.name).filter(
+            models.Product.id.in_([product_id for (product_id, _), _ in ranked])
+        )
+    )
+    top = [
+        {
+            "product_id": product_id,
+            "product_name": names[product_id],
+            "category": category,
+            "revenue": round(revenue, 2),
+            "quantity": quantity,
+        }
+        for (product_id, category), (revenue, quantity) in ranked
+    ]
+    category_rows = [
+        {"category": category, "revenue": revenue, "quantity": quantity}
+        for category, (revenue, quantity) in sorted(categories.items())
     ]
-    df[export_columns].to_csv(buffer, index=False)
-    return buffer.getvalue()
+    return _revenue_points(revenue_by_bucket, interval), top, category_rows
 
+
+def _sql_dashboard(
+    db: Session,
+    interval: str,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+) -> dict:
+    if _uses_rollup(start_date, end_date):
+        # The rollup is small enough that one narrow aggregate per panel beats
+        # fetching and folding every (bucket, product) row.
+        categories = [row._asdict() for row in _sql_category_rows(db, start_date, end_date)]
+        sales_over_time = _sql_sales_over_time(db, interval, start_date, end_date)
+        top = _sql_top_products(db, limit, start_date, end_date)
+    else:
+        sales_over_time, top, categories = _sql_line_panels(db, interval, limit, start_date, end_date)
+    return {
+        "sales_over_time": sales_over_time,
+        "top_products": top,
+        "category_summary": _format_categories(categories),
+        "totals": _dashboard_totals(
+            db,
+            start_date,
+            end_date,
+            sum(float(row["revenue"]) for row in categories),
+            sum(int(row["quantity"]) for row in categories),
+        ),
+    }
+
+
+def _pandas_dashboard(
+    db: Session,
+    interval: str,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: str,
+) -> dict:
+    df = _sales_rows(db, start_date, end_date, engine)
+    revenue = float(df["revenue"].sum()) if not df.empty else 0.0
+    quantity = int(df["quantity"].sum()) if not df.empty else 0
+    return {
+        "sales_over_time": _pandas_sales_over_time(df, interval),
+        "top_products": _pandas_top_products(df, limit),
+        "category_summary": _pandas_category_summary(df),
+        "totals": _dashboard_totals(db, start_date, end_date, revenue, quantity),
+    }
+
+
+def _parallel_dashboard(
+    db: Session,
+    interval: str,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+) -> dict:
+    frames = _parallel_frames(db, start_date, end_date, interval, PANELS)
+    categories = frames["category_summary"]
+    revenue = float(categories["revenue"].sum()) if not categories.empty else 0.0
+    quantity = int(categories["quantity"].sum()) if not categories.empty else 0
+    return {
+        "sales_over_time": _pandas_sales_over_time(frames["sales_over_time"], interval),
+        "top_products": _pandas_top_products(frames["top_products"], limit),
+        "category_summary": _pandas_category_summary(categories),
+        "totals": _dashboard_totals(db, start_date, end_date, revenue, quantity),
+    }
+
+
+@cache.cached("dashboard")
+def dashboard(
+    db: Session,
+    interval: str,
+    limit: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    engine: Optional[str] = None,
+) -> dict:
+    """Sales over time, top products, category summary and totals in one call.
+
+    Each panel matches the corresponding single-metric function for the same
+    arguments. The pandas engine loads the order lines once for all panels.
+    """
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail="Interval must be daily, weekly, or monthly.")
+
+    engine = _resolve_engine(db, engine)
+    if engine == "sql":
+        return _sql_dashboard(db, interval, limit, start_date, end_date)
+    if engine == "parallel":
+        return _parallel_dashboard(db, interval, limit, start_date, end_date)
+    return _pandas_dashboard(db, interval, limit, start_date, end_date, engine)
+
+
+def _rfm_segment(recency: int, frequency: int) -> str:
+    if recency >= 4 and frequency >= 4:
+        return "champions"
+    if recency >= 3 and frequency >= 3:
+        return "loyal"
+    if recency >= 4:
+        return "new"
+    if recency == 3:
+        return "promising"
+    if frequency >= 3:
+        return "at_risk"
+    if recency == 2:
+        return "hibernating"
+    return "lost"
+
+
+@cache.cached("customer_rfm")
+def customer_rfm(db: Session, limit: int, as_of: Optional[datetime] = None) -> dict:
+    """RFM quintile scores over every customer with an order, from ``customer_summaries``.
+
+    Each score is the customer's NTILE(5) on last order date, order count and
+    lifetime revenue, so 5 is the most recent, frequent or valuable fifth; with
+    fewer than five customers the top scores go unused. ``recency_days`` counts
+    back from ``as_of``, by default the latest order. Returns the customer count
+    per segment and the ``limit`` customers with the highest combined score.
+    """
+    summary = models.CustomerSummary
+    scored = (
+        select(
+            summary.customer_id,
+            models.Customer.name,
+            summary.last_order_date,
+            summary.order_count,
+            summary.revenue,
+            func.ntile(5).over(order_by=(summary.last_order_date, summary.customer_id)).label("r"),
+            func.ntile(5).over(order_by=(summary.order_count, summary.customer_id)).label("f"),
+            func.ntile(5).over(order_by=(summary.revenue, summary.customer_id)).label("m"),
+        )
+        .join(models.Customer, models.Customer.id == summary.customer_id)
+        .subquery()
+    )
+
+    segments = {}
+    for row in db.execute(
+        select(scored.c.r, scored.c.f, func.count(), func.sum(scored.c.revenue)).group_by(
+            scored.c.r, scored.c.f
+        )
+    ):
+        entry = segments.setdefault(_rfm_segment(row[0], row[1]), [0, 0.0])
+        entry[0] += int(row[2])
+        entry[1] += float(row[3])
+
+    top = db.execute(
+        select(scored)
+        .order_by((scored.c.r + scored.c.f + scored.c.m).desc(), scored.c.revenue.desc(), scored.c.customer_id)
+        .limit(limit)
+    ).all()
+
+    if as_of is None:
+        latest = db.query(func.max(summary.last_order_date)).scalar()
+        as_of = _as_datetime(latest) if latest is not None else None
+    else:
+        as_of = _as_datetime(as_of)
+    customers = [
+        {
+            "customer_id": row.customer_id,
+            "name": row.name,
+            "recency_days": max((as_of - _as_datetime(row.last_order_date)).days, 0),
+            "frequency": int(row.order_count),
+            "monetary": round(float(row.revenue), 2),
+            "recency_score": int(row.r),
+            "frequency_score": int(row.f),
+            "monetary_score": int(row.m),
+            "rfm_score": f"{row.r}{row.f}{row.m}",
+            "segment": _rfm_segment(row.r, row.f),
+        }
+        for row in top
+    ]
+    return {
+        "as_of": as_of,
+        "customer_count": sum(count for count, _ in segments.values()),
+        "segments": [
+            {"segment": name, "customers": count, "revenue": round(revenue, 2)}
+            for name, (count, revenue) in sorted(segments.items(), key=lambda item: -item[1][0])
+        ],
+        "customers": customers,
+    }
+
+
+def _months_between(start: datetime, end: datetime) -> int:
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+@cache.cached("cohorts")
+def cohorts(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    periods: int,
+) -> List[dict]:
+    """Monthly acquisition cohorts and the share of each still ordering in later months.
+
+    Customers are grouped by the month of their first order (filtered by
+    ``start_date``/``end_date``); period ``n`` counts the cohort's customers with
+    an order ``n`` months later. Reads ``customer_summaries`` joined with
+    ``customer_months``, never the order tables. Periods after the latest month
+    with orders are left out.
+    """
+    summary, months = models.CustomerSummary, models.CustomerMonth
+    cohort = _bucket_expression(_dialect(db), "monthly", summary.first_order_date).label("cohort")
+    query = (
+        select(cohort, months.month, func.count(), func.sum(months.revenue))
+        .select_from(summary)
+        .join(months, months.customer_id == summary.customer_id)
+    )
+    if start_date:
+        query = query.where(summary.first_order_date >= start_date)
+    if end_date:
+        query = query.where(summary.first_order_date <= end_date)
+    rows = db.execute(query.group_by(cohort, months.month)).all()
+    if not rows:
+        return []
+
+    activity = {}
+    for cohort_month, month, active, revenue in rows:
+        cohort_month, month = _as_datetime(cohort_month), _as_datetime(month)
+        activity.setdefault(cohort_month, {})[_months_between(cohort_month, month)] = (
+            int(active),
+            float(revenue),
+        )
+    latest = max(_as_datetime(row[1]) for row in rows)
+
+    result = []
+    for cohort_month in sorted(activity):
+        size = activity[cohort_month].get(0, (0, 0.0))[0]
+        span = min(periods, _months_between(cohort_month, latest) + 1)
+        result.append(
+            {
+                "cohort": cohort_month.date(),
+                "customers": size,
+                "periods": [
+                    {
+                        "period": period,
+                        "active_customers": active,
+                        "retention": round(active / size, 4) if size else 0.0,
+                        "revenue": round(revenue, 2),
+                    }
+                    for period in range(span)
+                    for active, revenue in [activity[cohort_month].get(period, (0, 0.0))]
+                ],
+            }
+        )
+    return result
+
+
+def _call_in_session(db: Session, function: Callable, *args):
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+
+async def _offload(db: AsyncSession, function: Callable, *args):
+    """Run ``function`` in the threadpool, on a sync session to the database behind ``db``.
+
+    ``run_sync`` would keep the event loop busy for the pandas, parallel and
+    columnar engines and for folding rows in Python, not just for the queries.
+    """
+    return await run_in_threadpool(_call_in_session, sync_session_of(db), function, *args)
+
+
+async def sales_over_time_async(db: AsyncSession, *args) -> List[dict]:
+    return await _offload(db, sales_over_time, *args)
+
+
+async def sales_trends_async(db: AsyncSession, *args) -> List[dict]:
+    return await _offload(db, sales_trends, *args)
+
+
+async def top_products_async(db: AsyncSession, *args) -> List[dict]:
+    return await _offload(db, top_products, *args)
+
+
+async def category_summary_async(db: AsyncSession, *args) -> List[dict]:
+    return await _offload(db, category_summary, *args)
+
+
+async def dashboard_async(db: AsyncSession, *args) -> dict:
+    return await _offload(db, dashboard, *args)
+
+
+async def customer_rfm_async(db: AsyncSession, *args) -> dict:
+    return await _offload(db, customer_rfm, *args)
+
+
+async def cohorts_async(db: AsyncSession, *args) -> List[dict]:
+    return await _offload(db, cohorts, *args)
+
+
+def _export_statement(start_date: Optional[datetime], end_date: Optional[datetime]):
+    statement = (
+        select(
+            models.Order.order_date,
+            models.Product.id,
+            models.Product.name,
+            models.Product.category,
+            models.OrderItem.quantity,
+            models.OrderItem.unit_price,
+            (models.OrderItem.quantity * models.OrderItem.unit_price).label("revenue"),
+        )
+        .select_from(models.Order)
+        .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        .order_by(models.Order.order_date, models.OrderItem.id)
+    )
+    if start_date:
+        statement = statement.where(models.Order.order_date >= start_date)
+    if end_date:
+        statement = statement.where(models.Order.order_date <= end_date)
+    statement = _apply_line_filters(statement, start_date, end_date)
+    return statement
+
+
+def export_row_count(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]) -> int:
+    """Number of rows ``iter_sales_batches`` yields for the range."""
+    if ANALYTICS_ENGINE == "columnar":
+        return columnar.count_lines(db, start_date, end_date)
+    statement = _export_statement(start_date, end_date).order_by(None)
+    return db.execute(select(func.count()).select_from(statement.subquery())).scalar_one()
+
+
+def iter_sales_batches(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Iterator[list]:
+    """Yield export rows (in ``EXPORT_COLUMNS`` order) in lists of ``batch_size``.
+
+    ``on_batch`` is called with the size of each batch as it is fetched.
+    """
+    if ANALYTICS_ENGINE == "columnar":
+        return _columnar_batches(db, start_date, end_date, batch_size or EXPORT_BATCH_SIZE, on_batch)
+    return _stream_batches(
+        db.get_bind(), _export_statement(start_date, end_date), batch_size or EXPORT_BATCH_SIZE, on_batch
+    )
+
+
+def _stream_batches(
+    bind: Engine, statement, batch_size: int, on_batch: Optional[Callable[[int], None]] = None
+) -> Iterator[list]:
+    # A dedicated connection keeps the cursor alive after the request's session is
+    # closed; stream_results uses a server-side (named) cursor on PostgreSQL.
+    with bind.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(
+            statement
+        )
+        for rows in result.partitions():
+            if on_batch is not None:
+                on_batch(len(rows))
+            yield rows
+
+
+def _columnar_batches(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    batch_size: int,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Iterator[list]:
+    """The export rows from the Parquet replica, in the order of ``_export_statement``."""
+    products = {}
+    tables = columnar.iter_sorted_lines(
+        db, start_date, end_date, ["order_date", "product_id", "quantity", "unit_price"]
+    )
+    for table in tables:
+        product_id = table["product_id"].to_numpy()
+        missing = np.setdiff1d(np.unique(product_id), np.fromiter(products, dtype=np.int64, count=len(products)))
+        if len(missing):
+            products.update((row[0], row) for row in _product_rows(db, missing))
+        for offset in range(0, table.num_rows, batch_size):
+            batch = table.slice(offset, batch_size)
+            rows = []
+            for order_date, product_id, quantity, unit_price in zip(
+                batch["order_date"].to_pylist(),
+                batch["product_id"].to_pylist(),
+                batch["quantity"].to_pylist(),
+                batch["unit_price"].to_pylist(),
+            ):
+                product = products.get(product_id)
+                # The SQL export joins products, so lines without one are left out there too.
+                if product is not None:
+                    rows.append(
+                        (order_date, product_id, product[1], product[2], quantity, unit_price, quantity * unit_price)
+                    )
+            if on_batch is not None:
+                on_batch(len(rows))
+            yield rows
+
+
+def iter_sales_csv(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Iterator[str]:
+    """Yield the sales export as CSV text chunks of roughly ``EXPORT_CHUNK_BYTES``.
+
+    Nothing is yielded when the range has no order lines.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for index, rows in enumerate(iter_sales_batches(db, start_date, end_date, on_batch=on_batch)):
+        if index == 0:
+            writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def sales_csv(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> str:
+    return "".join(iter_sales_csv(db, start_date, end_date))
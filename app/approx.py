@@ -0,0 +1,347 @@
+"""
+Summaries behind ``accuracy=approx`` analytics.
+
+``sales_sample`` is a uniform reservoir sample (Algorithm R) of every order line
+written. It holds ``APPROX_SAMPLE_SIZE`` rows however many lines exist, so
+sampled estimates cost the same for any date range. ``product_sketches`` holds
+per-month Count-Min sketches of product revenue and quantity, plus each month's
+heavy-hitter candidates, for the top-products estimate.
+
+Like the daily rollup, both are updated in the caller's transaction on order
+writes, and ``rebuild`` recomputes them from the order tables.
+"""
+
+import json
+import math
+import os
+import random
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, not_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+USE_APPROX = os.getenv("APPROX_ANALYTICS", "1").lower() not in ("0", "false", "no")
+SAMPLE_SIZE = int(os.getenv("APPROX_SAMPLE_SIZE", "20000"))
+SKETCH_WIDTH = 1024
+SKETCH_DEPTH = 4
+SKETCH_CANDIDATES = 64
+# Two-sided 95% normal quantile used for the sample confidence intervals.
+Z_95 = 1.96
+
+_PRIME = 2 ** 31 - 1
+_hash_seeds = random.Random(2024)
+_HASH_A = np.array([_hash_seeds.randrange(1, _PRIME) for _ in range(SKETCH_DEPTH)], dtype=np.int64)
+_HASH_B = np.array([_hash_seeds.randrange(0, _PRIME) for _ in range(SKETCH_DEPTH)], dtype=np.int64)
+_reservoir = random.Random()
+
+# (order_date, product_id, category, quantity, unit_price)
+Line = Tuple[datetime, int, str, int, float]
+
+
+class Estimate(NamedTuple):
+    revenue: float
+    revenue_error: float
+    quantity: float
+    quantity_error: float
+
+
+def _month(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _columns(product_ids: Iterable[int]) -> np.ndarray:
+    """Counter column of each product id in every sketch row, shape (depth, len(ids))."""
+    ids = np.asarray(list(product_ids), dtype=np.int64)
+    return (_HASH_A[:, None] * ids[None, :] + _HASH_B[:, None]) % _PRIME % SKETCH_WIDTH
+
+
+def _counters(blob: Optional[bytes]) -> np.ndarray:
+    if not blob:
+        return np.zeros((SKETCH_DEPTH, SKETCH_WIDTH))
+    return np.frombuffer(blob, dtype=np.float64).reshape(SKETCH_DEPTH, SKETCH_WIDTH).copy()
+
+
+def _add(counters: np.ndarray, columns: np.ndarray, values: np.ndarray) -> None:
+    for row in range(SKETCH_DEPTH):
+        np.add.at(counters[row], columns[row], values)
+
+
+def _point_estimates(counters: np.ndarray, product_ids: List[int]) -> np.ndarray:
+    return counters[np.arange(SKETCH_DEPTH)[:, None], _columns(product_ids)].min(axis=0)
+
+
+def _top_candidates(counters: np.ndarray, product_ids: Iterable[int]) -> List[int]:
+    ids = sorted(product_ids)
+    if not ids:
+        return []
+    order = np.argsort(-_point_estimates(counters, ids), kind="stable")
+    return [ids[index] for index in order[:SKETCH_CANDIDATES]]
+
+
+def record_lines(db: Session, lines: List[Line]) -> None:
+    """Offer new order lines to the sample and the monthly sketches without committing."""
+    if not USE_APPROX or not lines:
+        return
+    _sample_lines(db, lines)
+    by_month = defaultdict(list)
+    for line in lines:
+        by_month[_month(line[0])].append(line)
+    for month, month_lines in by_month.items():
+        _sketch_lines(db, month, month_lines)
+
+
+def _sample_lines(db: Session, lines: List[Line]) -> None:
+    state = models.SampleState.__table__
+    sample = models.SalesSample.__table__
+    seen = db.execute(select(state.c.lines_seen).where(state.c.id == 1).with_for_update()).scalar()
+    if seen is None:
+        db.execute(insert(state).values(id=1, lines_seen=0))
+        seen = 0
+
+    # Algorithm R: the n-th line replaces a random slot with probability SAMPLE_SIZE / n.
+    kept = {}
+    for line in lines:
+        seen += 1
+        slot = seen - 1 if seen <= SAMPLE_SIZE else _reservoir.randrange(seen)
+        if slot < SAMPLE_SIZE:
+            kept[slot] = line
+    db.execute(update(state).where(state.c.id == 1).values(lines_seen=seen))
+    if kept:
+        db.execute(delete(sample).where(sample.c.slot.in_(list(kept))))
+        db.execute(
+            insert(sample),
+            [
+                {
+                    "slot": slot,
+                    "order_date": order_date,
+                    "product_id": product_id,
+                    "category": category,
+                    "quantity": quantity,
+                    "unit_price": unit_price,
+                }
+                for slot, (order_date, product_id, category, quantity, unit_price) in kept.items()
+            ],
+        )
+
+
+def _sketch_lines(db: Session, month: date, lines: List[Line]) -> None:
+    sketch = db.get(models.ProductSketch, month)
+    if sketch is None:
+        sketch = models.ProductSketch(month=month, revenue=0.0, quantity=0, candidates="[]")
+        db.add(sketch)
+    revenue = _counters(sketch.revenue_counters)
+    quantity = _counters(sketch.quantity_counters)
+
+    product_ids = [line[1] for line in lines]
+    line_quantity = np.array([line[3] for line in lines], dtype=np.float64)
+    line_revenue = line_quantity * np.array([line[4] for line in lines], dtype=np.float64)
+    columns = _columns(product_ids)
+    _add(revenue, columns, line_revenue)
+    _add(quantity, columns, line_quantity)
+
+    sketch.revenue_counters = revenue.tobytes()
+    sketch.quantity_counters = quantity.tobytes()
+    sketch.revenue = (sketch.revenue or 0.0) + float(line_revenue.sum())
+    sketch.quantity = (sketch.quantity or 0) + int(line_quantity.sum())
+    sketch.candidates = json.dumps(
+        _top_candidates(revenue, set(json.loads(sketch.candidates)) | set(product_ids))
+    )
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """Resample the order lines and recompute the sketches from the daily rollup."""
+    sample = models.SalesSample.__table__
+    state = models.SampleState.__table__
+    db.execute(delete(sample))
+    db.execute(delete(state))
+    db.execute(delete(models.ProductSketch.__table__))
+
+    population = db.query(func.count(models.OrderItem.id)).scalar()
+    rows = db.execute(
+        select(
+            models.OrderItem.order_date,
+            models.OrderItem.product_id,
+            models.Product.category,
+            models.OrderItem.quantity,
+            models.OrderItem.unit_price,
+        )
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        .order_by(func.random())
+        .limit(SAMPLE_SIZE)
+    ).all()
+    if rows:
+        db.execute(
+            insert(sample),
+            [
+                {
+                    "slot": slot,
+                    "order_date": row.order_date,
+                    "product_id": row.product_id,
+                    "category": row.category,
+                    "quantity": row.quantity,
+                    "unit_price": row.unit_price,
+                }
+                for slot, row in enumerate(rows)
+            ],
+        )
+    db.execute(insert(state).values(id=1, lines_seen=population))
+
+    months: Dict[date, Dict[int, list]] = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    rollup_table = models.DailySalesRollup
+    for day, product_id, revenue, quantity in db.execute(
+        select(rollup_table.day, rollup_table.product_id, rollup_table.revenue, rollup_table.quantity)
+    ):
+        totals = months[_month(day)][product_id]
+        totals[0] += revenue
+        totals[1] += quantity
+    for month, products in months.items():
+        product_ids = sorted(products)
+        revenue_values = np.array([products[product_id][0] for product_id in product_ids])
+        quantity_values = np.array([products[product_id][1] for product_id in product_ids], dtype=np.float64)
+        revenue, quantity = _counters(None), _counters(None)
+        columns = _columns(product_ids)
+        _add(revenue, columns, revenue_values)
+        _add(quantity, columns, quantity_values)
+        db.add(
+            models.ProductSketch(
+                month=month,
+                revenue=float(revenue_values.sum()),
+                quantity=int(quantity_values.sum()),
+                revenue_counters=revenue.tobytes(),
+                quantity_counters=quantity.tobytes(),
+                candidates=json.dumps(_top_candidates(revenue, product_ids)),
+            )
+        )
+    db.flush()
+    return {"sample_rows": len(rows), "sketch_months": len(months)}
+
+
+def _interval(total: float, total_squares: float, sample_size: int, population: int) -> Tuple[float, float]:
+    """Expand a sampled sum to the population, with its 95% confidence half-width."""
+    if sample_size == 0 or population == 0:
+        return 0.0, 0.0
+    mean = total / sample_size
+    variance = (total_squares - sample_size * mean * mean) / (sample_size - 1) if sample_size > 1 else 0.0
+    finite_population = max(1.0 - sample_size / population, 0.0)
+    half_width = Z_95 * population * math.sqrt(max(variance, 0.0) * finite_population / sample_size)
+    return total * population / sample_size, half_width
+
+
+def sample_estimates(
+    db: Session,
+    key,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    exclude: Optional[Tuple[Optional[datetime], Optional[datetime]]] = None,
+) -> Dict[object, Estimate]:
+    """Estimate revenue and quantity per ``key``, an expression over ``sales_sample``.
+
+    Lines dated in the half-open ``exclude`` range (``None`` is unbounded) are skipped.
+    """
+    sample = models.SalesSample
+    population = db.query(models.SampleState.lines_seen).filter(models.SampleState.id == 1).scalar() or 0
+    held = db.query(func.count(sample.slot)).scalar()
+    revenue = sample.quantity * sample.unit_price
+    query = db.query(
+        key.label("key"),
+        func.sum(revenue).label("revenue"),
+        func.sum(revenue * revenue).label("revenue_squares"),
+        func.sum(sample.quantity).label("quantity"),
+        func.sum(sample.quantity * sample.quantity).label("quantity_squares"),
+    )
+    if start_date:
+        query = query.filter(sample.order_date >= start_date)
+    if end_date:
+        query = query.filter(sample.order_date <= end_date)
+    if exclude is not None:
+        lower, upper = exclude
+        inside = [sample.order_date >= lower] if lower else []
+        inside += [sample.order_date < upper] if upper else []
+        query = query.filter(not_(and_(*inside)))
+
+    estimates = {}
+    for row in query.group_by(key).all():
+        revenue_total, revenue_error = _interval(
+            float(row.revenue), float(row.revenue_squares), held, population
+        )
+        quantity_total, quantity_error = _interval(
+            float(row.quantity), float(row.quantity_squares), held, population
+        )
+        estimates[row.key] = Estimate(revenue_total, revenue_error, quantity_total, quantity_error)
+    return estimates
+
+
+def _whole_months(
+    start_date: Optional[datetime], end_date: Optional[datetime]
+) -> Tuple[Optional[date], Optional[date]]:
+    """Half-open ``[first, last)`` month bounds of the whole months inside the range."""
+    first = last = None
+    if start_date:
+        first = _month(start_date)
+        if start_date != datetime.combine(first, time.min):
+            first = _month(first + timedelta(days=32))
+    if end_date:
+        last = _month(end_date + timedelta(microseconds=1))
+    return first, last
+
+
+def product_estimates(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime]
+) -> Dict[int, Estimate]:
+    """Revenue and quantity of the heavy-hitter products over a date range.
+
+    Whole months inside the range come from the merged monthly sketches. A
+    Count-Min estimate only overestimates, by at most e / SKETCH_WIDTH of the
+    months' total with probability 1 - exp(-SKETCH_DEPTH). Partial months at
+    the edges come from the sample.
+    """
+    first, last = _whole_months(start_date, end_date)
+    revenue, quantity = _counters(None), _counters(None)
+    revenue_total = quantity_total = 0.0
+    candidates = set()
+    if first is None or last is None or first < last:
+        sketches = db.query(models.ProductSketch)
+        if first:
+            sketches = sketches.filter(models.ProductSketch.month >= first)
+        if last:
+            sketches = sketches.filter(models.ProductSketch.month < last)
+        for sketch in sketches:
+            revenue += _counters(sketch.revenue_counters)
+            quantity += _counters(sketch.quantity_counters)
+            revenue_total += sketch.revenue
+            quantity_total += sketch.quantity
+            candidates.update(json.loads(sketch.candidates))
+        covered = (
+            datetime.combine(first, time.min) if first else None,
+            datetime.combine(last, time.min) if last else None,
+        )
+    else:
+        covered = None
+
+    edges = {}
+    if covered != (None, None):
+        edges = sample_estimates(db, models.SalesSample.product_id, start_date, end_date, covered)
+    candidates.update(edges)
+
+    product_ids = sorted(candidates)
+    if not product_ids:
+        return {}
+    epsilon = math.e / SKETCH_WIDTH
+    no_sample = Estimate(0.0, 0.0, 0.0, 0.0)
+    estimates = {}
+    for product_id, sketched_revenue, sketched_quantity in zip(
+        product_ids, _point_estimates(revenue, product_ids), _point_estimates(quantity, product_ids)
+    ):
+        sampled = edges.get(product_id, no_sample)
+        estimates[product_id] = Estimate(
+            float(sketched_revenue) + sampled.revenue,
+            epsilon * revenue_total + sampled.revenue_error,
+            float(sketched_quantity) + sampled.quantity,
+            epsilon * quantity_total + sampled.quantity_error,
+        )
+    return estimates
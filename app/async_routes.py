@@ -0,0 +1,250 @@
+"""
+Async handlers for the CRUD and analytics routes.
+
+Installed by ``app.main`` when ``DATABASE_ASYNC`` is enabled; each handler
+replaces the sync route with the same path and method, so requests are served
+on the event loop instead of the threadpool.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import analytics, crud, http_cache, olap, schemas
+from .database import get_async_db, get_async_read_db
+
+router = APIRouter()
+
+
+def _page_size(limit: int) -> int:
+    return min(max(limit, 1), crud.MAX_PAGE_SIZE)
+
+
+def _send_page(page: crud.Page, response: Response) -> list:
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+@router.post("/products", response_model=schemas.ProductRead, status_code=201)
+async def add_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud.create_product_async(db, product)
+
+
+@router.get(
+    "/products",
+    response_model=List[schemas.ProductRead],
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def list_products(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    try:
+        page = await crud.get_products_async(db, _page_size(limit), cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
+
+
+@router.post("/customers", response_model=schemas.CustomerRead, status_code=201)
+async def add_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud.create_customer_async(db, customer)
+
+
+@router.get(
+    "/customers",
+    response_model=List[schemas.CustomerRead],
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def list_customers(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    try:
+        page = await crud.get_customers_async(db, _page_size(limit), cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
+
+
+@router.post("/orders", response_model=schemas.OrderRead, status_code=201)
+async def add_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await crud.create_order_async(db, order)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.post("/orders/bulk", response_model=schemas.BulkOrderResponse)
+async def add_orders_bulk(orders: List[schemas.OrderCreate], db: AsyncSession = Depends(get_async_db)):
+    if len(orders) > crud.MAX_BULK_ORDERS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {crud.MAX_BULK_ORDERS} orders can be submitted at once."
+        )
+    return await crud.create_orders_bulk_async(db, orders)
+
+
+@router.get(
+    "/orders",
+    response_model=List[schemas.OrderRead],
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def list_orders(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    try:
+        page = await crud.get_orders_async(
+            db, _page_size(limit), cursor, customer_id, status, start_date, end_date
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
+
+
+@router.get(
+    "/analytics/sales-over-time",
+    response_model=List[schemas.SalesPoint],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_sales_over_time(
+    interval: str = "monthly",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await analytics.sales_over_time_async(db, interval, start_date, end_date, engine, accuracy)
+
+
+@router.get(
+    "/analytics/sales-trends",
+    response_model=List[schemas.SalesTrendPoint],
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_sales_trends(
+    interval: str = "daily",
+    windows: str = "7,30,90",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    clean_windows = analytics.parse_windows(windows)
+    return await analytics.sales_trends_async(db, interval, clean_windows, start_date, end_date, engine)
+
+
+@router.get(
+    "/analytics/top-products",
+    response_model=List[schemas.TopProduct],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_top_products(
+    limit: int = 5,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    clean_limit = min(max(limit, 1), 50)
+    return await analytics.top_products_async(db, clean_limit, start_date, end_date, engine, accuracy)
+
+
+@router.get(
+    "/analytics/category-summary",
+    response_model=List[schemas.CategorySummary],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_category_summary(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await analytics.category_summary_async(db, start_date, end_date, engine, accuracy)
+
+
+@router.get(
+    "/analytics/dashboard",
+    response_model=schemas.Dashboard,
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_dashboard(
+    interval: str = "monthly",
+    limit: int = 5,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    clean_limit = min(max(limit, 1), 50)
+    return await analytics.dashboard_async(db, interval, clean_limit, start_date, end_date, engine)
+
+
+@router.get(
+    "/analytics/customers/rfm",
+    response_model=schemas.RFMReport,
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_customer_rfm(
+    limit: int = 20,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    clean_limit = min(max(limit, 1), 500)
+    return await analytics.customer_rfm_async(db, clean_limit, as_of)
+
+
+@router.get(
+    "/analytics/cohorts",
+    response_model=List[schemas.Cohort],
+    dependencies=[Depends(http_cache.conditional_get_async)],
+)
+async def read_cohorts(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    periods: int = 12,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    clean_periods = min(max(periods, 1), 60)
+    return await analytics.cohorts_async(db, start_date, end_date, clean_periods)
+
+
+@router.post("/analytics/query", response_model=schemas.CubeResult)
+async def run_cube_query(query: schemas.CubeQuery, db: AsyncSession = Depends(get_async_read_db)):
+    return await olap.run_async(db, olap.spec_from(query))
+
+
+def install(app: FastAPI) -> None:
+    """Swap the app's sync routes for the async handlers defined here."""
+    replaced = {(route.path, method) for route in router.routes for method in route.methods}
+    app.router.routes = [
+        route
+        for route in app.router.routes
+        if not (
+            isinstance(route, APIRoute)
+            and any((route.path, method) in replaced for method in route.methods)
+        )
+    ]
+    app.include_router(router)
@@ -0,0 +1,179 @@
+"""
+Result cache for the analytics functions.
+
+Entries are keyed on the function name, its arguments and a data version.
+``bump_version`` is called after every committed write, so cached results never
+outlive the data they were computed from.
+
+The in-process backend keeps its version per process; run the Redis backend
+(``ANALYTICS_CACHE=redis``) when several workers serve the API.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+CACHE_BACKEND = os.getenv("ANALYTICS_CACHE", "memory").lower()
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+CACHE_REDIS_URL = os.getenv("ANALYTICS_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Thread-safe LRU with a per-entry time to live."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self) -> int:
+        return self._version
+
+    def bump_version(self) -> None:
+        with self._lock:
+            self._version += 1
+            # Entries of older versions can never be read again.
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Backend for a local Redis-compatible server, shared by all workers."""
+
+    name = "redis"
+    prefix = "analytics-cache:"
+
+    def __init__(self, url: str, ttl: float):
+        if redis is None:
+            raise RuntimeError("The redis package is required for ANALYTICS_CACHE=redis.")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, key: tuple) -> str:
+        return self.prefix + repr(key)
+
+    def get(self, key: tuple) -> Any:
+        payload = self.client.get(self._key(key))
+        return _MISSING if payload is None else pickle.loads(payload)
+
+    def set(self, key: tuple, value: Any) -> None:
+        self.client.set(self._key(key), pickle.dumps(value), px=int(self.ttl * 1000))
+
+    def version(self) -> int:
+        return int(self.client.get(self.prefix + "version") or 0)
+
+    def bump_version(self) -> None:
+        self.client.incr(self.prefix + "version")
+
+    def size(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "(*"))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+def _build_backend():
+    if CACHE_BACKEND in ("none", "off", "0"):
+        return None
+    if CACHE_BACKEND == "redis":
+        return RedisBackend(CACHE_REDIS_URL, CACHE_TTL_SECONDS)
+    return MemoryBackend(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+
+backend = _build_backend()
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(outcome: str) -> None:
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def cached(name: str) -> Callable:
+    """Cache a function taking a session first; the remaining arguments form the key."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(db, *args, **kwargs):
+            if backend is None:
+                return func(db, *args, **kwargs)
+            key = (name, backend.version(), args, tuple(sorted(kwargs.items())))
+            value = backend.get(key)
+            if value is not _MISSING:
+                _count("hits")
+                return value
+            _count("misses")
+            value = func(db, *args, **kwargs)
+            backend.set(key, value)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def bump_version() -> None:
+    if backend is not None:
+        backend.bump_version()
+
+
+def clear() -> None:
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+    if backend is not None:
+        backend.clear()
+
+
+def stats() -> dict:
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    return {
+        "backend": backend.name if backend is not None else "none",
+        "hits": hits,
+        "misses": misses,
+        "entries": backend.size() if backend is not None else 0,
+        "version": backend.version() if backend is not None else 0,
+    }
@@ -0,0 +1,317 @@
+"""
+Parquet replica of the order lines for the ``columnar`` analytics engine.
+
+Each database gets a directory under ``ANALYTICS_COLUMNAR_DIR`` holding the
+order lines (line id, order id, order date, product id, quantity, unit price)
+as Parquet parts, plus ``state.json`` naming the parts and the highest order
+id they cover. Products are not copied: names and categories are looked up
+at query time, as the pandas engine does.
+
+``read_lines`` first brings the replica up to date. Orders are only ever
+inserted together with their lines, so a refresh appends the lines of orders
+above the watermark as one new part; finding them is an index lookup of
+``max(id)``. The replica is rebuilt from scratch instead when orders were
+removed, which archiving, detaching partitions and reseeding record by changing
+the ``order_generation`` token, or when the order count of the last appended id
+range changed because a lower id committed late. Parts are compacted into one
+once there are more than ``ANALYTICS_COLUMNAR_MAX_PARTS``.
+
+Every part is sorted by order date and line id, the order of the SQL export.
+``iter_sorted_lines`` merges the parts batch by batch in that order, so an
+export holds about one batch per part in memory, and compaction reuses it.
+
+Replaced parts are deleted at the following compaction or rebuild, so a
+reader that listed them just before can still open them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import String, func, select, type_coerce
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import database_url_of
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+COLUMNAR_DIR = os.getenv("ANALYTICS_COLUMNAR_DIR", "./analytics_columnar")
+COLUMNAR_MAX_PARTS = int(os.getenv("ANALYTICS_COLUMNAR_MAX_PARTS", "16"))
+REFRESH_BATCH_ROWS = 100_000
+
+SCHEMA = pa.schema(
+    [
+        ("line_id", pa.int64()),
+        ("order_id", pa.int64()),
+        ("order_date", pa.timestamp("us")),
+        ("product_id", pa.int32()),
+        ("quantity", pa.int32()),
+        ("unit_price", pa.float64()),
+    ]
+)
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def replica_dir(db: Session) -> Path:
+    key = hashlib.sha1(database_url_of(db).encode()).hexdigest()[:16]
+    return Path(COLUMNAR_DIR) / key
+
+
+@contextmanager
+def _locked(directory: Path):
+    """Serialize refreshes of one replica across threads and, where possible, processes."""
+    with _locks_guard:
+        lock = _locks.setdefault(str(directory), threading.Lock())
+    with lock:
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / ".lock", "w") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+
+def _load_state(directory: Path) -> dict:
+    try:
+        return json.loads((directory / "state.json").read_text())
+    except FileNotFoundError:
+        return {"watermark": 0, "parts": [], "retired": [], "next_part": 1}
+
+
+def _save_state(directory: Path, state: dict) -> None:
+    temporary = directory / "state.json.tmp"
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, directory / "state.json")
+
+
+def _delete(directory: Path, names: List[str]) -> None:
+    for name in names:
+        (directory / name).unlink(missing_ok=True)
+
+
+def _line_batches(db: Session, after: int, through: int):
+    order_date = models.Order.order_date
+    if db.get_bind().dialect.name == "sqlite":
+        # As in analytics._fetch_sales_rows: numpy parses the ISO text in bulk.
+        order_date = type_coerce(order_date, String)
+    statement = (
+        select(
+            models.OrderItem.id,
+            models.OrderItem.order_id,
+            order_date,
+            models.OrderItem.product_id,
+            models.OrderItem.quantity,
+            models.OrderItem.unit_price,
+        )
+        .select_from(models.Order)
+        .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+        .where(models.Order.id > after, models.Order.id <= through)
+        .order_by(models.Order.order_date, models.OrderItem.id)
+    )
+    result = db.connection().execute(
+        statement, execution_options={"stream_results": True, "yield_per": REFRESH_BATCH_ROWS}
+    )
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        dates = columns[2]
+        if isinstance(dates[0], str):
+            dates = np.array(dates, dtype="datetime64[us]")
+        else:
+            dates = np.array([value.replace(tzinfo=None) for value in dates], dtype="datetime64[us]")
+        yield pa.record_batch(
+            [
+                pa.array(columns[0], pa.int64()),
+                pa.array(columns[1], pa.int64()),
+                pa.array(dates, pa.timestamp("us")),
+                pa.array(columns[3], pa.int32()),
+                pa.array(columns[4], pa.int32()),
+                pa.array(columns[5], pa.float64()),
+            ],
+            schema=SCHEMA,
+        )
+
+
+def _write_part(directory: Path, state: dict, batches) -> Optional[str]:
+    name = f"part-{state['next_part']:06d}.parquet"
+    temporary = directory / (name + ".tmp")
+    rows = 0
+    with pq.ParquetWriter(temporary, SCHEMA) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    if not rows:
+        temporary.unlink()
+        return None
+    os.replace(temporary, directory / name)
+    state["next_part"] += 1
+    return name
+
+
+def _replace_parts(directory: Path, state: dict, batches) -> None:
+    """Write ``batches`` as the only part, retiring the current ones."""
+    _delete(directory, state["retired"])
+    retired = state["parts"]
+    name = _write_part(directory, state, batches)
+    state["parts"] = [name] if name else []
+    state["retired"] = retired
+
+
+def _order_count(db: Session, after: int, through: int) -> int:
+    return db.execute(
+        select(func.count(models.Order.id)).where(models.Order.id > after, models.Order.id <= through)
+    ).scalar()
+
+
+def _rebatched(tables, rows: int):
+    """Record batches of about ``rows`` rows, so compacted parts get full row groups."""
+    pending, size = [], 0
+    for table in tables:
+        pending.append(table)
+        size += table.num_rows
+        if size >= rows:
+            yield from pa.concat_tables(pending).combine_chunks().to_batches(max_chunksize=rows)
+            pending, size = [], 0
+    if pending:
+        yield from pa.concat_tables(pending).combine_chunks().to_batches(max_chunksize=rows)
+
+
+def refresh(db: Session) -> dict:
+    """Bring the replica of ``db`` up to date and return its state."""
+    directory = replica_dir(db)
+    with _locked(directory):
+        state = _load_state(directory)
+        watermark = state["watermark"]
+        generation = db.execute(select(models.OrderGeneration.token)).scalar()
+        max_id = db.execute(select(func.max(models.Order.id))).scalar() or 0
+        recent_after = state.get("recent_after", watermark)
+        rebuild = (
+            generation != state.get("generation")
+            or max_id < watermark
+            or _order_count(db, recent_after, watermark) != state.get("recent_orders", 0)
+        )
+        if rebuild:
+            _replace_parts(directory, state, _line_batches(db, 0, max_id))
+            recent_after = max_id
+        elif max_id > watermark:
+            name = _write_part(directory, state, _line_batches(db, watermark, max_id))
+            if name:
+                state["parts"].append(name)
+            if len(state["parts"]) > COLUMNAR_MAX_PARTS:
+                merged = _merge_parts(directory, state["parts"], SCHEMA.names, None)
+                _replace_parts(directory, state, _rebatched(merged, REFRESH_BATCH_ROWS))
+            recent_after = watermark
+        else:
+            return state
+        state.update(
+            watermark=max_id,
+            generation=generation,
+            recent_after=recent_after,
+            recent_orders=_order_count(db, recent_after, max_id),
+        )
+        _save_state(directory, state)
+        return state
+
+
+def _date_condition(start_date: Optional[datetime], end_date: Optional[datetime]):
+    condition = None
+    if start_date:
+        condition = ds.field("order_date") >= pa.scalar(start_date.replace(tzinfo=None), pa.timestamp("us"))
+    if end_date:
+        upper = ds.field("order_date") <= pa.scalar(end_date.replace(tzinfo=None), pa.timestamp("us"))
+        condition = upper if condition is None else condition & upper
+    return condition
+
+
+def _part_tables(path: Path, columns: List[str], condition) -> Iterator[pa.Table]:
+    # A scanner per part keeps the part's row order.
+    scanner = ds.dataset(str(path), schema=SCHEMA).scanner(
+        columns=columns, filter=condition, batch_size=REFRESH_BATCH_ROWS, use_threads=False
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield pa.Table.from_batches([batch])
+
+
+def _merge_parts(directory: Path, parts: List[str], columns: List[str], condition) -> Iterator[pa.Table]:
+    """Tables of the parts' lines in order date and line id order.
+
+    Each step takes the smallest last key among the parts' current batches and
+    emits every buffered row up to it, sorted; that part's buffer empties, so
+    at most one batch per part is held.
+    """
+    names = list(dict.fromkeys(["order_date", "line_id", *columns]))
+    readers = [_part_tables(directory / part, names, condition) for part in parts]
+    buffers = [next(reader, None) for reader in readers]
+    while any(buffer is not None for buffer in buffers):
+        live = [index for index, buffer in enumerate(buffers) if buffer is not None]
+        date, line = min(
+            (buffers[index]["order_date"][-1].value, buffers[index]["line_id"][-1].as_py()) for index in live
+        )
+        date = pa.scalar(date, pa.timestamp("us"))
+        heads = []
+        for index in live:
+            buffer = buffers[index]
+            dates, lines = buffer["order_date"], buffer["line_id"]
+            upto = pc.or_(pc.less(dates, date), pc.and_(pc.equal(dates, date), pc.less_equal(lines, line)))
+            # Parts are sorted, so the rows up to the key are a prefix.
+            count = pc.sum(upto).as_py() or 0
+            if count:
+                heads.append(buffer.slice(0, count))
+            rest = buffer.slice(count)
+            buffers[index] = rest if rest.num_rows else next(readers[index], None)
+        merged = pa.concat_tables(heads).sort_by([("order_date", "ascending"), ("line_id", "ascending")])
+        yield merged.select(columns)
+
+
+def iter_sorted_lines(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    columns: List[str],
+) -> Iterator[pa.Table]:
+    """Like ``read_lines``, but streamed as tables in order date and line id order."""
+    state = refresh(db)
+    yield from _merge_parts(replica_dir(db), state["parts"], columns, _date_condition(start_date, end_date))
+
+
+def count_lines(db: Session, start_date: Optional[datetime], end_date: Optional[datetime]) -> int:
+    state = refresh(db)
+    if not state["parts"]:
+        return 0
+    directory = replica_dir(db)
+    dataset = ds.dataset([str(directory / part) for part in state["parts"]], schema=SCHEMA)
+    return dataset.count_rows(filter=_date_condition(start_date, end_date))
+
+
+def read_lines(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    columns: List[str],
+) -> pa.Table:
+    """The order lines dated within the bounds, from the refreshed replica.
+
+    Bounds are applied to the order date like the SQL filters; Parquet row
+    group statistics let the scan skip parts outside them.
+    """
+    state = refresh(db)
+    if not state["parts"]:
+        return SCHEMA.empty_table().select(columns)
+    directory = replica_dir(db)
+    dataset = ds.dataset([str(directory / part) for part in state["parts"]], schema=SCHEMA)
+    return dataset.to_table(columns=columns, filter=_date_condition(start_date, end_date))
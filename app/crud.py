@@ -1,21 +1,72 @@
+import base64
+import json
 from datetime import datetime
-from typing import List
+from typing import List, NamedTuple, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
-from . import models, schemas
+from . import approx, cache, customer_summary, live, models, rollup, schemas
+
+MAX_BULK_ORDERS = 10000
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(*values) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor.")
+    return values
+
+
+def _page(rows: list, limit: int, key) -> Page:
+    """Trim the extra look-ahead row and build the cursor for the next page."""
+    if len(rows) <= limit:
+        return Page(rows, None)
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(*key(rows[-1])))
+
+
+def _after_id(query, column, cursor: Optional[str]):
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise ValueError("Invalid cursor.")
+        query = query.filter(column > values[0])
+    return query
 
 
 def create_product(db: Session, product: schemas.ProductCreate) -> models.Product:
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
     db.commit()
+    cache.bump_version()
     db.refresh(db_product)
     return db_product
 
 
-def get_products(db: Session) -> List[models.Product]:
-    return db.query(models.Product).order_by(models.Product.id).all()
+def get_products(
+    db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> Page:
+    query = _after_id(db.query(models.Product), models.Product.id, cursor)
+    rows = query.order_by(models.Product.id).limit(limit + 1).all()
+    return _page(rows, limit, lambda product: (product.id,))
 
 
 def create_customer(db: Session, customer: schemas.CustomerCreate) -> models.Customer:
@@ -26,8 +77,12 @@ def create_customer(db: Session, customer: schemas.CustomerCreate) -> models.Cus
     return db_customer
 
 
-def get_customers(db: Session) -> List[models.Customer]:
-    return db.query(models.Customer).order_by(models.Customer.id).all()
+def get_customers(
+    db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> Page:
+    query = _after_id(db.query(models.Customer), models.Customer.id, cursor)
+    rows = query.order_by(models.Customer.id).limit(limit + 1).all()
+    return _page(rows, limit, lambda customer: (customer.id,))
 
 
 def create_order(db: Session, order_data: schemas.OrderCreate) -> models.Order:
@@ -39,6 +94,7 @@ def create_order(db: Session, order_data: schemas.OrderCreate) -> models.Order:
     db.add(db_order)
     db.flush()
 
+    lines, live_lines = [], []
     for item in order_data.items:
         product = db.get(models.Product, item.product_id)
         if not product:
@@ -49,14 +105,192 @@ def create_order(db: Session, order_data: schemas.OrderCreate) -> models.Order:
             product_id=item.product_id,
             quantity=item.quantity,
             unit_price=unit_price,
+            order_date=db_order.order_date,
         )
         db.add(db_item)
+        lines.append((db_item, product.category))
+        live_lines.append((product.id, product.name, product.category, item.quantity, unit_price))
 
+    rollup.record_order_items(db, db_order, lines)
+    customer_summary.record_order(
+        db, db_order, sum(item.quantity * item.unit_price for item, _ in lines)
+    )
+    approx.record_lines(
+        db,
+        [
+            (db_order.order_date, item.product_id, category, item.quantity, item.unit_price)
+            for item, category in lines
+        ],
+    )
     db.commit()
+    cache.bump_version()
+    live.publish_order(db_order.id, db_order.order_date, live_lines)
     db.refresh(db_order)
     return db_order
 
 
-def get_orders(db: Session) -> List[models.Order]:
-    return db.query(models.Order).order_by(models.Order.order_date.desc()).all()
+def get_orders(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> Page:
+    """Return orders newest first, paginated on ``(order_date, id)``."""
+    query = db.query(models.Order).options(selectinload(models.Order.items))
+    if customer_id is not None:
+        query = query.filter(models.Order.customer_id == customer_id)
+    if status is not None:
+        query = query.filter(models.Order.status == status)
+    if start_date:
+        query = query.filter(models.Order.order_date >= start_date)
+    if end_date:
+        query = query.filter(models.Order.order_date <= end_date)
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            order_date, order_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (IndexError, TypeError, ValueError) as exc:
+            raise ValueError("Invalid cursor.") from exc
+        query = query.filter(
+            tuple_(models.Order.order_date, models.Order.id) < tuple_(order_date, order_id)
+        )
+
+    rows = (
+        query.order_by(models.Order.order_date.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    return _page(rows, limit, lambda order: (order.order_date, order.id))
+
+
+def create_orders_bulk(db: Session, orders: List[schemas.OrderCreate]) -> dict:
+    """Insert many orders in one transaction.
+
+    Products and customers are resolved with one IN query each; orders that
+    reference unknown rows are reported per index and skipped instead of
+    failing the whole batch.
+    """
+    product_ids = {item.product_id for order in orders for item in order.items}
+    products = {
+        row.id: row
+        for row in db.query(models.Product.id, models.Product.name, models.Product.price, models.Product.category)
+        .filter(models.Product.id.in_(product_ids))
+        .all()
+    }
+    customer_ids = {order.customer_id for order in orders}
+    known_customers = {
+        row.id for row in db.query(models.Customer.id).filter(models.Customer.id.in_(customer_ids)).all()
+    }
+
+    results = [{"index": index, "order_id": None, "error": None} for index in range(len(orders))]
+    accepted = []
+    for index, order_data in enumerate(orders):
+        missing = sorted({item.product_id for item in order_data.items} - products.keys())
+        if missing:
+            results[index]["error"] = f"Product {missing[0]} not found."
+        elif order_data.customer_id not in known_customers:
+            results[index]["error"] = f"Customer {order_data.customer_id} not found."
+        else:
+            accepted.append(index)
+
+    if accepted:
+        now = datetime.utcnow()
+        order_rows = [
+            {
+                "customer_id": orders[index].customer_id,
+                "order_date": orders[index].order_date or now,
+                "status": orders[index].status or "created",
+            }
+            for index in accepted
+        ]
+        order_ids = db.scalars(
+            insert(models.Order).returning(models.Order.id, sort_by_parameter_order=True),
+            order_rows,
+        ).all()
+
+        item_rows, sampled_lines, live_orders = [], [], []
+        totals = rollup.new_totals()
+        customer_totals = customer_summary.new_totals()
+        for index, order_id, order_row in zip(accepted, order_ids, order_rows):
+            results[index]["order_id"] = order_id
+            order_revenue = 0.0
+            live_lines = []
+            for item in orders[index].items:
+                product = products[item.product_id]
+                unit_price = item.unit_price if item.unit_price is not None else product.price
+                item_rows.append(
+                    {
+                        "order_id": order_id,
+                        "product_id": item.product_id,
+                        "quantity": item.quantity,
+                        "unit_price": unit_price,
+                        "order_date": order_row["order_date"],
+                    }
+                )
+                rollup.add_line(
+                    totals, order_row["order_date"], item.product_id, product.category, item.quantity, unit_price
+                )
+                sampled_lines.append(
+                    (order_row["order_date"], item.product_id, product.category, item.quantity, unit_price)
+                )
+                live_lines.append((item.product_id, product.name, product.category, item.quantity, unit_price))
+                order_revenue += item.quantity * unit_price
+            live_orders.append((order_id, order_row["order_date"], live_lines))
+            customer_summary.add_order(
+                customer_totals, order_row["customer_id"], order_row["order_date"], order_revenue
+            )
+        db.execute(insert(models.OrderItem), item_rows)
+        rollup.apply_totals(db, totals)
+        customer_summary.apply_totals(db, customer_totals)
+        approx.record_lines(db, sampled_lines)
+        db.commit()
+        cache.bump_version()
+        for order_id, order_date, live_lines in live_orders:
+            live.publish_order(order_id, order_date, live_lines)
+
+    return {"created": len(accepted), "failed": len(orders) - len(accepted), "results": results}
+
+
+# Async variants run the sync functions above on an AsyncSession's greenlet and
+# serialize the results there, so no lazy load happens outside of it.
+
+
+def _as_read(schema, result):
+    if isinstance(result, Page):
+        return Page([schema.model_validate(item) for item in result.items], result.next_cursor)
+    return schema.model_validate(result)
+
+
+async def _run_async(db: AsyncSession, schema, func, *args):
+    return await db.run_sync(lambda session: _as_read(schema, func(session, *args)))
+
+
+async def create_product_async(db: AsyncSession, product: schemas.ProductCreate) -> schemas.ProductRead:
+    return await _run_async(db, schemas.ProductRead, create_product, product)
+
+
+async def get_products_async(db: AsyncSession, *args) -> Page:
+    return await _run_async(db, schemas.ProductRead, get_products, *args)
+
+
+async def create_customer_async(db: AsyncSession, customer: schemas.CustomerCreate) -> schemas.CustomerRead:
+    return await _run_async(db, schemas.CustomerRead, create_customer, customer)
+
+
+async def get_customers_async(db: AsyncSession, *args) -> Page:
+    return await _run_async(db, schemas.CustomerRead, get_customers, *args)
+
+
+async def create_order_async(db: AsyncSession, order_data: schemas.OrderCreate) -> schemas.OrderRead:
+    return await _run_async(db, schemas.OrderRead, create_order, order_data)
+
+
+async def get_orders_async(db: AsyncSession, *args) -> Page:
+    return await _run_async(db, schemas.OrderRead, get_orders, *args)
+
 
+async def create_orders_bulk_async(db: AsyncSession, orders: List[schemas.OrderCreate]) -> dict:
+    return await db.run_sync(create_orders_bulk, orders)
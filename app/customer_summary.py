@@ -0,0 +1,203 @@
+"""
+Maintenance of the ``customer_summaries`` and ``customer_months`` tables.
+
+Order writes fold each order into its customer's lifetime totals and into the
+totals of the order's calendar month, inside the caller's transaction. RFM
+scores read the first table and retention cohorts join the two, so neither has
+to scan the order tables. ``rebuild`` recomputes both from the live and
+archived orders.
+"""
+
+from typing import Dict, Tuple
+
+from sqlalchemy import Date, case, cast, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+_UPSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+def _month_expression(dialect: str, column):
+    if dialect == "sqlite":
+        return func.date(column, "start of month")
+    return cast(func.date_trunc("month", column), Date)
+
+
+def new_totals() -> Dict[str, dict]:
+    return {"customers": {}, "months": {}}
+
+
+def add_order(totals: Dict[str, dict], customer_id: int, order_date, revenue: float) -> None:
+    customer = totals["customers"].get(customer_id)
+    if customer is None:
+        totals["customers"][customer_id] = [order_date, order_date, 1, revenue]
+    else:
+        customer[0] = min(customer[0], order_date)
+        customer[1] = max(customer[1], order_date)
+        customer[2] += 1
+        customer[3] += revenue
+    month = totals["months"].setdefault((customer_id, order_date.date().replace(day=1)), [0, 0.0])
+    month[0] += 1
+    month[1] += revenue
+
+
+def record_order(db: Session, order: models.Order, revenue: float) -> None:
+    """Add ``order`` and its revenue to the customer tables without committing."""
+    totals = new_totals()
+    add_order(totals, order.customer_id, order.order_date, revenue)
+    apply_totals(db, totals)
+
+
+def _summary_rows(totals: Dict[str, dict]) -> list:
+    return [
+        {
+            "customer_id": customer_id,
+            "first_order_date": first,
+            "last_order_date": last,
+            "order_count": order_count,
+            "revenue": revenue,
+        }
+        for customer_id, (first, last, order_count, revenue) in totals["customers"].items()
+    ]
+
+
+def _month_rows(totals: Dict[str, dict]) -> list:
+    return [
+        {"customer_id": customer_id, "month": month, "order_count": order_count, "revenue": revenue}
+        for (customer_id, month), (order_count, revenue) in totals["months"].items()
+    ]
+
+
+def apply_totals(db: Session, totals: Dict[str, dict]) -> None:
+    if not totals["customers"]:
+        return
+    summaries = models.CustomerSummary.__table__
+    months = models.CustomerMonth.__table__
+    upsert = _UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(summaries)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["customer_id"],
+                set_={
+                    "first_order_date": case(
+                        (
+                            statement.excluded.first_order_date < summaries.c.first_order_date,
+                            statement.excluded.first_order_date,
+                        ),
+                        else_=summaries.c.first_order_date,
+                    ),
+                    "last_order_date": case(
+                        (
+                            statement.excluded.last_order_date > summaries.c.last_order_date,
+                            statement.excluded.last_order_date,
+                        ),
+                        else_=summaries.c.last_order_date,
+                    ),
+                    "order_count": summaries.c.order_count + statement.excluded.order_count,
+                    "revenue": summaries.c.revenue + statement.excluded.revenue,
+                },
+            ),
+            _summary_rows(totals),
+        )
+        statement = upsert(months)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["customer_id", "month"],
+                set_={
+                    "order_count": months.c.order_count + statement.excluded.order_count,
+                    "revenue": months.c.revenue + statement.excluded.revenue,
+                },
+            ),
+            _month_rows(totals),
+        )
+        return
+
+    for row in _summary_rows(totals):
+        result = db.execute(
+            update(summaries)
+            .where(summaries.c.customer_id == row["customer_id"])
+            .values(
+                first_order_date=case(
+                    (summaries.c.first_order_date > row["first_order_date"], row["first_order_date"]),
+                    else_=summaries.c.first_order_date,
+                ),
+                last_order_date=case(
+                    (summaries.c.last_order_date < row["last_order_date"], row["last_order_date"]),
+                    else_=summaries.c.last_order_date,
+                ),
+                order_count=summaries.c.order_count + row["order_count"],
+                revenue=summaries.c.revenue + row["revenue"],
+            )
+        )
+        if result.rowcount == 0:
+            db.execute(insert(summaries).values(**row))
+    for row in _month_rows(totals):
+        key = (months.c.customer_id == row["customer_id"]) & (months.c.month == row["month"])
+        result = db.execute(
+            update(months)
+            .where(key)
+            .values(
+                order_count=months.c.order_count + row["order_count"],
+                revenue=months.c.revenue + row["revenue"],
+            )
+        )
+        if result.rowcount == 0:
+            db.execute(insert(months).values(**row))
+
+
+def _order_revenue(order_model, item_model):
+    return (
+        select(
+            order_model.customer_id,
+            order_model.order_date,
+            func.coalesce(func.sum(item_model.quantity * item_model.unit_price), literal(0.0)).label("revenue"),
+        )
+        .select_from(order_model)
+        .outerjoin(item_model, item_model.order_id == order_model.id)
+        .group_by(order_model.id, order_model.customer_id, order_model.order_date)
+    )
+
+
+def rebuild(db: Session) -> Tuple[int, int]:
+    """Recompute both tables and return their row counts.
+
+    Orders in detached PostgreSQL partitions are no longer counted.
+    """
+    orders = union_all(
+        _order_revenue(models.Order, models.OrderItem),
+        _order_revenue(models.ArchivedOrder, models.ArchivedOrderItem),
+    ).subquery()
+    month = _month_expression(db.get_bind().dialect.name, orders.c.order_date).label("month")
+    summaries = models.CustomerSummary.__table__
+    months = models.CustomerMonth.__table__
+
+    db.execute(delete(summaries))
+    db.execute(delete(months))
+    db.execute(
+        insert(summaries).from_select(
+            ["customer_id", "first_order_date", "last_order_date", "order_count", "revenue"],
+            select(
+                orders.c.customer_id,
+                func.min(orders.c.order_date),
+                func.max(orders.c.order_date),
+                func.count(),
+                func.sum(orders.c.revenue),
+            ).group_by(orders.c.customer_id),
+        )
+    )
+    db.execute(
+        insert(months).from_select(
+            ["customer_id", "month", "order_count", "revenue"],
+            select(orders.c.customer_id, month, func.count(), func.sum(orders.c.revenue)).group_by(
+                orders.c.customer_id, month
+            ),
+        )
+    )
+    return (
+        db.query(func.count()).select_from(summaries).scalar(),
+        db.query(func.count()).select_from(months).scalar(),
+    )
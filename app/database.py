@@ -1,9 +1,14 @@
 import os
+import threading
+import time
 from contextlib import contextmanager
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,25 +18,360 @@ def _build_connection_string() -> str:
     return os.getenv("DATABASE_URL", "sqlite:///./sales.db")
 
 
-DATABASE_URL = _build_connection_string()
+def _connect_args(url: str) -> dict:
+    # If sslmode is in a PostgreSQL URL (including Supabase), psycopg2 handles it automatically
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
 
-# Configure connection arguments based on database type
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
-else:
-    # For PostgreSQL (including Supabase), configure SSL if needed
-    connect_args = {}
-    # If sslmode is in the URL, psycopg2 will handle it automatically
+
+def _driver_url(url: str) -> str:
     # For Supabase, ensure we're using psycopg2 driver
-    if "postgresql://" in DATABASE_URL and "+psycopg2" not in DATABASE_URL:
+    if "postgresql://" in url and "+psycopg2" not in url:
         # Replace postgresql:// with postgresql+psycopg2:// for explicit driver
-        DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
+        return url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    return url
+
+
+DATABASE_URL = _driver_url(_build_connection_string())
+# Configure connection arguments based on database type
+connect_args = _connect_args(DATABASE_URL)
+
+# Optional read replicas (comma-separated URLs) for the analytics and GET list
+# routes; see ReadReplicas below.
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URL", "").split(",") if url.strip()]
+READ_STRATEGY = os.getenv("DATABASE_READ_STRATEGY", "round-robin").lower()
+READ_HEALTH_INTERVAL = float(os.getenv("DATABASE_READ_HEALTH_INTERVAL", "30"))
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# Pool sizing; see docs/USE_POOLER_CONNECTION.md before raising these against Supabase.
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+    "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", "1"),
+}
+
+# Range-partition orders and order_items by month on PostgreSQL (see app/partitioning.py).
+# Other backends ignore it and use the archive tables instead.
+ORDER_PARTITIONING = os.getenv("ORDER_PARTITIONING", "none").lower()
+MONTHLY_PARTITIONS = ORDER_PARTITIONING == "monthly" and DATABASE_URL.startswith("postgresql")
+
+# Applied to every new SQLite connection; set a variable to an empty string to skip it.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+}
+
+
+class _CheckoutTimingMixin:
+    """Records how long callers wait for a connection and how full the pool gets."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "peak_checked_out": 0,
+        }
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.wait_stats["timeouts"] += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            stats = self.wait_stats
+            stats["checkouts"] += 1
+            stats["total_wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            stats["peak_checked_out"] = max(stats["peak_checked_out"], self.checkedout())
+        return connection
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
 
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.split("://", 1)[1] in ("", "/"))
+
+
+def engine_options(url: str, asynchronous: bool = False) -> dict:
+    """Pool keyword arguments for ``create_engine``/``create_async_engine``."""
+    if _is_memory_sqlite(url):
+        return {}
+    pool_class = InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool
+    return {"poolclass": pool_class, **POOL_SETTINGS}
+
+
+def apply_sqlite_pragmas(target_engine) -> None:
+    if target_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if value:
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def pool_stats(target_engine) -> dict:
+    pool = target_engine.pool
+    stats = {"pool": type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return stats
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    stats.update(
+        size=pool.size(),
+        capacity=capacity,
+        checked_out=checked_out,
+        idle=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        saturation=round(checked_out / capacity, 3) if capacity else 0.0,
+    )
+    wait_stats = getattr(pool, "wait_stats", None)
+    if wait_stats is not None:
+        with pool._stats_lock:
+            stats.update(wait_stats)
+        checkouts = stats["checkouts"]
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / checkouts if checkouts else 0.0
+    return stats
+
+
+def _create_sync_engine(url: str):
+    url_engine = create_engine(url, echo=False, future=True, connect_args=_connect_args(url), **engine_options(url))
+    apply_sqlite_pragmas(url_engine)
+    return url_engine
+
+
+engine = _create_sync_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# Serve the API routes from an AsyncEngine (aiosqlite / asyncpg). The sync engine
+# above is still used for table creation and the streaming export.
+ASYNC_DATABASE = os.getenv("DATABASE_ASYNC", "0").lower() in ("1", "true", "yes")
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync SQLAlchemy URL to its async driver equivalent."""
+    if url.startswith("sqlite"):
+        scheme, rest = url.split("://", 1)
+        return "sqlite+aiosqlite://" + rest
+    for prefix in ("postgresql+psycopg2://", "postgresql://"):
+        if url.startswith(prefix):
+            # asyncpg spells libpq's sslmode parameter as ssl.
+            return "postgresql+asyncpg://" + url[len(prefix):].replace("sslmode=", "ssl=")
+    return url
+
+
+# Sync URL behind each async engine, for work handed from the event loop to a thread.
+_sync_urls = {}
+
+
+def create_async_session_factory(url: str):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_url = async_database_url(url)
+    async_engine = create_async_engine(
+        async_url, echo=False, **engine_options(async_url, asynchronous=True)
+    )
+    apply_sqlite_pragmas(async_engine.sync_engine)
+    _sync_urls[async_engine.sync_engine] = url
+    return async_engine, async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
+if ASYNC_DATABASE:
+    async_engine, AsyncSessionLocal = create_async_session_factory(DATABASE_URL)
+else:
+    async_engine, AsyncSessionLocal = None, None
+
 Base = declarative_base()
 
+_url_sessions = {}
+
+
+def database_url_of(db) -> str:
+    """The full URL of the database behind a session, for handing to worker processes."""
+    return db.get_bind().url.render_as_string(hide_password=False)
+
+
+def session_for(url: str):
+    """A new session on ``url``; the engine is created once per process and URL."""
+    factory = _url_sessions.get(url)
+    if factory is None:
+        factory = _url_sessions[url] = sessionmaker(bind=_create_sync_engine(url), autoflush=False, future=True)
+    return factory()
+
+
+def sync_session_of(db) -> Session:
+    """A new sync session on the database behind an ``AsyncSession``, for use off the event loop."""
+    return session_for(_sync_urls[db.get_bind()])
+
+
+class Replica:
+    """One read replica: its engines, session factories and last health check."""
+
+    def __init__(self, url: str, asynchronous: bool = False):
+        self.url = _driver_url(url)
+        self.engine = _create_sync_engine(self.url)
+        self.sessions = sessionmaker(bind=self.engine, autoflush=False, autocommit=False, future=True)
+        if asynchronous:
+            self.async_engine, self.async_sessions = create_async_session_factory(self.url)
+        else:
+            self.async_engine, self.async_sessions = None, None
+        self.healthy = True
+        self.error = None
+        self.checked_at = None
+
+    def load(self) -> int:
+        """Connections currently checked out of this replica's pools."""
+        pools = [self.engine.pool] + ([self.async_engine.sync_engine.pool] if self.async_engine else [])
+        return sum(pool.checkedout() for pool in pools if isinstance(pool, QueuePool))
+
+    def ping(self) -> None:
+        database = self.engine.url.database
+        if self.engine.dialect.name == "sqlite" and database not in (None, "", ":memory:"):
+            # Connecting would create an empty file rather than fail.
+            if not os.path.exists(database):
+                raise FileNotFoundError(f"{database} does not exist")
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1 FROM orders LIMIT 1"))
+
+
+class ReadReplicas:
+    """Routes read-only sessions to healthy replicas, or to the primary without any.
+
+    ``strategy`` is "round-robin" or "least-loaded" (fewest checked-out
+    connections). A replica is pinged when it is chosen and its last check is
+    older than ``health_interval`` seconds; one that fails, or whose session
+    raised a connection error, is skipped until it passes a later check.
+    """
+
+    def __init__(
+        self,
+        urls,
+        strategy: str = "round-robin",
+        health_interval: float = 30.0,
+        primary=None,
+        async_primary=None,
+        asynchronous: bool = False,
+    ):
+        if strategy not in ("round-robin", "least-loaded"):
+            raise ValueError("DATABASE_READ_STRATEGY must be round-robin or least-loaded.")
+        self.replicas = [Replica(url, asynchronous) for url in urls]
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.primary = primary or SessionLocal
+        self.async_primary = async_primary
+        self.fallbacks = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, replica: Replica) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            due = replica.checked_at is None or now - replica.checked_at >= self.health_interval
+            if due:
+                # Claim the check so concurrent requests don't all ping at once.
+                replica.checked_at = now
+        if due:
+            try:
+                replica.ping()
+            except Exception as exc:
+                self.mark_down(replica, exc)
+            else:
+                replica.healthy, replica.error = True, None
+        return replica.healthy
+
+    def choose(self):
+        """A healthy replica, or None to read from the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replicas), 1)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        if self.strategy == "least-loaded":
+            ordered.sort(key=Replica.load)
+        for replica in ordered:
+            if self._is_healthy(replica):
+                return replica
+        if self.replicas:
+            with self._lock:
+                self.fallbacks += 1
+        return None
+
+    def mark_down(self, replica: Replica, error: Exception) -> None:
+        replica.healthy, replica.error = False, f"{type(error).__name__}: {error}"
+
+    def get_db(self):
+        replica = self.choose()
+        db = replica.sessions() if replica else self.primary()
+        try:
+            yield db
+        except (OperationalError, InterfaceError) as exc:
+            if replica is not None:
+                self.mark_down(replica, exc)
+            raise
+        finally:
+            db.close()
+
+    async def get_async_db(self):
+        replica = self.choose()
+        factory = replica.async_sessions if replica else self.async_primary
+        async with factory() as session:
+            try:
+                yield session
+            except (OperationalError, InterfaceError) as exc:
+                if replica is not None:
+                    self.mark_down(replica, exc)
+                raise
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "fallbacks_to_primary": self.fallbacks,
+            "replicas": [
+                {
+                    "url": replica.engine.url.render_as_string(hide_password=True),
+                    "healthy": replica.healthy,
+                    "error": replica.error,
+                    "load": replica.load(),
+                    **pool_stats(replica.engine),
+                }
+                for replica in self.replicas
+            ],
+        }
+
+
+read_replicas = ReadReplicas(
+    DATABASE_READ_URLS,
+    READ_STRATEGY,
+    READ_HEALTH_INTERVAL,
+    async_primary=AsyncSessionLocal,
+    asynchronous=ASYNC_DATABASE,
+)
+
 
 def get_db():
     db = SessionLocal()
@@ -41,6 +381,11 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """Session for read-only routes: a read replica when one is configured and healthy."""
+    yield from read_replicas.get_db()
+
+
 @contextmanager
 def db_session():
     session = SessionLocal()
@@ -53,3 +398,12 @@ def db_session():
     finally:
         session.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def get_async_read_db():
+    async for session in read_replicas.get_async_db():
+        yield session
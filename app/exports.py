@@ -0,0 +1,171 @@
+"""
+Encoders for the sales export endpoint.
+
+CSV comes from ``analytics.iter_sales_csv``; Parquet and Arrow IPC are built by
+turning each fetched batch into an Arrow record batch and draining the writer's
+output after every batch, so only one batch is held in memory at a time.
+"""
+
+import os
+import zlib
+from datetime import datetime
+from io import RawIOBase
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from . import analytics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+# Columnar formats want much larger batches than CSV: each batch becomes one
+# Parquet row group / Arrow record batch.
+ARROW_BATCH_ROWS = int(os.getenv("ARROW_BATCH_ROWS", "65536"))
+
+COMPRESSIONS = {
+    "csv": ("none", "gzip"),
+    "parquet": ("snappy", "none", "zstd", "gzip", "brotli", "lz4"),
+    "arrow": ("none", "zstd", "lz4"),
+}
+
+
+class ExportStream(NamedTuple):
+    chunks: Iterator
+    media_type: str
+    filename: str
+
+
+class _DrainableSink(RawIOBase):
+    """Write-only file object whose buffered bytes can be taken out between writes.
+
+    ``tell`` reports the total bytes written so Parquet column offsets stay valid
+    after draining.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _export_schema():
+    return pa.schema(
+        [
+            ("order_date", pa.timestamp("us")),
+            ("product_id", pa.int64()),
+            ("product_name", pa.string()),
+            ("category", pa.string()),
+            ("quantity", pa.int64()),
+            ("unit_price", pa.float64()),
+            ("revenue", pa.float64()),
+        ]
+    )
+
+
+def _record_batch(rows, schema):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def _iter_columnar(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    fmt: str,
+    compression: str,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> Iterator[bytes]:
+    schema = _export_schema()
+    sink = _DrainableSink()
+    writer = None
+    codec = None if compression == "none" else compression
+    try:
+        for rows in analytics.iter_sales_batches(
+            db, start_date, end_date, ARROW_BATCH_ROWS, on_batch
+        ):
+            if writer is None:
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(sink, schema, compression=codec or "none")
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=codec)
+                    writer = pa.ipc.new_stream(sink, schema, options=options)
+            writer.write_batch(_record_batch(rows, schema))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        yield sink.drain()
+
+
+def _gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = None
+    for chunk in chunks:
+        if compressor is None:
+            compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def check_format(fmt: str, compression: Optional[str]) -> str:
+    """Validate an export format and return its compression, defaulted if unset."""
+    if fmt not in COMPRESSIONS:
+        raise HTTPException(status_code=400, detail="Format must be csv, parquet, or arrow.")
+    compression = compression or COMPRESSIONS[fmt][0]
+    if compression not in COMPRESSIONS[fmt]:
+        allowed = ", ".join(COMPRESSIONS[fmt])
+        raise HTTPException(status_code=400, detail=f"Compression for {fmt} must be one of: {allowed}.")
+    return compression
+
+
+def sales_export(
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    fmt: str = "csv",
+    compression: Optional[str] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> ExportStream:
+    """Encoded export chunks; ``on_batch`` is called with the size of each fetched batch."""
+    compression = check_format(fmt, compression)
+
+    if fmt == "csv":
+        chunks = analytics.iter_sales_csv(db, start_date, end_date, on_batch)
+        if compression == "gzip":
+            return ExportStream(_gzip_chunks(chunks), "application/gzip", "sales_export.csv.gz")
+        return ExportStream(chunks, "text/csv", "sales_export.csv")
+
+    if pa is None:
+        raise HTTPException(status_code=501, detail=f"pyarrow is required for {fmt} exports.")
+    chunks = _iter_columnar(db, start_date, end_date, fmt, compression, on_batch)
+    if fmt == "parquet":
+        return ExportStream(chunks, "application/vnd.apache.parquet", "sales_export.parquet")
+    return ExportStream(chunks, "application/vnd.apache.arrow.stream", "sales_export.arrows")
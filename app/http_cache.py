@@ -0,0 +1,106 @@
+"""
+Conditional GET support for the analytics and list routes.
+
+``conditional_get`` runs as a route dependency, before the endpoint body. It
+reads a cheap data version (the highest ids of the order, product, customer
+and archived order tables, one indexed lookup each) and derives the ETag from
+it plus the path and query string. A matching ``If-None-Match`` (or a
+sufficiently recent ``If-Modified-Since``) is answered with 304 before any
+analytics query runs.
+
+Every API write inserts rows, so it moves one of the maxima. ``Last-Modified``
+is the time this process first saw the current version, which is never earlier
+than the change itself. Like any HTTP date it has one-second resolution, so
+clients that can should revalidate with the ETag.
+
+``Cache-Control: public, max-age=HTTP_CACHE_MAX_AGE`` lets a reverse proxy
+answer repeated polls for that many seconds and then revalidate.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import analytics, models
+from .database import get_async_read_db, get_read_db
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "5"))
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, must-revalidate"
+
+_first_seen: "OrderedDict[tuple, int]" = OrderedDict()
+_first_seen_lock = threading.Lock()
+
+
+def data_version(db: Session) -> tuple:
+    maxima = [
+        select(func.max(model.id)).scalar_subquery()
+        for model in (models.Order, models.Product, models.Customer, models.ArchivedOrder)
+    ]
+    return tuple(db.execute(select(*maxima)).one())
+
+
+def _last_modified(version: tuple) -> int:
+    """The second, rounded up, at which this process first saw ``version``."""
+    with _first_seen_lock:
+        seen = _first_seen.get(version)
+        if seen is None:
+            seen = _first_seen[version] = math.ceil(time.time())
+            # A few versions are kept so replicas that lag each other don't reset it.
+            while len(_first_seen) > 64:
+                _first_seen.popitem(last=False)
+        return seen
+
+
+def _etag(version: tuple, request: Request) -> str:
+    query = sorted(request.query_params.multi_items())
+    key = repr((version, request.url.path, query, analytics.ANALYTICS_ENGINE))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+
+def _not_modified(request: Request, etag: str, modified: int) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison (RFC 9110 13.1.2): ignore the W/ prefix on either side.
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return modified <= since
+
+
+def _apply(request: Request, response: Response, version: tuple) -> None:
+    etag = _etag(version, request)
+    modified = _last_modified(version)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, modified):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+
+def conditional_get(request: Request, response: Response, db: Session = Depends(get_read_db)) -> None:
+    _apply(request, response, data_version(db))
+
+
+async def conditional_get_async(
+    request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)
+) -> None:
+    _apply(request, response, await db.run_sync(data_version))
+
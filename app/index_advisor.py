@@ -0,0 +1,143 @@
+"""
+Index advisor for the analytics and list queries.
+
+Runs each query the API issues over a narrow date window, captures the SQL that
+was sent, and EXPLAINs it on the current backend. Any sequential scan of a fact
+table is reported, so a dropped or unusable index shows up before it reaches
+production data sizes.
+"""
+
+from datetime import datetime, time, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, func, inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from . import analytics, crud, models
+from .database import Base
+
+# Tables expected to grow without bound; scanning the small dimension tables is fine.
+FACT_TABLES = ("orders", "order_items", "daily_sales_rollup")
+WINDOW_DAYS = 7
+
+
+def _workload(
+    start: datetime, end: datetime
+) -> List[Tuple[str, Callable[[Session], object]]]:
+    day_start = datetime.combine(start.date(), time.min)
+    day_end = datetime.combine(end.date(), time.max)
+    # Undecorated functions so the result cache cannot hide the queries.
+    sales_over_time = analytics.sales_over_time.__wrapped__
+    top_products = analytics.top_products.__wrapped__
+    category_summary = analytics.category_summary.__wrapped__
+    return [
+        ("sales_over_time", lambda db: sales_over_time(db, "daily", start, end, "sql")),
+        ("sales_over_time_rollup", lambda db: sales_over_time(db, "daily", day_start, day_end, "sql")),
+        ("top_products", lambda db: top_products(db, 5, start, end, "sql")),
+        ("top_products_rollup", lambda db: top_products(db, 5, day_start, day_end, "sql")),
+        ("category_summary", lambda db: category_summary(db, start, end, "sql")),
+        ("category_summary_rollup", lambda db: category_summary(db, day_start, day_end, "sql")),
+        ("sales_export", lambda db: next(analytics.iter_sales_batches(db, start, end, 1), None)),
+        ("orders_page", lambda db: crud.get_orders(db, 100, None, None, None, start, end)),
+        ("orders_by_customer", lambda db: crud.get_orders(db, 100, None, 1)),
+        ("orders_by_status", lambda db: crud.get_orders(db, 100, None, None, "completed")),
+    ]
+
+
+def capture_statements(db: Session, call: Callable[[Session], object]) -> List[Tuple[str, object]]:
+    """Run ``call`` and return the ``(statement, parameters)`` pairs it executed."""
+    bind = db.get_bind()
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(bind, "before_cursor_execute", _record)
+    try:
+        call(db)
+    finally:
+        event.remove(bind, "before_cursor_execute", _record)
+    return statements
+
+
+def _walk_postgres_plan(node: dict, lines: List[str], scans: List[str]) -> None:
+    relation = node.get("Relation Name")
+    label = node["Node Type"] + (f" on {relation}" if relation else "")
+    if node.get("Index Name"):
+        label += f" using {node['Index Name']}"
+    lines.append(label)
+    if node["Node Type"] == "Seq Scan" and relation in FACT_TABLES:
+        scans.append(relation)
+    for child in node.get("Plans", []):
+        _walk_postgres_plan(child, lines, scans)
+
+
+def explain(connection: Connection, statement: str, parameters) -> Tuple[List[str], List[str]]:
+    """Return the plan lines and the fact tables that are scanned sequentially."""
+    lines: List[str] = []
+    scans: List[str] = []
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+            detail = row[3]
+            lines.append(detail)
+            words = detail.split()
+            if words[0] == "SCAN" and words[1] in FACT_TABLES:
+                scans.append(words[1])
+    elif dialect == "postgresql":
+        with connection.begin():
+            # With seq scans priced out, any that remain have no usable index.
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            ).scalar()
+        _walk_postgres_plan(plan[0]["Plan"], lines, scans)
+    else:
+        raise ValueError(f"EXPLAIN is not supported for the {dialect} dialect.")
+    return lines, scans
+
+
+def run(db: Session, reference: Optional[datetime] = None) -> List[dict]:
+    """EXPLAIN every workload query over the ``WINDOW_DAYS`` before ``reference``.
+
+    ``reference`` defaults to the latest order date.
+    """
+    if reference is None:
+        reference = db.query(func.max(models.Order.order_date)).scalar() or datetime.utcnow()
+    # A mid-day start keeps the raw-table queries off the day-aligned rollup path.
+    start = reference - timedelta(days=WINDOW_DAYS) + timedelta(hours=12)
+    # Explain on a fresh connection: sqlite3 caches prepared EXPLAIN statements per
+    # connection and would replay plans from before an index was added or dropped.
+    explain_engine = create_engine(db.get_bind().url, poolclass=NullPool)
+
+    report = []
+    try:
+        with explain_engine.connect() as connection:
+            for name, call in _workload(start, reference):
+                for statement, parameters in capture_statements(db, call):
+                    lines, scans = explain(connection, statement, parameters)
+                    report.append(
+                        {"query": name, "statement": statement, "plan": lines, "sequential_scans": scans}
+                    )
+    finally:
+        explain_engine.dispose()
+    db.rollback()
+    return report
+
+
+def create_missing_indexes(bind: Engine) -> List[str]:
+    """Create model indexes absent from existing tables and return their names."""
+    created = []
+    with bind.begin() as connection:
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created.append(index.name)
+    return created
@@ -0,0 +1,419 @@
+"""
+Background jobs for sales exports and heavy reports.
+
+``submit`` records a job in a SQLite queue under ``ANALYTICS_JOBS_DIR`` and hands
+it to a process pool, so pandas and encoding work never competes with the API
+for the GIL. Workers write the result to the job's directory next to the queue
+and report progress back through the queue table, which is all the state jobs
+need: no broker or shared cache is involved.
+
+At most ``ANALYTICS_JOB_WORKERS`` jobs run at once and ``ANALYTICS_JOB_MAX_PENDING``
+may be queued or running; results and their queue rows are removed
+``ANALYTICS_JOB_TTL`` seconds after the job finishes.
+
+If a worker process dies, the pool is replaced: the job it was running fails,
+and jobs still waiting are submitted again once. Each job records the API
+process that queued it, and jobs left unfinished by a process that no longer
+exists are failed the first time another process on the host uses the queue.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    and_,
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import analytics, cache, exports
+from .database import apply_sqlite_pragmas, session_for
+
+JOBS_DIR = os.getenv("ANALYTICS_JOBS_DIR", "./analytics_jobs")
+JOB_WORKERS = int(os.getenv("ANALYTICS_JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("ANALYTICS_JOB_MAX_PENDING", "16"))
+JOB_TTL_SECONDS = float(os.getenv("ANALYTICS_JOB_TTL", str(24 * 3600)))
+
+REPORTS = ("sales-over-time", "top-products", "category-summary", "dashboard")
+KINDS = ("export",) + REPORTS
+UNFINISHED = ("queued", "running")
+
+_metadata = MetaData()
+job_table = Table(
+    "analytics_jobs",
+    _metadata,
+    Column("id", String(32), primary_key=True),
+    Column("kind", String(32), nullable=False),
+    Column("params", Text, nullable=False),
+    Column("status", String(16), nullable=False, index=True),
+    Column("progress", Float, nullable=False, default=0.0),
+    Column("rows_processed", Integer, nullable=False, default=0),
+    Column("total_rows", Integer),
+    Column("error", Text),
+    Column("filename", String(255)),
+    Column("media_type", String(100)),
+    Column("created_at", DateTime, nullable=False),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("expires_at", DateTime),
+    # "host:pid" of the API process that queued the job.
+    Column("owner", String(255)),
+)
+
+_queues: Dict[str, Engine] = {}
+_recovered = set()
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _queue(jobs_dir: str) -> Engine:
+    """Engine for the queue database in ``jobs_dir``, created on first use."""
+    engine = _queues.get(jobs_dir)
+    if engine is None:
+        Path(jobs_dir).mkdir(parents=True, exist_ok=True)
+        engine = create_engine(
+            f"sqlite:///{Path(jobs_dir) / 'jobs.db'}", connect_args={"check_same_thread": False}
+        )
+        apply_sqlite_pragmas(engine)
+        _metadata.create_all(engine)
+        if "owner" not in {column["name"] for column in inspect(engine).get_columns("analytics_jobs")}:
+            with engine.begin() as connection:
+                connection.execute(text("ALTER TABLE analytics_jobs ADD COLUMN owner VARCHAR(255)"))
+        _queues[jobs_dir] = engine
+    return engine
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers do not inherit the API's threads or open connections.
+            _executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _discard(executor: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next submission starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    # Shut down outside the lock: the pool's done callbacks may need it.
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _init_worker() -> None:
+    # A worker's in-process cache never sees the API's bump_version calls.
+    if isinstance(cache.backend, cache.MemoryBackend):
+        cache.backend = None
+
+
+def _result_dir(jobs_dir: str, job_id: str) -> Path:
+    return Path(jobs_dir) / job_id
+
+
+def _check_params(kind: str, params: dict) -> dict:
+    if kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"Job kind must be one of: {', '.join(KINDS)}.")
+    if kind == "export":
+        params["compression"] = exports.check_format(params["format"], params.get("compression"))
+    elif params["interval"] not in analytics.INTERVALS:
+        raise HTTPException(status_code=400, detail="Interval must be daily, weekly, or monthly.")
+    if params.get("engine") and params["engine"].lower() not in analytics.ENGINES:
+        raise HTTPException(status_code=400, detail="Engine must be sql, pandas, parallel, or columnar.")
+    params["limit"] = min(max(params["limit"], 1), 50)
+    return params
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname():
+        # Another host's jobs are left to it, or to the TTL.
+        return bool(owner)
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _fail(jobs_dir: str, job_id: str, error: str) -> None:
+    """Mark a job failed unless it already finished."""
+    finished = datetime.utcnow()
+    with _queue(jobs_dir).begin() as connection:
+        connection.execute(
+            update(job_table)
+            .where(job_table.c.id == job_id, job_table.c.status.in_(UNFINISHED))
+            .values(
+                status="failed",
+                error=error,
+                finished_at=finished,
+                expires_at=finished + timedelta(seconds=JOB_TTL_SECONDS),
+            )
+        )
+
+
+def recover_orphans(jobs_dir: Optional[str] = None) -> int:
+    """Fail unfinished jobs whose API process has exited, and return how many."""
+    jobs_dir = jobs_dir or JOBS_DIR
+    with _queue(jobs_dir).connect() as connection:
+        unfinished = connection.execute(
+            select(job_table.c.id, job_table.c.owner).where(job_table.c.status.in_(UNFINISHED))
+        ).all()
+    orphans = [job_id for job_id, owner in unfinished if not _owner_alive(owner)]
+    for job_id in orphans:
+        _fail(jobs_dir, job_id, "The API process running this job exited.")
+    return len(orphans)
+
+
+def _dispatch(job_id: str, jobs_dir: str, database_url: str, retries: int = 1) -> bool:
+    """Hand a queued job to the pool, replacing the pool if it is broken."""
+    for _ in range(2):
+        executor = _pool()
+        try:
+            future = executor.submit(run, job_id, jobs_dir, database_url)
+        except BrokenProcessPool:
+            _discard(executor)
+            continue
+        future.add_done_callback(
+            lambda future: _finished(future, executor, job_id, jobs_dir, database_url, retries)
+        )
+        return True
+    return False
+
+
+def _finished(
+    future: Future, executor: ProcessPoolExecutor, job_id: str, jobs_dir: str, database_url: str, retries: int
+) -> None:
+    # ``run`` records its own errors, so an exception here means the worker process died.
+    if future.cancelled() or future.exception() is None:
+        return
+    if isinstance(future.exception(), BrokenProcessPool):
+        _discard(executor)
+    job = _status(jobs_dir, job_id)
+    if job == "queued" and retries and _dispatch(job_id, jobs_dir, database_url, retries - 1):
+        return
+    _fail(jobs_dir, job_id, "The worker process running this job exited unexpectedly.")
+
+
+def _status(jobs_dir: str, job_id: str) -> Optional[str]:
+    with _queue(jobs_dir).connect() as connection:
+        return connection.execute(select(job_table.c.status).where(job_table.c.id == job_id)).scalar()
+
+
+def purge_expired(jobs_dir: Optional[str] = None) -> int:
+    """Delete jobs past their expiry, and their results.
+
+    Jobs that never finished, e.g. because the API restarted under them, expire
+    ``JOB_TTL_SECONDS`` after they were submitted.
+    """
+    jobs_dir = jobs_dir or JOBS_DIR
+    if jobs_dir not in _recovered:
+        _recovered.add(jobs_dir)
+        recover_orphans(jobs_dir)
+    now = datetime.utcnow()
+    with _queue(jobs_dir).begin() as connection:
+        expired = connection.execute(
+            select(job_table.c.id).where(
+                or_(
+                    job_table.c.expires_at < now,
+                    and_(
+                        job_table.c.status.in_(UNFINISHED),
+                        job_table.c.created_at < now - timedelta(seconds=JOB_TTL_SECONDS),
+                    ),
+                )
+            )
+        ).scalars().all()
+        if expired:
+            connection.execute(delete(job_table).where(job_table.c.id.in_(expired)))
+    for job_id in expired:
+        shutil.rmtree(_result_dir(jobs_dir, job_id), ignore_errors=True)
+    return len(expired)
+
+
+def submit(kind: str, params: dict, database_url: str) -> dict:
+    """Queue a job and return its status row.
+
+    ``database_url`` is the database the worker reads, normally the one behind the
+    request's session.
+    """
+    params = _check_params(kind, dict(params))
+    purge_expired()
+    job_id = uuid.uuid4().hex
+    with _queue(JOBS_DIR).begin() as connection:
+        pending = connection.execute(
+            select(func.count()).select_from(job_table).where(job_table.c.status.in_(UNFINISHED))
+        ).scalar_one()
+        if pending >= JOB_MAX_PENDING:
+            raise HTTPException(
+                status_code=429, detail="Too many analytics jobs are pending; try again later."
+            )
+        connection.execute(
+            insert(job_table).values(
+                id=job_id,
+                kind=kind,
+                params=json.dumps(jsonable_encoder(params)),
+                status="queued",
+                progress=0.0,
+                rows_processed=0,
+                created_at=datetime.utcnow(),
+                owner=_owner(),
+            )
+        )
+    if not _dispatch(job_id, JOBS_DIR, database_url):
+        _fail(JOBS_DIR, job_id, "No worker process could be started.")
+    return get(job_id)
+
+
+def get(job_id: str) -> Optional[dict]:
+    purge_expired()
+    with _queue(JOBS_DIR).connect() as connection:
+        row = connection.execute(select(job_table).where(job_table.c.id == job_id)).mappings().first()
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def result_path(job: dict) -> Optional[Path]:
+    if job["status"] != "succeeded" or not job["filename"]:
+        return None
+    path = _result_dir(JOBS_DIR, job["id"]) / job["filename"]
+    return path if path.exists() else None
+
+
+# Everything below runs in the worker processes.
+
+
+def _update(queue: Engine, job_id: str, **values) -> None:
+    with queue.begin() as connection:
+        connection.execute(update(job_table).where(job_table.c.id == job_id).values(**values))
+
+
+def _run_export(queue: Engine, job_id: str, db: Session, params: dict, directory: Path) -> str:
+    start, end = params["start_date"], params["end_date"]
+    total = analytics.export_row_count(db, start, end)
+    _update(queue, job_id, total_rows=total)
+    done = 0
+
+    def report(rows: int) -> None:
+        nonlocal done
+        done += rows
+        _update(queue, job_id, rows_processed=done, progress=min(done / total, 1.0) if total else 1.0)
+
+    export = exports.sales_export(db, start, end, params["format"], params["compression"], report)
+    partial = directory / (export.filename + ".part")
+    with open(partial, "wb") as handle:
+        for chunk in export.chunks:
+            handle.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    partial.rename(directory / export.filename)
+    _update(queue, job_id, media_type=export.media_type)
+    return export.filename
+
+
+def _run_report(
+    queue: Engine, job_id: str, db: Session, kind: str, params: dict, directory: Path
+) -> str:
+    start, end, engine = params["start_date"], params["end_date"], params["engine"]
+    if kind == "sales-over-time":
+        result = analytics.sales_over_time(db, params["interval"], start, end, engine)
+    elif kind == "top-products":
+        result = analytics.top_products(db, params["limit"], start, end, engine)
+    elif kind == "category-summary":
+        result = analytics.category_summary(db, start, end, engine)
+    else:
+        result = analytics.dashboard(db, params["interval"], params["limit"], start, end, engine)
+    filename = f"{kind}.json"
+    (directory / filename).write_text(json.dumps(jsonable_encoder(result)))
+    _update(queue, job_id, media_type="application/json", progress=1.0)
+    return filename
+
+
+def run(job_id: str, jobs_dir: str, database_url: str) -> None:
+    """Claim a queued job, run it and record the outcome."""
+    queue = _queue(jobs_dir)
+    with queue.begin() as connection:
+        claimed = connection.execute(
+            update(job_table)
+            .where(job_table.c.id == job_id, job_table.c.status == "queued")
+            .values(status="running", started_at=datetime.utcnow())
+        ).rowcount
+        job = connection.execute(
+            select(job_table.c.kind, job_table.c.params).where(job_table.c.id == job_id)
+        ).first()
+    if not claimed:
+        return
+    kind, params = job.kind, json.loads(job.params)
+    for name in ("start_date", "end_date"):
+        params[name] = datetime.fromisoformat(params[name]) if params.get(name) else None
+    directory = _result_dir(jobs_dir, job_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    db = session_for(database_url)
+    try:
+        if kind == "export":
+            filename = _run_export(queue, job_id, db, params, directory)
+        else:
+            filename = _run_report(queue, job_id, db, kind, params, directory)
+        outcome = {"status": "succeeded", "filename": filename}
+    except Exception as exc:
+        detail = exc.detail if isinstance(exc, HTTPException) else f"{type(exc).__name__}: {exc}"
+        outcome = {"status": "failed", "error": str(detail)}
+        shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        db.close()
+    finished = datetime.utcnow()
+    _update(
+        queue,
+        job_id,
+        finished_at=finished,
+        expires_at=finished + timedelta(seconds=JOB_TTL_SECONDS),
+        **outcome,
+    )
+
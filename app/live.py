@@ -0,0 +1,272 @@
+"""
+Live analytics pushed to dashboards over Server-Sent Events or a WebSocket.
+
+``crud`` publishes every committed order to this module. Publishing folds the
+order into in-memory aggregates for the current (UTC) day: revenue, order
+count, quantity and revenue per product. The aggregates are seeded from the
+database by the first subscriber of the day. Orders dated on other days,
+and orders at or below the highest id the seed already counted, are skipped.
+
+A single broadcaster task checks for changes every ``LIVE_PUSH_INTERVAL``
+seconds. It serializes the snapshot once and hands the same payload to every
+subscriber, so the cost of an update does not grow with the number of
+watchers. A subscriber's queue holds one payload; a slow client skips to the
+newest snapshot instead of falling behind.
+
+The aggregates only see orders written through this process. Every
+``LIVE_RESYNC_SECONDS`` they are re-seeded from the database, which picks up
+writes made by other workers or scripts.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import database_url_of, session_for
+
+LIVE_PUSH_INTERVAL = float(os.getenv("LIVE_PUSH_INTERVAL", "1"))
+LIVE_RESYNC_SECONDS = float(os.getenv("LIVE_RESYNC_SECONDS", "60"))
+LIVE_TOP_PRODUCTS = int(os.getenv("LIVE_TOP_PRODUCTS", "10"))
+# SSE comment sent when nothing changed for this long, so proxies keep the connection open.
+KEEPALIVE_SECONDS = 15.0
+
+# (product_id, product_name, category, quantity, unit_price)
+Line = Tuple[int, str, str, int, float]
+
+
+class DayAggregates:
+    """Today's totals, updated from order events under a lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.day = None
+        self.loaded = False
+        self.seeded_through = 0
+        self.database_url: Optional[str] = None
+        self.seeded_at = 0.0
+        self.sequence = 0
+        self._reset(None)
+
+    def _reset(self, day) -> None:
+        self.day = day
+        self.revenue = 0.0
+        self.orders = 0
+        self.quantity = 0
+        self.products: Dict[int, list] = {}
+
+    def _add(self, product_id: int, name: str, category: str, quantity: int, revenue: float) -> None:
+        entry = self.products.setdefault(product_id, [name, category, 0.0, 0])
+        entry[2] += revenue
+        entry[3] += quantity
+        self.revenue += revenue
+        self.quantity += quantity
+
+    def record(self, order_id: int, order_date: datetime, lines: List[Line]) -> None:
+        with self._lock:
+            if not self.loaded or order_date.date() != self.day or order_id <= self.seeded_through:
+                return
+            self.orders += 1
+            for product_id, name, category, quantity, unit_price in lines:
+                self._add(product_id, name, category, quantity, quantity * unit_price)
+            self.sequence += 1
+
+    def seed(self, db: Session) -> None:
+        """Recompute today's totals from ``db``."""
+        day = datetime.utcnow().date()
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        in_day = (models.Order.order_date >= start) & (models.Order.order_date < end)
+        with self._lock:
+            # Bound both reads by one id, so an order committed in between is either counted in
+            # full here or left to its event.
+            seeded_through = db.execute(select(func.max(models.Order.id))).scalar() or 0
+            counted = in_day & (models.Order.id <= seeded_through)
+            orders = db.execute(select(func.count(models.Order.id)).where(counted)).scalar()
+            lines = db.execute(
+                select(
+                    models.OrderItem.product_id,
+                    models.Product.name,
+                    models.Product.category,
+                    func.sum(models.OrderItem.quantity),
+                    func.sum(models.OrderItem.quantity * models.OrderItem.unit_price),
+                )
+                .select_from(models.Order)
+                .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+                .join(models.Product, models.Product.id == models.OrderItem.product_id)
+                .where(counted)
+                .group_by(models.OrderItem.product_id, models.Product.name, models.Product.category)
+            ).all()
+            self._reset(day)
+            self.orders = int(orders or 0)
+            for product_id, name, category, quantity, revenue in lines:
+                self._add(product_id, name, category, int(quantity), float(revenue))
+            self.seeded_through = seeded_through
+            self.database_url = database_url_of(db)
+            self.seeded_at = time.monotonic()
+            self.loaded = True
+            self.sequence += 1
+
+    def needs_seed(self) -> bool:
+        with self._lock:
+            if not self.loaded or self.day != datetime.utcnow().date():
+                return True
+            return bool(LIVE_RESYNC_SECONDS) and time.monotonic() - self.seeded_at >= LIVE_RESYNC_SECONDS
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            top = sorted(self.products.items(), key=lambda item: (-item[1][2], item[0]))[:LIVE_TOP_PRODUCTS]
+            return {
+                "sequence": self.sequence,
+                "day": self.day.isoformat() if self.day else None,
+                "revenue": round(self.revenue, 2),
+                "orders": self.orders,
+                "quantity": self.quantity,
+                "top_products": [
+                    {
+                        "product_id": product_id,
+                        "product_name": name,
+                        "category": category,
+                        "revenue": round(revenue, 2),
+                        "quantity": quantity,
+                    }
+                    for product_id, (name, category, revenue, quantity) in top
+                ],
+            }
+
+
+aggregates = DayAggregates()
+
+
+def reset() -> None:
+    """Forget the aggregates; the next subscriber seeds them again."""
+    with aggregates._lock:
+        aggregates.loaded = False
+        aggregates._reset(None)
+
+
+def publish_order(order_id: int, order_date: datetime, lines: List[Line]) -> None:
+    """Record a committed order; safe to call from any thread."""
+    aggregates.record(order_id, order_date.replace(tzinfo=None), lines)
+
+
+class _Broadcaster:
+    """Pushes snapshots to the subscribers of one event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.subscribers: "set[asyncio.Queue]" = set()
+        self.task: Optional[asyncio.Task] = None
+        self.payload = None
+        self.sequence = None
+
+    def _render(self) -> str:
+        snapshot = aggregates.snapshot()
+        if snapshot["sequence"] != self.sequence:
+            self.sequence = snapshot["sequence"]
+            self.payload = json.dumps(snapshot)
+        return self.payload
+
+    async def _run(self) -> None:
+        while self.subscribers:
+            await asyncio.sleep(LIVE_PUSH_INTERVAL)
+            if aggregates.needs_seed() and aggregates.database_url:
+                await asyncio.to_thread(_reseed, aggregates.database_url)
+            previous = self.sequence
+            payload = self._render()
+            if self.sequence == previous:
+                continue
+            for queue in self.subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(payload)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        queue.put_nowait(self._render())
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+
+_broadcasters: Dict[asyncio.AbstractEventLoop, _Broadcaster] = {}
+
+
+def _reseed(database_url: str) -> None:
+    db = session_for(database_url)
+    try:
+        aggregates.seed(db)
+    finally:
+        db.close()
+
+
+def prepare(db: Session) -> None:
+    """Seed the aggregates from ``db`` unless they are current."""
+    if aggregates.needs_seed():
+        aggregates.seed(db)
+        # End the read transaction so the connection is not held for the whole stream.
+        db.rollback()
+
+
+def _broadcaster() -> _Broadcaster:
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _broadcasters if other.is_closed()]:
+        del _broadcasters[other]
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = _Broadcaster(loop)
+    return broadcaster
+
+
+async def payloads() -> AsyncIterator[Optional[str]]:
+    """Yield each new snapshot as JSON, or None after ``KEEPALIVE_SECONDS`` without one."""
+    broadcaster = _broadcaster()
+    queue = broadcaster.subscribe()
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+async def sse_events() -> AsyncIterator[str]:
+    async for payload in payloads():
+        yield ": keep-alive\n\n" if payload is None else f"event: snapshot\ndata: {payload}\n\n"
+
+
+async def serve_websocket(websocket: WebSocket) -> None:
+    """Send snapshots to an accepted WebSocket until the client goes away."""
+
+    async def push():
+        async for payload in payloads():
+            if payload is not None:
+                await websocket.send_text(payload)
+
+    sender = asyncio.create_task(push())
+    try:
+        # Messages from the client are ignored; receiving notices the disconnect.
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+
+
+def subscriber_count() -> int:
+    return sum(len(broadcaster.subscribers) for broadcaster in _broadcasters.values())
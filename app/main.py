@@ -1,14 +1,18 @@
 from datetime import datetime
+from itertools import chain
 from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, Response
-from fastapi.responses import StreamingResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from . import analytics, crud, models, schemas
-from .database import Base, engine, get_db
+from . import analytics, cache, crud, exports, http_cache, jobs, live, models, olap, partitioning, profiling, schemas
+from . import database
+from .database import ASYNC_DATABASE, Base, engine, get_db, get_read_db
 
 Base.metadata.create_all(bind=engine)
+partitioning.prepare(engine)
 
 app = FastAPI(title="Sales Insights Backend", version="1.0.0")
 
@@ -18,14 +22,47 @@ def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/stats/db-pool")
+def read_pool_stats() -> dict:
+    stats = {"primary": database.pool_stats(engine)}
+    if database.async_engine is not None:
+        stats["async"] = database.pool_stats(database.async_engine.sync_engine)
+    if database.read_replicas.replicas:
+        stats["read_replicas"] = database.read_replicas.stats()
+    return stats
+
+
 @app.post("/products", response_model=schemas.ProductRead, status_code=201)
 def add_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
     return crud.create_product(db, product)
 
 
-@app.get("/products", response_model=List[schemas.ProductRead])
-def list_products(db: Session = Depends(get_db)):
-    return crud.get_products(db)
+def _page_size(limit: int) -> int:
+    return min(max(limit, 1), crud.MAX_PAGE_SIZE)
+
+
+def _send_page(page: crud.Page, response: Response) -> list:
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+@app.get(
+    "/products",
+    response_model=List[schemas.ProductRead],
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def list_products(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    try:
+        page = crud.get_products(db, _page_size(limit), cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
 
 
 @app.post("/customers", response_model=schemas.CustomerRead, status_code=201)
@@ -33,9 +70,22 @@ def add_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)
     return crud.create_customer(db, customer)
 
 
-@app.get("/customers", response_model=List[schemas.CustomerRead])
-def list_customers(db: Session = Depends(get_db)):
-    return crud.get_customers(db)
+@app.get(
+    "/customers",
+    response_model=List[schemas.CustomerRead],
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def list_customers(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    try:
+        page = crud.get_customers(db, _page_size(limit), cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
 
 
 @app.post("/orders", response_model=schemas.OrderRead, status_code=201)
@@ -46,53 +96,236 @@ def add_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
-@app.get("/orders", response_model=List[schemas.OrderRead])
-def list_orders(db: Session = Depends(get_db)):
-    return crud.get_orders(db)
+@app.post("/orders/bulk", response_model=schemas.BulkOrderResponse)
+def add_orders_bulk(orders: List[schemas.OrderCreate], db: Session = Depends(get_db)):
+    if len(orders) > crud.MAX_BULK_ORDERS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {crud.MAX_BULK_ORDERS} orders can be submitted at once."
+        )
+    return crud.create_orders_bulk(db, orders)
+
+
+@app.get(
+    "/orders",
+    response_model=List[schemas.OrderRead],
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def list_orders(
+    response: Response,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    try:
+        page = crud.get_orders(
+            db, _page_size(limit), cursor, customer_id, status, start_date, end_date
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return _send_page(page, response)
 
 
-@app.get("/analytics/sales-over-time", response_model=List[schemas.SalesPoint])
+@app.get(
+    "/analytics/sales-over-time",
+    response_model=List[schemas.SalesPoint],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get)],
+)
 def read_sales_over_time(
     interval: str = "monthly",
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    return analytics.sales_over_time(db, interval, start_date, end_date, engine, accuracy)
+
+
+@app.get(
+    "/analytics/sales-trends",
+    response_model=List[schemas.SalesTrendPoint],
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def read_sales_trends(
+    interval: str = "daily",
+    windows: str = "7,30,90",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    db: Session = Depends(get_read_db),
 ):
-    return analytics.sales_over_time(db, interval, start_date, end_date)
+    clean_windows = analytics.parse_windows(windows)
+    return analytics.sales_trends(db, interval, clean_windows, start_date, end_date, engine)
 
 
-@app.get("/analytics/top-products", response_model=List[schemas.TopProduct])
+@app.get(
+    "/analytics/top-products",
+    response_model=List[schemas.TopProduct],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get)],
+)
 def read_top_products(
     limit: int = 5,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: Session = Depends(get_read_db),
 ):
     clean_limit = min(max(limit, 1), 50)
-    return analytics.top_products(db, clean_limit, start_date, end_date)
+    return analytics.top_products(db, clean_limit, start_date, end_date, engine, accuracy)
 
 
-@app.get("/analytics/category-summary", response_model=List[schemas.CategorySummary])
+@app.get(
+    "/analytics/category-summary",
+    response_model=List[schemas.CategorySummary],
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get)],
+)
 def read_category_summary(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    engine: Optional[str] = None,
+    accuracy: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    return analytics.category_summary(db, start_date, end_date, engine, accuracy)
+
+
+@app.get(
+    "/analytics/dashboard",
+    response_model=schemas.Dashboard,
+    response_model_exclude_none=True,
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def read_dashboard(
+    interval: str = "monthly",
+    limit: int = 5,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    engine: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    clean_limit = min(max(limit, 1), 50)
+    return analytics.dashboard(db, interval, clean_limit, start_date, end_date, engine)
+
+
+@app.get(
+    "/analytics/customers/rfm",
+    response_model=schemas.RFMReport,
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def read_customer_rfm(
+    limit: int = 20,
+    as_of: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    clean_limit = min(max(limit, 1), 500)
+    return analytics.customer_rfm(db, clean_limit, as_of)
+
+
+@app.get(
+    "/analytics/cohorts",
+    response_model=List[schemas.Cohort],
+    dependencies=[Depends(http_cache.conditional_get)],
+)
+def read_cohorts(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    periods: int = 12,
+    db: Session = Depends(get_read_db),
 ):
-    return analytics.category_summary(db, start_date, end_date)
+    clean_periods = min(max(periods, 1), 60)
+    return analytics.cohorts(db, start_date, end_date, clean_periods)
+
+
+@app.post("/analytics/query", response_model=schemas.CubeResult)
+def run_cube_query(query: schemas.CubeQuery, db: Session = Depends(get_read_db)):
+    return olap.run(db, olap.spec_from(query))
+
+
+@app.get("/analytics/cache-stats")
+def read_cache_stats() -> dict:
+    return {**cache.stats(), "query_plans": olap.plan_stats()}
+
+
+@app.get("/analytics/stream")
+def stream_live_analytics(db: Session = Depends(get_read_db)):
+    live.prepare(db)
+    return StreamingResponse(
+        live.sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/analytics/stream")
+async def watch_live_analytics(websocket: WebSocket, db: Session = Depends(get_read_db)):
+    await run_in_threadpool(live.prepare, db)
+    await websocket.accept()
+    await live.serve_websocket(websocket)
 
 
 @app.get("/analytics/sales-export")
 def export_sales(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    export_format: str = Query("csv", alias="format"),
+    compression: Optional[str] = None,
+    db: Session = Depends(get_read_db),
 ):
-    csv_content = analytics.sales_csv(db, start_date, end_date)
-    if not csv_content:
+    export = exports.sales_export(db, start_date, end_date, export_format, compression)
+    first_chunk = next(export.chunks, None)
+    if first_chunk is None:
         return Response(status_code=204)
     return StreamingResponse(
-        iter([csv_content]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=sales_export.csv"},
+        chain([first_chunk], export.chunks),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f"attachment; filename={export.filename}"},
     )
 
+
+def _job_status(job: dict) -> dict:
+    if job["status"] == "succeeded":
+        job["result_url"] = f"/analytics/jobs/{job['id']}/result"
+    return job
+
+
+@app.post("/analytics/jobs", response_model=schemas.JobRead, status_code=202)
+def submit_job(job: schemas.JobCreate, db: Session = Depends(get_read_db)):
+    # Workers open their own connections to the database behind this session.
+    database_url = database.database_url_of(db)
+    return _job_status(jobs.submit(job.kind, job.model_dump(exclude={"kind"}), database_url))
+
+
+@app.get("/analytics/jobs/{job_id}", response_model=schemas.JobRead)
+def read_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return _job_status(job)
+
+
+@app.get("/analytics/jobs/{job_id}/result")
+def download_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    path = jobs.result_path(job)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}; no result to download.")
+    return FileResponse(path, media_type=job["media_type"], filename=job["filename"])
+
+
+if ASYNC_DATABASE:
+    from . import async_routes
+
+    async_routes.install(app)
+
+if profiling.PROFILING_ENABLED:
+    profiling.install(app)
@@ -1,9 +1,43 @@
+import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    event,
+    insert,
+)
 from sqlalchemy.orm import relationship
 
-from .database import Base
+from .database import MONTHLY_PARTITIONS, Base
+
+
+def _order_table_args(*table_args) -> tuple:
+    """Table args for an order table, range-partitioned on ``order_date`` when enabled.
+
+    PostgreSQL requires the partition key in every unique constraint, so with
+    partitioning ``order_date`` joins the primary key (rows are still mapped by
+    ``id`` alone) and order lines reference ``(order_id, order_date)``. On SQLite
+    ids are never reused, so archived rows cannot collide with new ones.
+    """
+    options = {"sqlite_autoincrement": True}
+    if MONTHLY_PARTITIONS:
+        options["postgresql_partition_by"] = "RANGE (order_date)"
+    return table_args + (options,)
+
+
+def _order_reference() -> ForeignKeyConstraint:
+    if MONTHLY_PARTITIONS:
+        return ForeignKeyConstraint(["order_id", "order_date"], ["orders.id", "orders.order_date"])
+    return ForeignKeyConstraint(["order_id"], ["orders.id"])
 
 
 class Product(Base):
@@ -29,25 +63,160 @@ class Customer(Base):
 
 class Order(Base):
     __tablename__ = "orders"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = _order_table_args(
+        # Date-range filters and keyset pagination on (order_date, id).
+        Index("ix_orders_order_date_id", "order_date", "id"),
+        Index("ix_orders_customer_id_order_date", "customer_id", "order_date"),
+        Index("ix_orders_status_order_date", "status", "order_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
-    order_date = Column(DateTime, default=datetime.utcnow, nullable=False)
+    order_date = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=MONTHLY_PARTITIONS)
     status = Column(String, default="created", nullable=False)
 
     customer = relationship("Customer", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __mapper_args__ = {"primary_key": [id]}
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
-
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    __table_args__ = _order_table_args(
+        # Covers the order -> item join of the analytics queries without touching the table.
+        Index("ix_order_items_order_id_covering", "order_id", "product_id", "quantity", "unit_price"),
+        Index("ix_order_items_product_id", "product_id"),
+        _order_reference(),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    order_id = Column(Integer, nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)
+    # Copy of the parent order's date: the partition key, and lets date filters skip
+    # old order lines without going through orders.
+    order_date = Column(DateTime, nullable=False, primary_key=MONTHLY_PARTITIONS)
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class ArchivedOrder(Base):
+    """Orders moved out of ``orders`` by ``partitioning.archive_before``."""
+
+    __tablename__ = "orders_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    customer_id = Column(Integer, nullable=False)
+    order_date = Column(DateTime, nullable=False, index=True)
+    status = Column(String, nullable=False)
+
+
+class ArchivedOrderItem(Base):
+    """Order lines moved out of ``order_items`` along with their order."""
+
+    __tablename__ = "order_items_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    order_id = Column(Integer, nullable=False, index=True)
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+    order_date = Column(DateTime, nullable=False)
+
+
+class DailySalesRollup(Base):
+    """Revenue and quantity per day, product and category, maintained on order writes."""
+
+    __tablename__ = "daily_sales_rollup"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    category = Column(String, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0.0)
+    quantity = Column(Integer, nullable=False, default=0)
+
+
+class SalesSample(Base):
+    """Uniform reservoir sample of order lines, one row per slot."""
+
+    __tablename__ = "sales_sample"
+
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    order_date = Column(DateTime, nullable=False)
+    product_id = Column(Integer, nullable=False)
+    category = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+
+
+class SampleState(Base):
+    """Single row counting the order lines offered to the reservoir sample."""
+
+    __tablename__ = "sample_state"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    lines_seen = Column(Integer, nullable=False, default=0)
+
+
+class OrderGeneration(Base):
+    """Single row whose token changes whenever orders are removed rather than added.
+
+    Copies that follow ``orders`` by id watermark (the columnar replica) rebuild
+    when it changes. A new database starts with a token of its own.
+    """
+
+    __tablename__ = "order_generation"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    token = Column(String(32), nullable=False)
+
+
+@event.listens_for(OrderGeneration.__table__, "after_create")
+def _first_generation(target, connection, **kw):
+    connection.execute(insert(target).values(id=1, token=uuid.uuid4().hex))
+
+
+class ProductSketch(Base):
+    """Count-Min sketches of product revenue and quantity for one month."""
+
+    __tablename__ = "product_sketches"
+
+    month = Column(Date, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0.0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue_counters = Column(LargeBinary, nullable=False)
+    quantity_counters = Column(LargeBinary, nullable=False)
+    # JSON list of the product ids with the highest estimated revenue this month.
+    candidates = Column(String, nullable=False, default="[]")
+
+
+class CustomerSummary(Base):
+    """Lifetime order totals per customer, maintained on order writes."""
+
+    __tablename__ = "customer_summaries"
+    __table_args__ = (
+        # Cohort queries select customers by the month of their first order.
+        Index("ix_customer_summaries_first_order_date", "first_order_date"),
+    )
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    first_order_date = Column(DateTime, nullable=False)
+    last_order_date = Column(DateTime, nullable=False)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class CustomerMonth(Base):
+    """Orders and revenue per customer and calendar month with at least one order."""
+
+    __tablename__ = "customer_months"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,281 @@
+"""
+Generic aggregate queries for ``POST /analytics/query``.
+
+A query names dimensions, measures, filters and an ordering. It is compiled to
+a single GROUP BY over the narrowest source that can answer it:
+
+- ``daily_sales_rollup``, when only product, category and time dimensions and
+  revenue or quantity are asked for, with whole-day date bounds;
+- ``orders`` alone, when nothing needs the order lines;
+- ``order_items`` alone, when nothing needs the order's customer or status and
+  there are no date bounds (which the orders index serves better);
+- ``orders`` joined with ``order_items`` otherwise.
+
+Statements are built with bind parameters for every filter value, so queries
+of the same shape (dimensions, measures, which filters are set, ordering and
+source) share one statement from the plan cache, and SQLAlchemy's compiled
+cache then skips re-compiling it. Results go through the analytics cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Date, DateTime, bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import analytics, cache, models
+from .database import MONTHLY_PARTITIONS
+
+QUERY_PLAN_CACHE_SIZE = int(os.getenv("ANALYTICS_QUERY_PLAN_CACHE", "256"))
+MAX_QUERY_ROWS = 10000
+
+TIME_DIMENSIONS = {"day": "daily", "week": "weekly", "month": "monthly"}
+DIMENSIONS = tuple(TIME_DIMENSIONS) + ("product", "category", "customer", "status")
+MEASURES = ("revenue", "quantity", "orders", "customers")
+LIST_FILTERS = ("product_ids", "categories", "customer_ids", "statuses")
+
+# Columns each dimension adds to a result row.
+_DIMENSION_COLUMNS = {
+    "product": ("product_id", "product_name"),
+    "customer": ("customer_id", "customer_name"),
+}
+
+_plans: "OrderedDict[tuple, object]" = OrderedDict()
+_plan_stats = {"hits": 0, "misses": 0}
+_plans_lock = threading.Lock()
+
+
+class QuerySpec(NamedTuple):
+    """A validated query; hashable, so it can key the analytics cache."""
+
+    dimensions: Tuple[str, ...]
+    measures: Tuple[str, ...]
+    start_date: Optional[datetime]
+    end_date: Optional[datetime]
+    filters: Tuple[Tuple[str, tuple], ...]
+    order_by: Tuple[str, ...]
+    limit: int
+
+
+def _columns(dimensions: Tuple[str, ...]) -> List[str]:
+    return [column for name in dimensions for column in _DIMENSION_COLUMNS.get(name, (name,))]
+
+
+def spec_from(query) -> QuerySpec:
+    """Validate a ``schemas.CubeQuery`` and normalize it into a ``QuerySpec``."""
+    dimensions = tuple(dict.fromkeys(query.dimensions))
+    measures = tuple(dict.fromkeys(query.measures))
+    unknown = [name for name in dimensions if name not in DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown dimension {unknown[0]}; use {', '.join(DIMENSIONS)}."
+        )
+    unknown = [name for name in measures if name not in MEASURES]
+    if unknown or not measures:
+        raise HTTPException(status_code=400, detail=f"Measures must be among {', '.join(MEASURES)}.")
+    if sum(name in TIME_DIMENSIONS for name in dimensions) > 1:
+        raise HTTPException(status_code=400, detail="Use at most one of day, week, or month.")
+
+    outputs = _columns(dimensions) + list(measures)
+    order_by = tuple(query.order_by) or tuple(_columns(dimensions))
+    unknown = [field for field in order_by if field.lstrip("-") not in outputs]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot order by {unknown[0]}; it is not in the result.")
+
+    filters = query.filters
+    values = [(name, tuple(getattr(filters, name))) for name in LIST_FILTERS if getattr(filters, name)]
+    return QuerySpec(
+        dimensions,
+        measures,
+        filters.start_date,
+        filters.end_date,
+        tuple(values),
+        order_by,
+        min(max(query.limit, 1), MAX_QUERY_ROWS),
+    )
+
+
+def _source(spec: QuerySpec) -> str:
+    filters = {name for name, _ in spec.filters}
+    order_level = (
+        {"customer", "status"} & set(spec.dimensions)
+        or {"customers"} & set(spec.measures)
+        or {"customer_ids", "statuses"} & filters
+    )
+    line_level = (
+        {"product", "category"} & set(spec.dimensions)
+        or {"revenue", "quantity"} & set(spec.measures)
+        or {"product_ids", "categories"} & filters
+    )
+    rollup_measures = "orders" not in spec.measures
+    if not order_level and rollup_measures and analytics._uses_rollup(spec.start_date, spec.end_date):
+        return "rollup"
+    if not line_level:
+        return "orders"
+    if not order_level and spec.start_date is None and spec.end_date is None:
+        return "order_items"
+    return "orders_with_items"
+
+
+def _build(dialect: str, spec: QuerySpec, source: str):
+    """The parameterized statement for ``spec``; it only depends on the plan key."""
+    Order, Item, Product, Rollup = models.Order, models.OrderItem, models.Product, models.DailySalesRollup
+    if source == "rollup":
+        date_column, date_type = Rollup.day, Date
+        product_id, category = Rollup.product_id, Rollup.category
+        base = select().select_from(Rollup)
+    else:
+        date_column = Item.order_date if source == "order_items" else Order.order_date
+        date_type = DateTime
+        product_id, category = Item.product_id, Product.category
+        if source == "order_items":
+            base = select().select_from(Item)
+        elif source == "orders":
+            base = select().select_from(Order)
+        else:
+            base = select().select_from(Order).join(Item, Order.id == Item.order_id)
+
+    needs_product = {"product", "category"} & set(spec.dimensions) or any(
+        name == "categories" for name, _ in spec.filters
+    )
+    if source == "rollup":
+        needs_product = "product" in spec.dimensions
+    if needs_product:
+        base = base.join(Product, Product.id == product_id)
+    if "customer" in spec.dimensions:
+        base = base.join(models.Customer, models.Customer.id == Order.customer_id)
+
+    groups = []
+    for name in spec.dimensions:
+        if name in TIME_DIMENSIONS:
+            bucket = analytics._bucket_expression(dialect, TIME_DIMENSIONS[name], date_column)
+            if bucket is None:
+                raise HTTPException(status_code=400, detail="Time dimensions need SQLite or PostgreSQL.")
+            groups.append(bucket.label(name))
+        elif name == "product":
+            groups += [product_id.label("product_id"), Product.name.label("product_name")]
+        elif name == "category":
+            groups.append(category.label("category"))
+        elif name == "customer":
+            groups += [Order.customer_id.label("customer_id"), models.Customer.name.label("customer_name")]
+        else:
+            groups.append(Order.status.label("status"))
+
+    if source == "rollup":
+        measures = {"revenue": func.sum(Rollup.revenue), "quantity": func.sum(Rollup.quantity)}
+    else:
+        order_id = Order.id if source == "orders" else Item.order_id
+        measures = {
+            "revenue": func.sum(Item.quantity * Item.unit_price),
+            "quantity": func.sum(Item.quantity),
+            # Only the orders source has one row per order.
+            "orders": func.count(order_id) if source == "orders" else func.count(func.distinct(order_id)),
+            "customers": func.count(func.distinct(Order.customer_id)),
+        }
+    statement = base.add_columns(*groups, *(measures[name].label(name) for name in spec.measures))
+
+    date_columns = [date_column]
+    if source == "orders_with_items" and MONTHLY_PARTITIONS:
+        # Bound the order lines too, so their partitions are pruned (see analytics._apply_line_filters).
+        date_columns.append(Item.order_date)
+    for column in date_columns:
+        if spec.start_date is not None:
+            statement = statement.where(column >= bindparam("start_date", type_=date_type))
+        if spec.end_date is not None:
+            statement = statement.where(column <= bindparam("end_date", type_=date_type))
+    columns = {
+        "product_ids": product_id,
+        "categories": category,
+        "customer_ids": Order.customer_id,
+        "statuses": Order.status,
+    }
+    for name, _ in spec.filters:
+        statement = statement.where(columns[name].in_(bindparam(name, expanding=True)))
+
+    if groups:
+        statement = statement.group_by(*groups)
+    labels = {column.key: column for column in statement.selected_columns}
+    ordering = [
+        labels[field[1:]].desc() if field.startswith("-") else labels[field].asc() for field in spec.order_by
+    ]
+    return statement.order_by(*ordering).limit(bindparam("row_limit"))
+
+
+def _plan(dialect: str, spec: QuerySpec, source: str):
+    key = (
+        dialect,
+        source,
+        spec.dimensions,
+        spec.measures,
+        spec.start_date is not None,
+        spec.end_date is not None,
+        tuple(name for name, _ in spec.filters),
+        spec.order_by,
+    )
+    with _plans_lock:
+        statement = _plans.get(key)
+        if statement is not None:
+            _plans.move_to_end(key)
+            _plan_stats["hits"] += 1
+            return statement
+        _plan_stats["misses"] += 1
+    statement = _build(dialect, spec, source)
+    with _plans_lock:
+        _plans[key] = statement
+        while len(_plans) > QUERY_PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return statement
+
+
+def plan_stats() -> Dict[str, int]:
+    with _plans_lock:
+        return {**_plan_stats, "entries": len(_plans)}
+
+
+def clear_plans() -> None:
+    with _plans_lock:
+        _plans.clear()
+        _plan_stats.update(hits=0, misses=0)
+
+
+def _value(column: str, value):
+    if column in TIME_DIMENSIONS:
+        return analytics._as_datetime(value).date()
+    if column == "revenue":
+        return round(float(value or 0), 2)
+    if column in MEASURES:
+        return int(value or 0)
+    return value
+
+
+@cache.cached("cube_query")
+def run(db: Session, spec: QuerySpec) -> dict:
+    source = _source(spec)
+    statement = _plan(analytics._dialect(db), spec, source)
+    params = {"row_limit": spec.limit, **{name: list(values) for name, values in spec.filters}}
+    if source == "rollup":
+        if spec.start_date is not None:
+            params["start_date"] = spec.start_date.date()
+        if spec.end_date is not None:
+            params["end_date"] = spec.end_date.date()
+    else:
+        if spec.start_date is not None:
+            params["start_date"] = spec.start_date
+        if spec.end_date is not None:
+            params["end_date"] = spec.end_date
+    columns = _columns(spec.dimensions) + list(spec.measures)
+    rows = db.execute(statement, params).all()
+    return {
+        "source": "daily_sales_rollup" if source == "rollup" else source,
+        "columns": columns,
+        "rows": [{column: _value(column, value) for column, value in zip(columns, row)} for row in rows],
+    }
+
+
+async def run_async(db: AsyncSession, spec: QuerySpec) -> dict:
+    return await db.run_sync(run, spec)
@@ -0,0 +1,105 @@
+"""
+Process pool for the ``parallel`` analytics engine.
+
+The date range of a request is cut into contiguous shards and every shard is
+handed to a worker process, which loads its order lines and reduces them to
+partial aggregates. The partials are small (one row per bucket, product or
+category), so merging them in the API process is cheap; the callers in
+``analytics`` sum them again to get exact results.
+
+``ANALYTICS_PARALLEL_WORKERS`` sets the pool size (default: one per CPU) and each
+request is cut into ``ANALYTICS_SHARDS_PER_WORKER`` shards per worker, so
+shards holding more orders than others don't leave workers idle.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import database_url_of, session_for
+
+WORKERS = int(os.getenv("ANALYTICS_PARALLEL_WORKERS", "0")) or os.cpu_count() or 1
+SHARDS_PER_WORKER = int(os.getenv("ANALYTICS_SHARDS_PER_WORKER", "2"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown() -> None:
+    """Stop the pool; the next parallel request starts a new one with the current ``WORKERS``."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def date_shards(
+    db: Session, start_date: Optional[datetime], end_date: Optional[datetime], count: int
+) -> List[Tuple[Optional[datetime], Optional[datetime]]]:
+    """Split a range into ``count`` contiguous shards with inclusive ends.
+
+    Shard edges are spaced between the first and last order date when the range
+    is open; the outer shards stay open on those sides, so a single shard
+    queries exactly like the unsharded range.
+    """
+    first, last = start_date, end_date
+    if first is None or last is None:
+        low, high = db.query(func.min(models.Order.order_date), func.max(models.Order.order_date)).one()
+        if low is None:
+            return []
+        first, last = first or low, last or high
+    if first > last:
+        return []
+    step = (last - first) / count
+    if count == 1 or step < timedelta(microseconds=1):
+        return [(start_date, end_date)]
+    edges = [first + step * index for index in range(1, count)]
+    starts = [start_date] + edges
+    ends = [edge - timedelta(microseconds=1) for edge in edges] + [end_date]
+    return list(zip(starts, ends))
+
+
+def _run_shard(func: Callable, database_url: str, shard: tuple, args: tuple):
+    db = session_for(database_url)
+    try:
+        return func(db, *shard, *args)
+    finally:
+        db.close()
+
+
+def map_shards(
+    func: Callable,
+    db: Session,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    *args,
+) -> list:
+    """Call ``func(shard_db, shard_start, shard_end, *args)`` for every shard of the range.
+
+    ``func`` must be a module-level function, as it is pickled by reference.
+    With one worker the whole range runs in this process on ``db``.
+    """
+    if WORKERS == 1:
+        return [func(db, *shard, *args) for shard in date_shards(db, start_date, end_date, 1)]
+    shards = date_shards(db, start_date, end_date, WORKERS * SHARDS_PER_WORKER)
+    database_url = database_url_of(db)
+    futures = [_pool().submit(_run_shard, func, database_url, shard, args) for shard in shards]
+    return [future.result() for future in futures]
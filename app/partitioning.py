@@ -0,0 +1,211 @@
+"""
+Time-based partitioning and archiving of the order tables.
+
+With ``ORDER_PARTITIONING=monthly`` on PostgreSQL, ``orders`` and ``order_items``
+are created range-partitioned on ``order_date`` (see ``models._order_table_args``).
+This module creates the monthly partitions ahead of time, plus a default
+partition for out-of-range dates, and detaches old months so they leave the
+live tables.
+
+Other backends keep plain tables: ``archive_before`` moves old orders and their
+lines into ``orders_archive`` and ``order_items_archive`` instead.
+
+Either way the daily rollup keeps the retired days, so day-aligned analytics
+still cover them; queries on raw order lines only see the live months.
+"""
+
+import os
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Union
+
+from sqlalchemy import delete, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import MONTHLY_PARTITIONS
+
+# Months created beyond the current one, so inserts never land in the default partition.
+MONTHS_AHEAD = int(os.getenv("ORDER_PARTITIONS_AHEAD", "3"))
+PARTITIONED_TABLES = ("orders", "order_items")
+_MONTH_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def ensure_line_dates(bind: Engine) -> bool:
+    """Add and backfill ``order_items.order_date`` on databases created without it."""
+    with bind.begin() as connection:
+        inspector = inspect(connection)
+        if not inspector.has_table("order_items"):
+            return False
+        if any(column["name"] == "order_date" for column in inspector.get_columns("order_items")):
+            return False
+        column_type = models.OrderItem.__table__.c.order_date.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE order_items ADD COLUMN order_date {column_type}"))
+        connection.execute(
+            text(
+                "UPDATE order_items SET order_date = "
+                "(SELECT orders.order_date FROM orders WHERE orders.id = order_items.order_id)"
+            )
+        )
+    return True
+
+
+def _partitions(connection: Connection, table: str) -> List[str]:
+    rows = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :table ORDER BY child.relname"
+        ),
+        {"table": table},
+    )
+    return [row[0] for row in rows]
+
+
+def _require_partitioned(connection: Connection) -> None:
+    kind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = 'orders' AND relkind IN ('r', 'p')")
+    ).scalar()
+    if kind != "p":
+        raise RuntimeError(
+            "orders is not a partitioned table; ORDER_PARTITIONING only applies to "
+            "tables created with it enabled."
+        )
+
+
+def ensure_partitions(bind: Engine, start, end) -> List[str]:
+    """Create the default partitions and one partition per month from ``start`` to ``end``."""
+    created = []
+    last = month_start(end)
+    with bind.begin() as connection:
+        _require_partitioned(connection)
+        for table in PARTITIONED_TABLES:
+            existing = set(_partitions(connection, table))
+            default = f"{table}_default"
+            if default not in existing:
+                connection.execute(text(f"CREATE TABLE {default} PARTITION OF {table} DEFAULT"))
+                created.append(default)
+            month = month_start(start)
+            while month <= last:
+                name = partition_name(table, month)
+                if name not in existing:
+                    connection.execute(
+                        text(
+                            f"CREATE TABLE {name} PARTITION OF {table} "
+                            f"FOR VALUES FROM ('{month}') TO ('{_next_month(month)}')"
+                        )
+                    )
+                    created.append(name)
+                month = _next_month(month)
+    return created
+
+
+def prepare(bind: Engine) -> None:
+    """Bring the order tables of an existing database up to the current layout."""
+    ensure_line_dates(bind)
+    if MONTHLY_PARTITIONS:
+        today = date.today()
+        ensure_partitions(bind, today, today + timedelta(days=31 * MONTHS_AHEAD))
+
+
+def mark_orders_removed(db: Union[Session, Connection]) -> None:
+    """Record that orders were removed, in the caller's transaction (see ``models.OrderGeneration``)."""
+    table = models.OrderGeneration.__table__
+    token = uuid.uuid4().hex
+    if not db.execute(update(table).where(table.c.id == 1).values(token=token)).rowcount:
+        db.execute(insert(table).values(id=1, token=token))
+
+
+def detach_before(bind: Engine, cutoff) -> List[str]:
+    """Detach the monthly partitions that end on or before the month of ``cutoff``.
+
+    Detached partitions stay in the database as standalone tables, so they can be
+    dumped, moved to cheaper storage or dropped.
+    """
+    cutoff = month_start(cutoff)
+    detached = []
+    with bind.begin() as connection:
+        _require_partitioned(connection)
+        line_partitions = set(_partitions(connection, "order_items"))
+        for name in _partitions(connection, "orders"):
+            match = _MONTH_SUFFIX.search(name)
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if _next_month(month) > cutoff:
+                continue
+            # Lines first; their copied foreign key would otherwise pin the order rows.
+            lines = partition_name("order_items", month)
+            if lines in line_partitions:
+                connection.execute(text(f"ALTER TABLE order_items DETACH PARTITION {lines}"))
+                constraints = connection.execute(
+                    text(
+                        "SELECT conname FROM pg_constraint WHERE contype = 'f' "
+                        "AND conrelid = CAST(:table AS regclass) AND confrelid = CAST('orders' AS regclass)"
+                    ),
+                    {"table": lines},
+                ).scalars()
+                for constraint in list(constraints):
+                    connection.execute(text(f'ALTER TABLE {lines} DROP CONSTRAINT "{constraint}"'))
+                detached.append(lines)
+            connection.execute(text(f"ALTER TABLE orders DETACH PARTITION {name}"))
+            detached.append(name)
+        if detached:
+            mark_orders_removed(connection)
+    return detached
+
+
+def archive_before(db: Session, cutoff) -> Dict[str, int]:
+    """Move orders dated before the month of ``cutoff`` into the archive tables.
+
+    Runs in the caller's transaction and returns the number of rows moved per table.
+    """
+    cutoff = datetime.combine(month_start(cutoff), time.min)
+    moved = {}
+    for live, archive in (
+        (models.OrderItem.__table__, models.ArchivedOrderItem.__table__),
+        (models.Order.__table__, models.ArchivedOrder.__table__),
+    ):
+        columns = [column.name for column in archive.columns]
+        db.execute(
+            insert(archive).from_select(
+                columns, select(*(live.c[name] for name in columns)).where(live.c.order_date < cutoff)
+            )
+        )
+        moved[live.name] = db.execute(delete(live).where(live.c.order_date < cutoff)).rowcount
+    if moved["orders"]:
+        mark_orders_removed(db)
+    return moved
+
+
+def describe(db: Session) -> List[dict]:
+    """Row counts and date ranges of the live and archived order tables, or the partitions."""
+    if MONTHLY_PARTITIONS:
+        connection = db.connection()
+        return [
+            {"table": table, "partition": name}
+            for table in PARTITIONED_TABLES
+            for name in _partitions(connection, table)
+        ]
+    report = []
+    for model in (models.Order, models.OrderItem, models.ArchivedOrder, models.ArchivedOrderItem):
+        count, first, last = db.query(
+            func.count(), func.min(model.order_date), func.max(model.order_date)
+        ).one()
+        report.append({"table": model.__tablename__, "rows": count, "first": first, "last": last})
+    return report
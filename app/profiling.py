@@ -0,0 +1,304 @@
+"""
+Opt-in request profiling (``PROFILING=1``).
+
+Each request records phase timings: SQL execution and query count through
+SQLAlchemy cursor events, plus the ``phase`` blocks in the analytics code and
+response serialization (from the endpoint returning to the response starting). They are sent back as a ``Server-Timing`` header and
+aggregated per route for the Prometheus-style ``GET /metrics`` endpoint.
+
+With ``PROFILING_SAMPLE_RATE`` above zero, sampled requests also run under
+cProfile (or pyinstrument with ``PROFILER=pyinstrument``); the profile is written
+to ``PROFILING_DIR`` when the request takes at least ``PROFILING_SLOW_MS``.
+"""
+
+import asyncio
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover
+    pyinstrument = None
+
+PROFILING_ENABLED = os.getenv("PROFILING", "0").lower() in ("1", "true", "yes")
+SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+SLOW_REQUEST_MS = float(os.getenv("PROFILING_SLOW_MS", "500"))
+PROFILE_DIR = Path(os.getenv("PROFILING_DIR", "./profiles"))
+PROFILER = os.getenv("PROFILER", "cprofile").lower()
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestProfile:
+    def __init__(self, sampled: bool):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.query_count = 0
+        self.sampled = sampled
+        self.profilers: list = []
+        self.endpoint_finished: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] += seconds
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block as ``name`` in the current request's profile, if any."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("profiling_started")
+    if profile is not None and started:
+        profile.add("sql", time.perf_counter() - started.pop())
+        profile.query_count += 1
+
+
+class _Metrics:
+    """Per-route counters rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[tuple, int] = defaultdict(int)
+        self.duration_sum: Dict[tuple, float] = defaultdict(float)
+        self.duration_buckets: Dict[tuple, list] = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.phase_sum: Dict[tuple, float] = defaultdict(float)
+        self.queries: Dict[tuple, int] = defaultdict(int)
+
+    def record(self, method: str, route: str, status: int, profile: RequestProfile, seconds: float):
+        key = (method, route)
+        with self._lock:
+            self.requests[(method, route, str(status))] += 1
+            self.duration_sum[key] += seconds
+            buckets = self.duration_buckets[key]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+            for name, value in profile.phases.items():
+                self.phase_sum[(method, route, name)] += value
+            self.queries[key] += profile.query_count
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+                )
+            lines += [
+                "# HELP http_request_duration_seconds Request latency.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), buckets in sorted(self.duration_buckets.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                total = sum(
+                    count for (m, r, _), count in self.requests.items() if (m, r) == (method, route)
+                )
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {total}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {self.duration_sum[(method, route)]}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {total}")
+            lines += [
+                "# HELP http_request_phase_seconds_total Time spent per request phase.",
+                "# TYPE http_request_phase_seconds_total counter",
+            ]
+            for (method, route, name), value in sorted(self.phase_sum.items()):
+                lines.append(
+                    f'http_request_phase_seconds_total{{method="{method}",route="{route}",phase="{name}"}} {value}'
+                )
+            lines += [
+                "# HELP db_queries_total SQL statements executed while serving requests.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(f'db_queries_total{{method="{method}",route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = _Metrics()
+
+
+def _server_timing(profile: RequestProfile) -> str:
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in sorted(profile.phases.items())]
+    entries.append(f'db;desc="{profile.query_count} queries"')
+    entries.append(f"total;dur={(time.perf_counter() - profile.started) * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _start_profiler():
+    if PROFILER == "pyinstrument" and pyinstrument is not None:
+        profiler = pyinstrument.Profiler(async_mode="disabled")
+    else:
+        profiler = cProfile.Profile()
+    if isinstance(profiler, cProfile.Profile):
+        profiler.enable()
+    else:
+        profiler.start()
+    return profiler
+
+
+def _stop_profiler(profiler) -> None:
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def _dump_profiles(profile: RequestProfile, method: str, route: str, seconds: float) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{method}{route.replace('/', '_')}"
+    for index, profiler in enumerate(profile.profilers):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(PROFILE_DIR / f"{stem}-{index}.prof")
+        else:
+            (PROFILE_DIR / f"{stem}-{index}.html").write_text(profiler.output_html())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware owning the per-request profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(sampled=SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+        token = _current.set(profile)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile.endpoint_finished is not None:
+                    profile.add("serialize", time.perf_counter() - profile.endpoint_finished)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(profile).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            seconds = time.perf_counter() - profile.started
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            metrics.record(scope["method"], route_path, status, profile, seconds)
+            if profile.profilers and seconds * 1000 >= SLOW_REQUEST_MS:
+                _dump_profiles(profile, scope["method"], route_path, seconds)
+
+
+def _profiled_call(call):
+    """Wrap an endpoint so sampled requests are profiled on the thread running it."""
+    if getattr(call, "_profiling_wrapped", False):
+        return call
+
+    if asyncio.iscoroutinefunction(call):
+
+        @wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return await call(*args, **kwargs)
+            profiler = _start_profiler() if profile.sampled else None
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                _finish_call(profile, profiler)
+
+        async_wrapper._profiling_wrapped = True
+        return async_wrapper
+
+    @wraps(call)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        profiler = _start_profiler() if profile.sampled else None
+        try:
+            return call(*args, **kwargs)
+        finally:
+            _finish_call(profile, profiler)
+
+    wrapper._profiling_wrapped = True
+    return wrapper
+
+
+def _finish_call(profile: RequestProfile, profiler) -> None:
+    if profiler is not None:
+        _stop_profiler(profiler)
+        profile.profilers.append(profiler)
+    profile.endpoint_finished = time.perf_counter()
+
+
+_SQL_LISTENERS = (
+    ("before_cursor_execute", _before_cursor_execute),
+    ("after_cursor_execute", _after_cursor_execute),
+)
+
+
+def install(app: FastAPI) -> None:
+    """Add the middleware, endpoint profiling hooks, SQL listeners and ``GET /metrics`` to ``app``."""
+    for route in app.router.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _profiled_call(route.dependant.call)
+    for name, listener in _SQL_LISTENERS:
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def read_metrics() -> str:
+        return metrics.render()
+
+    app.add_middleware(ProfilingMiddleware)
+
+
+def uninstall(app: FastAPI) -> None:
+    """Unwrap ``app``'s endpoints and remove the SQL listeners added by ``install``."""
+    for route in app.router.routes:
+        if isinstance(route, APIRoute) and getattr(route.dependant.call, "_profiling_wrapped", False):
+            route.dependant.call = route.dependant.call.__wrapped__
+    for name, listener in _SQL_LISTENERS:
+        if event.contains(Engine, name, listener):
+            event.remove(Engine, name, listener)
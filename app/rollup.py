@@ -0,0 +1,124 @@
+"""
+Maintenance of the ``daily_sales_rollup`` table.
+
+Order writes fold their lines into the rollup inside the caller's transaction;
+``rebuild`` recomputes it from the raw order tables.
+"""
+
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import Date, cast, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+USE_DAILY_ROLLUP = os.getenv("USE_DAILY_ROLLUP", "1").lower() not in ("0", "false", "no")
+
+RollupKey = Tuple[object, int, str]
+
+_UPSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+def _day_expression(dialect: str):
+    if dialect == "sqlite":
+        # CAST(... AS DATE) has numeric affinity on SQLite, date() keeps ISO text.
+        return func.date(models.Order.order_date)
+    return cast(models.Order.order_date, Date)
+
+
+def new_totals() -> Dict[RollupKey, list]:
+    return defaultdict(lambda: [0.0, 0])
+
+
+def add_line(
+    totals: Dict[RollupKey, list], order_date, product_id: int, category: str, quantity: int, unit_price: float
+) -> None:
+    entry = totals[(order_date.date(), product_id, category)]
+    entry[0] += quantity * unit_price
+    entry[1] += quantity
+
+
+def record_order_items(
+    db: Session, order: models.Order, items: Iterable[Tuple[models.OrderItem, str]]
+) -> None:
+    """Add the ``(item, category)`` pairs of ``order`` to the rollup without committing."""
+    totals = new_totals()
+    for item, category in items:
+        add_line(totals, order.order_date, item.product_id, category, item.quantity, item.unit_price)
+    apply_totals(db, totals)
+
+
+def _rows(totals: Dict[RollupKey, list]) -> list:
+    return [
+        {"day": day, "product_id": product_id, "category": category, "revenue": revenue, "quantity": quantity}
+        for (day, product_id, category), (revenue, quantity) in totals.items()
+    ]
+
+
+def apply_totals(db: Session, totals: Dict[RollupKey, list]) -> None:
+    if not totals:
+        return
+    table = models.DailySalesRollup.__table__
+    upsert = _UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(table)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["day", "product_id", "category"],
+                set_={
+                    "revenue": table.c.revenue + statement.excluded.revenue,
+                    "quantity": table.c.quantity + statement.excluded.quantity,
+                },
+            ),
+            _rows(totals),
+        )
+        return
+
+    for row in _rows(totals):
+        key = (
+            (table.c.day == row["day"])
+            & (table.c.product_id == row["product_id"])
+            & (table.c.category == row["category"])
+        )
+        result = db.execute(
+            update(table)
+            .where(key)
+            .values(revenue=table.c.revenue + row["revenue"], quantity=table.c.quantity + row["quantity"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table).values(**row))
+
+
+def rebuild(db: Session) -> int:
+    """Recompute the rollup from ``order_items`` and return the number of rollup rows.
+
+    Days before the first live order are kept as they are: their orders were
+    archived or their partitions detached, and the rollup is all that is left.
+    """
+    first_order = db.query(func.min(models.Order.order_date)).scalar()
+    if first_order is None:
+        return db.query(func.count()).select_from(models.DailySalesRollup).scalar()
+    day = _day_expression(db.get_bind().dialect.name).label("day")
+    source = (
+        select(
+            day,
+            models.OrderItem.product_id,
+            models.Product.category,
+            func.sum(models.OrderItem.quantity * models.OrderItem.unit_price),
+            func.sum(models.OrderItem.quantity),
+        )
+        .select_from(models.Order)
+        .join(models.OrderItem, models.Order.id == models.OrderItem.order_id)
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        .group_by(day, models.OrderItem.product_id, models.Product.category)
+    )
+    table = models.DailySalesRollup.__table__
+    db.execute(delete(table).where(table.c.day >= first_order.date()))
+    db.execute(
+        insert(table).from_select(["day", "product_id", "category", "revenue", "quantity"], source)
+    )
+    return db.query(func.count()).select_from(table).scalar()
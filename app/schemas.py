@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 
@@ -74,9 +74,35 @@ class OrderRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class BulkOrderResult(BaseModel):
+    index: int
+    order_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkOrderResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkOrderResult]
+
+
 class SalesPoint(BaseModel):
     period_start: datetime
     revenue: float
+    # 95% error bounds, only set for accuracy=approx.
+    revenue_error: Optional[float] = None
+
+
+class SalesTrendPoint(BaseModel):
+    period_start: datetime
+    revenue: float
+    # Trailing revenue keyed by window, e.g. "7d".
+    rolling: Dict[str, float]
+    previous_week: float
+    # Relative change; None when the earlier period had no revenue.
+    week_over_week: Optional[float] = None
+    previous_year: float
+    year_over_year: Optional[float] = None
 
 
 class TopProduct(BaseModel):
@@ -85,10 +111,122 @@ class TopProduct(BaseModel):
     category: str
     revenue: float
     quantity: int
+    revenue_error: Optional[float] = None
+    quantity_error: Optional[float] = None
 
 
 class CategorySummary(BaseModel):
     category: str
     revenue: float
     quantity: int
+    revenue_error: Optional[float] = None
+    quantity_error: Optional[float] = None
+
+
+class DashboardTotals(BaseModel):
+    order_count: int
+    distinct_customers: int
+    revenue: float
+    quantity: int
+    average_order_value: float
+
+
+class Dashboard(BaseModel):
+    sales_over_time: List[SalesPoint]
+    top_products: List[TopProduct]
+    category_summary: List[CategorySummary]
+    totals: DashboardTotals
+
+
+class RFMCustomer(BaseModel):
+    customer_id: int
+    name: str
+    recency_days: int
+    frequency: int
+    monetary: float
+    recency_score: int
+    frequency_score: int
+    monetary_score: int
+    rfm_score: str
+    segment: str
+
+
+class RFMSegment(BaseModel):
+    segment: str
+    customers: int
+    revenue: float
+
+
+class RFMReport(BaseModel):
+    as_of: Optional[datetime] = None
+    customer_count: int
+    segments: List[RFMSegment]
+    customers: List[RFMCustomer]
+
+
+class CohortPeriod(BaseModel):
+    period: int
+    active_customers: int
+    retention: float
+    revenue: float
+
+
+class Cohort(BaseModel):
+    cohort: date
+    customers: int
+    periods: List[CohortPeriod]
+
 
+class CubeFilters(BaseModel):
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    product_ids: List[int] = []
+    categories: List[str] = []
+    customer_ids: List[int] = []
+    statuses: List[str] = []
+
+
+class CubeQuery(BaseModel):
+    # Dimensions: day, week or month, product, category, customer, status.
+    dimensions: List[str] = []
+    # Measures: revenue, quantity, orders (distinct), customers (distinct).
+    measures: List[str] = ["revenue"]
+    filters: CubeFilters = CubeFilters()
+    # Result columns, "-" first for descending; defaults to the dimensions.
+    order_by: List[str] = []
+    limit: int = 1000
+
+
+class CubeResult(BaseModel):
+    # The table the aggregate ran on: daily_sales_rollup, orders, order_items, or orders_with_items.
+    source: str
+    columns: List[str]
+    rows: List[dict]
+
+
+class JobCreate(BaseModel):
+    # "export", or one of the analytics reports: "sales-over-time", "top-products",
+    # "category-summary", "dashboard". Fields that don't apply to the kind are ignored.
+    kind: str
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    format: str = "csv"
+    compression: Optional[str] = None
+    interval: str = "monthly"
+    limit: int = 5
+    engine: Optional[str] = None
+
+
+class JobRead(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: float
+    rows_processed: int
+    total_rows: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    result_url: Optional[str] = None
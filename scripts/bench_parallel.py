@@ -0,0 +1,101 @@
+"""
+Measure how the parallel analytics engine scales with its worker count.
+
+Times the pandas engine once as the single-process baseline, then the parallel
+engine at every --workers count, on an existing database (it is only read):
+
+    python scripts/generate_data.py --orders 1000000
+    python scripts/bench_parallel.py --workers 1,2,4,8 --output parallel_bench.json
+
+Each count gets a fresh pool and one untimed warm-up call, so worker start-up
+is not counted. Speedups are relative to the pandas engine; counts above the
+machine's CPU count can't scale further.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import analytics, cache, database, parallel
+
+CASES = [
+    ("sales_over_time", lambda db, engine: analytics.sales_over_time(db, "daily", None, None, engine)),
+    ("top_products", lambda db, engine: analytics.top_products(db, 10, None, None, engine)),
+    ("category_summary", lambda db, engine: analytics.category_summary(db, None, None, engine)),
+    ("dashboard", lambda db, engine: analytics.dashboard(db, "weekly", 10, None, None, engine)),
+]
+
+
+def _median_ms(call, db, engine: str, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        cache.clear()
+        started = time.perf_counter()
+        call(db, engine)
+        durations.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(durations), 1)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark the parallel analytics engine.")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url", default=database.DATABASE_URL)
+    parser.add_argument("--output", default="parallel_bench.json")
+    args = parser.parse_args()
+
+    connect_args = {"check_same_thread": False} if args.database_url.startswith("sqlite") else {}
+    bench_engine = create_engine(args.database_url, connect_args=connect_args)
+    database.apply_sqlite_pragmas(bench_engine)
+    db = sessionmaker(bind=bench_engine, autoflush=False)()
+    counts = [int(count) for count in args.workers.split(",") if count]
+    print(f"{os.cpu_count()} CPUs; shards per worker: {parallel.SHARDS_PER_WORKER}")
+
+    results = []
+    try:
+        for name, call in CASES:
+            baseline = _median_ms(call, db, "pandas", args.repeat)
+            print(f"{name}: pandas {baseline} ms")
+            result = {"case": name, "pandas_ms": baseline, "parallel": []}
+            for count in counts:
+                parallel.shutdown()
+                parallel.WORKERS = count
+                cache.clear()
+                call(db, "parallel")
+                elapsed = _median_ms(call, db, "parallel", args.repeat)
+                speedup = round(baseline / elapsed, 2)
+                print(f"  {count} workers: {elapsed} ms, {speedup}x")
+                result["parallel"].append({"workers": count, "median_ms": elapsed, "speedup": speedup})
+            results.append(result)
+    finally:
+        parallel.shutdown()
+        db.close()
+        bench_engine.dispose()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    run()
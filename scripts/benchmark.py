@@ -0,0 +1,185 @@
+"""
+Time every API endpoint against synthetic datasets of several sizes.
+
+Each (database, size) pair gets a fresh schema filled by generate_data.py, then
+every endpoint is called --repeat times through FastAPI's TestClient with the
+analytics cache cleared before each call. Results are written as JSON so runs
+from different commits can be diffed.
+
+    python scripts/benchmark.py --sizes 1000,10000,100000 --output bench.json
+    python scripts/benchmark.py --database-url postgresql+psycopg2://localhost/bench_scratch
+
+Every database passed with --database-url is wiped: point it at a scratch database.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, database
+from app.database import Base, get_db, get_read_db
+from app.main import app
+from generate_data import generate
+
+WINDOW = {"start_date": "2024-07-01T00:00:00", "end_date": "2024-09-30T23:59:59.999999"}
+
+READ_CASES = [
+    ("GET", "/health", {}),
+    ("GET", "/products", {"limit": 100}),
+    ("GET", "/customers", {"limit": 100}),
+    ("GET", "/orders", {"limit": 100}),
+    ("GET", "/orders", {"limit": 100, "customer_id": 1}),
+    ("GET", "/orders", {"limit": 100, "status": "refunded", **WINDOW}),
+    ("GET", "/analytics/sales-over-time", {"interval": "daily"}),
+    ("GET", "/analytics/sales-over-time", {"interval": "monthly"}),
+    ("GET", "/analytics/sales-over-time", {"interval": "monthly", "engine": "pandas"}),
+    ("GET", "/analytics/sales-over-time", {"interval": "weekly", "start_date": "2024-07-01T12:00:00"}),
+    ("GET", "/analytics/top-products", {"limit": 10}),
+    ("GET", "/analytics/top-products", {"limit": 10, "engine": "pandas"}),
+    ("GET", "/analytics/category-summary", {}),
+    ("GET", "/analytics/category-summary", WINDOW),
+    ("GET", "/analytics/category-summary", {"engine": "pandas"}),
+    ("GET", "/analytics/dashboard", {"interval": "weekly", "limit": 10}),
+    ("GET", "/analytics/dashboard", {"interval": "weekly", "limit": 10, "engine": "pandas"}),
+    ("GET", "/analytics/dashboard", {"interval": "weekly", "start_date": "2024-07-01T12:00:00"}),
+    ("GET", "/analytics/sales-export", {"format": "csv", **WINDOW}),
+    ("GET", "/analytics/sales-export", {"format": "parquet", **WINDOW}),
+    ("GET", "/analytics/sales-export", {"format": "arrow", **WINDOW}),
+    ("GET", "/analytics/cache-stats", {}),
+    ("GET", "/stats/db-pool", {}),
+]
+
+
+def _write_cases(product_id: int, customer_id: int) -> list:
+    order = {
+        "customer_id": customer_id,
+        "order_date": "2024-12-31T12:00:00",
+        "items": [{"product_id": product_id, "quantity": 2}],
+    }
+    return [
+        ("POST", "/products", {"json": {"name": "Bench item", "category": "Bench", "price": 1.5}}),
+        ("POST", "/orders", {"json": order}),
+        ("POST", "/orders/bulk", {"json": [order] * 100}),
+    ]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _time_case(client: TestClient, method: str, path: str, params: dict, repeat: int) -> dict:
+    durations, status, size = [], None, 0
+    for _ in range(repeat):
+        cache.clear()
+        started = time.perf_counter()
+        if method == "GET":
+            response = client.get(path, params=params)
+        else:
+            response = client.post(path, **params)
+        durations.append((time.perf_counter() - started) * 1000)
+        status, size = response.status_code, len(response.content)
+    durations.sort()
+    return {
+        "method": method,
+        "path": path,
+        "params": params if method == "GET" else {},
+        "status": status,
+        "bytes": size,
+        "runs": repeat,
+        "min_ms": round(durations[0], 3),
+        "median_ms": round(statistics.median(durations), 3),
+        "p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+    }
+
+
+def bench_database(url: str, size: int, repeat: int) -> list:
+    options = database.engine_options(url)
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    bench_engine = create_engine(url, connect_args=connect_args, **options)
+    database.apply_sqlite_pragmas(bench_engine)
+    BenchSession = sessionmaker(bind=bench_engine, autoflush=False, autocommit=False)
+
+    Base.metadata.drop_all(bind=bench_engine)
+    Base.metadata.create_all(bind=bench_engine)
+    with BenchSession() as db:
+        summary = generate(
+            db, size, products=max(50, size // 200), customers=max(100, size // 20), log=lambda _: None
+        )
+    print(f"[{bench_engine.dialect.name}] {size:,} orders generated in {summary['seconds']}s")
+
+    def override_get_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    results = []
+    try:
+        client = TestClient(app)
+        for method, path, params in READ_CASES + _write_cases(1, 1):
+            result = _time_case(client, method, path, params, repeat)
+            result.update(backend=bench_engine.dialect.name, dataset_orders=size)
+            results.append(result)
+            print(f"  {method} {path} {params if method == 'GET' else ''} -> {result['median_ms']} ms")
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_read_db, None)
+        bench_engine.dispose()
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated order counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--database-url",
+        action="append",
+        default=[],
+        help="scratch database to benchmark (repeatable); defaults to a temporary SQLite file",
+    )
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    with tempfile.TemporaryDirectory() as scratch:
+        urls = args.database_url or [f"sqlite:///{Path(scratch) / 'bench.db'}"]
+        results = [
+            result for url in urls for size in sizes for result in bench_database(url, size, args.repeat)
+        ]
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Wrote {len(results)} measurements to {args.output}")
+
+
+if __name__ == "__main__":
+    run()
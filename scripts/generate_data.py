@@ -0,0 +1,199 @@
+"""
+Deterministic synthetic sales data for load testing and benchmarks.
+
+Product and customer popularity follow a Zipf distribution, categories are
+unevenly sized, and order volume has weekly and yearly seasonality. Rows are
+written with batched executemany inserts using precomputed ids (PostgreSQL
+sequences are moved past them afterwards), and the daily rollup, the
+approximate-analytics sample and sketches and the customer summaries are
+rebuilt once at the end.
+
+    python scripts/generate_data.py --orders 1000000 --products 2000 --customers 50000
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from app import approx, customer_summary, models, partitioning, rollup
+from app.database import MONTHLY_PARTITIONS
+
+CATEGORIES = [
+    ("Electronics", 0.28, 80.0),
+    ("Stationery", 0.22, 6.0),
+    ("Furniture", 0.12, 180.0),
+    ("Kitchen", 0.12, 25.0),
+    ("Books", 0.10, 15.0),
+    ("Toys", 0.08, 20.0),
+    ("Garden", 0.05, 35.0),
+    ("Sports", 0.03, 45.0),
+]
+STATUSES = [("completed", 0.86), ("created", 0.08), ("cancelled", 0.04), ("refunded", 0.02)]
+BATCH_ORDERS = 10000
+
+
+def _zipf_cumulative(count: int, exponent: float) -> list:
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def _day_cumulative(start: datetime, days: int) -> list:
+    """Daily order weights: weekend peaks, a December high and a February low."""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        weekly = 1.3 if day.weekday() >= 5 else 1.0
+        yearly = 1.0 + 0.35 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 350) / 365.25)
+        weights.append(weekly * yearly)
+    return list(accumulate(weights))
+
+
+def _pick(rng: random.Random, cumulative: list) -> int:
+    return bisect_left(cumulative, rng.random() * cumulative[-1])
+
+
+def _next_id(db: Session, column) -> int:
+    return (db.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _advance_sequences(db: Session) -> None:
+    """Move PostgreSQL id sequences past the ids inserted explicitly above."""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("products", "customers", "orders"):
+        db.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(max(id), 0) + 1, false) "
+                f"FROM {table}"
+            )
+        )
+
+
+def generate(
+    db: Session,
+    orders: int,
+    products: int = 500,
+    customers: int = 5000,
+    days: int = 730,
+    end: datetime = datetime(2025, 1, 1),
+    seed: int = 7,
+    log=print,
+) -> dict:
+    """Append synthetic products, customers and orders and rebuild the derived tables.
+
+    The same arguments always produce the same rows on an empty database.
+    """
+    rng = random.Random(seed)
+    start = end - timedelta(days=days)
+    started = time.perf_counter()
+
+    if MONTHLY_PARTITIONS:
+        partitioning.ensure_partitions(db.get_bind(), start, end)
+
+    product_base = _next_id(db, models.Product.id)
+    category_cumulative = list(accumulate(share for _, share, _ in CATEGORIES))
+    product_rows = []
+    for offset in range(products):
+        name, _, typical_price = CATEGORIES[_pick(rng, category_cumulative)]
+        price = round(typical_price * rng.lognormvariate(0, 0.5), 2)
+        product_rows.append(
+            {"id": product_base + offset, "name": f"{name} item {offset + 1}", "category": name, "price": price}
+        )
+    db.execute(insert(models.Product), product_rows)
+
+    customer_base = _next_id(db, models.Customer.id)
+    db.execute(
+        insert(models.Customer),
+        [
+            {
+                "id": customer_base + offset,
+                "name": f"Customer {customer_base + offset}",
+                "email": f"customer{customer_base + offset}@example.com",
+            }
+            for offset in range(customers)
+        ],
+    )
+
+    product_cumulative = _zipf_cumulative(products, 1.1)
+    customer_cumulative = _zipf_cumulative(customers, 0.6)
+    day_cumulative = _day_cumulative(start, days)
+    status_cumulative = list(accumulate(share for _, share in STATUSES))
+    next_order_id = _next_id(db, models.Order.id)
+
+    for batch_start in range(0, orders, BATCH_ORDERS):
+        order_rows, item_rows = [], []
+        for _ in range(min(BATCH_ORDERS, orders - batch_start)):
+            order_date = start + timedelta(
+                days=_pick(rng, day_cumulative), seconds=rng.randrange(86400)
+            )
+            order_rows.append(
+                {
+                    "id": next_order_id,
+                    "customer_id": customer_base + _pick(rng, customer_cumulative),
+                    "order_date": order_date,
+                    "status": STATUSES[_pick(rng, status_cumulative)][0],
+                }
+            )
+            for _ in range(min(1 + int(rng.expovariate(0.8)), 8)):
+                product = product_rows[_pick(rng, product_cumulative)]
+                item_rows.append(
+                    {
+                        "order_id": next_order_id,
+                        "product_id": product["id"],
+                        "quantity": min(1 + int(rng.expovariate(0.7)), 20),
+                        "unit_price": product["price"],
+                        "order_date": order_date,
+                    }
+                )
+            next_order_id += 1
+        db.execute(insert(models.Order), order_rows)
+        db.execute(insert(models.OrderItem), item_rows)
+        db.commit()
+        log(f"  {batch_start + len(order_rows):,} / {orders:,} orders")
+    _advance_sequences(db)
+
+    rollup_rows = rollup.rebuild(db)
+    approx.rebuild(db)
+    customer_summary.rebuild(db)
+    db.commit()
+    return {
+        "products": products,
+        "customers": customers,
+        "orders": orders,
+        "rollup_rows": rollup_rows,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Generate synthetic sales data.")
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from app.database import Base, db_session, engine
+
+    Base.metadata.create_all(bind=engine)
+    partitioning.prepare(engine)
+    with db_session() as db:
+        summary = generate(
+            db, args.orders, args.products, args.customers, args.days, seed=args.seed
+        )
+    print(f"Generated {summary}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+"""
+EXPLAIN every analytics and list query against the configured database and
+flag sequential scans of the order tables.
+
+Exits with status 1 when a scan is found, so it can run in CI.
+Pass --create-missing to add model indexes that an existing database lacks.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import index_advisor
+from app.database import SessionLocal, engine
+
+
+def run(create_missing: bool = False) -> int:
+    if create_missing:
+        for name in index_advisor.create_missing_indexes(engine):
+            print(f"Created index {name}")
+
+    db = SessionLocal()
+    try:
+        report = index_advisor.run(db)
+    finally:
+        db.close()
+
+    flagged = 0
+    for entry in report:
+        marker = "SCAN" if entry["sequential_scans"] else "ok"
+        print(f"[{marker}] {entry['query']}")
+        for line in entry["plan"]:
+            print(f"    {line}")
+        if entry["sequential_scans"]:
+            flagged += 1
+            print(f"    -> sequential scan of {', '.join(entry['sequential_scans'])}")
+
+    print(f"{len(report)} statements explained, {flagged} with sequential scans.")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--create-missing", action="store_true", help="create missing model indexes first")
+    args = parser.parse_args()
+    sys.exit(run(args.create_missing))
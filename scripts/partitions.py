@@ -0,0 +1,82 @@
+"""
+Maintain the time partitions of the order tables.
+
+    python scripts/partitions.py status
+    python scripts/partitions.py create --months-ahead 6
+    python scripts/partitions.py retire --before 2023-01-01
+
+With ORDER_PARTITIONING=monthly on PostgreSQL, "create" adds monthly partitions
+from the first order up to --months-ahead months from now, and "retire" detaches
+every partition that ends before --before. Elsewhere "retire" moves those orders
+into the archive tables. Retired days stay in the daily rollup.
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func
+
+from app import cache, models, partitioning
+from app.database import MONTHLY_PARTITIONS, Base, db_session, engine
+
+
+def status() -> None:
+    with db_session() as db:
+        for entry in partitioning.describe(db):
+            print("  ".join(f"{key}={value}" for key, value in entry.items()))
+
+
+def create(months_ahead: int) -> None:
+    if not MONTHLY_PARTITIONS:
+        sys.exit("Partitions are only used with ORDER_PARTITIONING=monthly on PostgreSQL.")
+    with db_session() as db:
+        first_order = db.query(func.min(models.Order.order_date)).scalar()
+    today = date.today()
+    created = partitioning.ensure_partitions(
+        engine, first_order or today, today + timedelta(days=31 * months_ahead)
+    )
+    for name in created:
+        print(f"Created partition {name}")
+    print(f"{len(created)} partitions created.")
+
+
+def retire(before: date) -> None:
+    if MONTHLY_PARTITIONS:
+        for name in partitioning.detach_before(engine, before):
+            print(f"Detached partition {name}")
+    else:
+        with db_session() as db:
+            moved = partitioning.archive_before(db, before)
+        for table, count in moved.items():
+            print(f"Archived {count} rows from {table}")
+    cache.bump_version()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list partitions or live/archived row counts")
+    create_parser = commands.add_parser("create", help="create monthly partitions")
+    create_parser.add_argument("--months-ahead", type=int, default=partitioning.MONTHS_AHEAD)
+    retire_parser = commands.add_parser("retire", help="detach or archive months before a date")
+    retire_parser.add_argument(
+        "--before", type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(), required=True
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    partitioning.prepare(engine)
+    if args.command == "status":
+        status()
+    elif args.command == "create":
+        create(args.months_ahead)
+    else:
+        retire(args.before)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,32 @@
+"""
+Rebuild the daily_sales_rollup table from the raw order tables, then the
+sample and sketches used by accuracy=approx analytics and the per-customer
+summaries behind the RFM and cohort reports.
+
+Run this once after upgrading an existing database, or whenever orders were
+written without going through the API.
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import approx, customer_summary, rollup
+from app.database import Base, db_session, engine
+
+
+def run():
+    Base.metadata.create_all(bind=engine)
+    with db_session() as db:
+        row_count = rollup.rebuild(db)
+        summary = approx.rebuild(db)
+        customers, customer_months = customer_summary.rebuild(db)
+
+    print(f"Rebuilt daily_sales_rollup with {row_count} rows.")
+    print(f"Resampled {summary['sample_rows']} order lines and sketched {summary['sketch_months']} months.")
+    print(f"Summarized {customers} customers over {customer_months} customer months.")
+
+
+if __name__ == "__main__":
+    run()
@@ -8,7 +8,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from sqlalchemy import text
 
-from app import crud, schemas
+from app import crud, partitioning, schemas
 from app.database import db_session
 
 random.seed(7)
@@ -17,10 +17,19 @@ random.seed(7)
 def run():
     with db_session() as db:
         # SQLAlchemy 2.0 requires text() wrapper for raw SQL
+        db.execute(text("DELETE FROM daily_sales_rollup"))
+        db.execute(text("DELETE FROM sales_sample"))
+        db.execute(text("DELETE FROM sample_state"))
+        db.execute(text("DELETE FROM product_sketches"))
+        db.execute(text("DELETE FROM customer_months"))
+        db.execute(text("DELETE FROM customer_summaries"))
+        db.execute(text("DELETE FROM order_items_archive"))
+        db.execute(text("DELETE FROM orders_archive"))
         db.execute(text("DELETE FROM order_items"))
         db.execute(text("DELETE FROM orders"))
         db.execute(text("DELETE FROM products"))
         db.execute(text("DELETE FROM customers"))
+        partitioning.mark_orders_removed(db)
 
         products = [
             schemas.ProductCreate(name="Notebook", category="Stationery", price=5.0),
@@ -5,8 +5,8 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from app import crud, schemas
-from app.database import Base, get_db
+from app import cache, columnar, crud, jobs, live, schemas
+from app.database import Base, get_db, get_read_db
 from app.main import app
 
 TEST_DB_URL = "sqlite:///./test.db"
@@ -23,6 +23,7 @@ def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -36,6 +37,8 @@ def create_tables():
 def db_session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    cache.clear()
+    live.reset()
     db = TestingSessionLocal()
     try:
         yield db
@@ -52,9 +55,40 @@ def client(db_session):
             pass
 
     app.dependency_overrides[get_db] = _override
+    app.dependency_overrides[get_read_db] = _override
     return TestClient(app)
 
 
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path / "jobs"))
+    yield jobs
+    jobs.shutdown()
+
+
+@pytest.fixture
+def columnar_replica(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, "COLUMNAR_DIR", str(tmp_path / "columnar"))
+    return columnar
+
+
+@pytest.fixture
+def profiled_client(tmp_path, monkeypatch):
+    """A separate app sharing the main app's routes, with profiling installed until teardown."""
+    from fastapi import FastAPI
+
+    from app import profiling
+
+    monkeypatch.setattr(profiling, "SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_MS", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    profiled_app = FastAPI()
+    profiled_app.router.routes.extend(app.router.routes)
+    profiling.install(profiled_app)
+    yield TestClient(profiled_app)
+    profiling.uninstall(profiled_app)
+
+
 def seed_sample_data(db):
     products = [
         crud.create_product(db, schemas.ProductCreate(name="Notebook", category="Stationery", price=5)),
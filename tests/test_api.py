@@ -1,7 +1,16 @@
-from datetime import datetime
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
 
+import pyarrow.parquet as pq
 import pytest
 
+from sqlalchemy import text
+
+from app import analytics, approx, cache, customer_summary, jobs, live, models, olap, parallel, partitioning, rollup
+
 
 def test_health(client):
     response = client.get("/health")
@@ -62,3 +71,904 @@ def test_invalid_interval_error(seeded_client):
     response = seeded_client.get("/analytics/sales-over-time", params={"interval": "yearly"})
     assert response.status_code == 400
 
+
+@pytest.mark.parametrize("interval", ["daily", "weekly", "monthly"])
+def test_sales_over_time_engine_parity(seeded_client, interval):
+    results = [
+        seeded_client.get(
+            "/analytics/sales-over-time", params={"interval": interval, "engine": engine}
+        ).json()
+        for engine in ("sql", "pandas")
+    ]
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("path", ["/analytics/top-products", "/analytics/category-summary"])
+def test_aggregate_engine_parity(seeded_client, path):
+    sql_rows = seeded_client.get(path, params={"engine": "sql"}).json()
+    pandas_rows = seeded_client.get(path, params={"engine": "pandas"}).json()
+    assert sql_rows == pandas_rows
+
+
+@pytest.mark.parametrize("engine", ["sql", "pandas"])
+def test_sales_trends_windows_and_comparisons(seeded_client, db_session, engine):
+    lamp = db_session.query(models.Product).filter_by(name="Desk Lamp").one()
+    customer = db_session.query(models.Customer).first()
+    seeded_client.post(
+        "/orders",
+        json={
+            "customer_id": customer.id,
+            "order_date": "2025-01-08T15:00:00",
+            "items": [{"product_id": lamp.id, "quantity": 1}],
+        },
+    )
+
+    for interval in ("daily", "weekly", "monthly"):
+        params = {"interval": interval, "engine": engine}
+        trends = seeded_client.get("/analytics/sales-trends", params=params).json()
+        series = seeded_client.get("/analytics/sales-over-time", params=params).json()
+        assert [(row["period_start"], row["revenue"]) for row in trends] == [
+            (row["period_start"], row["revenue"]) for row in series
+        ]
+
+    params = {"engine": engine, "windows": "7,30", "start_date": "2024-01-08T00:00:00"}
+    rows = seeded_client.get("/analytics/sales-trends", params=params).json()
+    trends = {row["period_start"][:10]: row for row in rows}
+    assert min(trends) == "2024-01-08"
+    assert trends["2024-01-08"]["rolling"] == {"7d": 80.0, "30d": 135.0}
+    assert (trends["2024-01-08"]["previous_week"], trends["2024-01-08"]["week_over_week"]) == (55.0, 0.4545)
+    assert trends["2024-01-08"]["year_over_year"] is None
+    assert (trends["2025-01-08"]["previous_year"], trends["2025-01-08"]["year_over_year"]) == (80.0, -0.5)
+    assert trends["2025-01-08"]["rolling"] == {"7d": 40.0, "30d": 40.0}
+    assert seeded_client.get("/analytics/sales-trends", params={"windows": "0,7"}).status_code == 400
+
+
+def test_invalid_engine_error(seeded_client):
+    response = seeded_client.get("/analytics/category-summary", params={"engine": "spark"})
+    assert response.status_code == 400
+
+
+def test_rollup_maintained_on_order_write(seeded_client, db_session):
+    order = (models.DailySalesRollup.day, models.DailySalesRollup.category)
+    rows = db_session.query(models.DailySalesRollup).order_by(*order).all()
+    assert [(row.day.isoformat(), row.category, row.revenue, row.quantity) for row in rows] == [
+        ("2024-01-01", "Electronics", 40.0, 1),
+        ("2024-01-01", "Stationery", 15.0, 3),
+        ("2024-01-08", "Electronics", 80.0, 2),
+    ]
+
+    assert rollup.rebuild(db_session) == 3
+    rebuilt = db_session.query(models.DailySalesRollup).order_by(*order).all()
+    assert [(row.day, row.revenue) for row in rebuilt] == [(row.day, row.revenue) for row in rows]
+
+
+@pytest.mark.parametrize("path", ["/analytics/top-products", "/analytics/category-summary"])
+def test_rollup_matches_raw_aggregates(seeded_client, monkeypatch, path):
+    params = {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-31T23:59:59.999999"}
+    from_rollup = seeded_client.get(path, params=params).json()
+    monkeypatch.setattr(rollup, "USE_DAILY_ROLLUP", False)
+    cache.clear()
+    assert seeded_client.get(path, params=params).json() == from_rollup
+
+
+@pytest.mark.parametrize("use_rollup", [True, False])
+@pytest.mark.parametrize("engine", ["sql", "pandas"])
+@pytest.mark.parametrize("interval", ["daily", "weekly", "monthly"])
+def test_dashboard_matches_single_metric_endpoints(seeded_client, monkeypatch, engine, interval, use_rollup):
+    monkeypatch.setattr(rollup, "USE_DAILY_ROLLUP", use_rollup)
+    params = {"engine": engine, "limit": 1}
+    body = seeded_client.get("/analytics/dashboard", params={**params, "interval": interval}).json()
+    assert body["sales_over_time"] == seeded_client.get(
+        "/analytics/sales-over-time", params={"engine": engine, "interval": interval}
+    ).json()
+    assert body["top_products"] == seeded_client.get("/analytics/top-products", params=params).json()
+    assert body["category_summary"] == seeded_client.get(
+        "/analytics/category-summary", params={"engine": engine}
+    ).json()
+    assert body["totals"] == {
+        "order_count": 2,
+        "distinct_customers": 2,
+        "revenue": 135.0,
+        "quantity": 6,
+        "average_order_value": 67.5,
+    }
+
+
+def test_dashboard_rollup_matches_raw(seeded_client, monkeypatch):
+    params = {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-07T23:59:59.999999"}
+    from_rollup = seeded_client.get("/analytics/dashboard", params=params).json()
+    assert from_rollup["totals"]["order_count"] == 1
+    monkeypatch.setattr(rollup, "USE_DAILY_ROLLUP", False)
+    cache.clear()
+    assert seeded_client.get("/analytics/dashboard", params=params).json() == from_rollup
+    assert seeded_client.get("/analytics/dashboard", params={"interval": "yearly"}).status_code == 400
+
+
+def test_archive_moves_old_orders_and_keeps_rollup(seeded_client, db_session):
+    params = {"start_date": "2024-01-01T00:00:00", "end_date": "2024-01-31T23:59:59.999999"}
+    before = seeded_client.get("/analytics/category-summary", params=params).json()
+
+    moved = partitioning.archive_before(db_session, datetime(2024, 2, 10))
+    db_session.commit()
+    assert moved == {"order_items": 3, "orders": 2}
+    assert db_session.query(models.ArchivedOrderItem.order_date).distinct().count() == 2
+    assert seeded_client.get("/orders").json() == []
+
+    # Archived days survive a rebuild and still answer day-aligned queries.
+    assert rollup.rebuild(db_session) == 3
+    cache.clear()
+    assert seeded_client.get("/analytics/category-summary", params=params).json() == before
+
+
+def test_line_dates_backfilled_on_existing_database(seeded_client, db_session):
+    bind = db_session.get_bind()
+    with bind.begin() as connection:
+        connection.execute(text("ALTER TABLE order_items DROP COLUMN order_date"))
+    assert partitioning.ensure_line_dates(bind) is True
+    assert partitioning.ensure_line_dates(bind) is False
+    db_session.expire_all()
+    lines = db_session.query(models.OrderItem).all()
+    assert all(line.order_date == line.order.order_date for line in lines)
+
+
+def test_approx_analytics_exact_while_sample_holds_every_line(seeded_client):
+    for path in ("/analytics/sales-over-time", "/analytics/top-products", "/analytics/category-summary"):
+        exact = seeded_client.get(path).json()
+        estimated = seeded_client.get(path, params={"accuracy": "approx"}).json()
+        assert [row["revenue"] for row in estimated] == [row["revenue"] for row in exact]
+        assert all("revenue_error" not in row for row in exact)
+    # The sample is the whole population, so its intervals collapse to zero.
+    sampled = seeded_client.get("/analytics/category-summary", params={"accuracy": "approx"}).json()
+    assert all(row["revenue_error"] == 0 for row in sampled)
+    assert seeded_client.get("/analytics/top-products", params={"accuracy": "fuzzy"}).status_code == 400
+
+
+def test_approx_error_bounds_cover_exact_values(client, monkeypatch):
+    monkeypatch.setattr(approx, "SAMPLE_SIZE", 200)
+    monkeypatch.setattr(approx, "_reservoir", random.Random(5))
+    rng = random.Random(11)
+    customer = client.post("/customers", json={"name": "Dana", "email": "dana@example.com"}).json()
+    categories = ["Books", "Garden", "Toys"]
+    products = [
+        client.post(
+            "/products", json={"name": f"Item {index}", "category": categories[index % 3], "price": 5 + index}
+        ).json()
+        for index in range(12)
+    ]
+    orders = [
+        {
+            "customer_id": customer["id"],
+            "order_date": datetime(2024, rng.randint(1, 6), rng.randint(1, 28), 12).isoformat(),
+            "items": [
+                {"product_id": rng.choice(products)["id"], "quantity": rng.randint(1, 5)}
+                for _ in range(rng.randint(1, 3))
+            ],
+        }
+        for _ in range(600)
+    ]
+    assert client.post("/orders/bulk", json=orders).json()["created"] == 600
+
+    params = {"start_date": "2024-01-15T06:00:00", "end_date": "2024-05-20T18:00:00"}
+    exact = {row["category"]: row for row in client.get("/analytics/category-summary", params=params).json()}
+    estimated = client.get("/analytics/category-summary", params={**params, "accuracy": "approx"}).json()
+    assert [row["category"] for row in estimated] == sorted(exact)
+    for row in estimated:
+        assert 0 < row["revenue_error"] < row["revenue"]
+        assert abs(row["revenue"] - exact[row["category"]]["revenue"]) <= row["revenue_error"]
+
+    # Whole months come from the sketches, the partial ones at each end from the sample.
+    top = client.get("/analytics/top-products", params={**params, "limit": 3}).json()
+    top_estimated = client.get("/analytics/top-products", params={**params, "limit": 3, "accuracy": "approx"}).json()
+    for row, estimate in zip(top, top_estimated):
+        assert abs(row["revenue"] - estimate["revenue"]) <= estimate["revenue_error"]
+
+
+def test_columnar_engine_matches_and_refreshes_incrementally(
+    seeded_client, db_session, columnar_replica, monkeypatch
+):
+    from sqlalchemy import event
+
+    requests = [
+        ("/analytics/sales-over-time", {"interval": "weekly"}),
+        ("/analytics/top-products", {"limit": 5}),
+        ("/analytics/category-summary", {"start_date": "2024-01-02T00:00:00"}),
+        ("/analytics/dashboard", {"interval": "daily"}),
+    ]
+
+    def assert_matches_pandas():
+        for path, params in requests:
+            expected = seeded_client.get(path, params={**params, "engine": "pandas"}).json()
+            assert seeded_client.get(path, params={**params, "engine": "columnar"}).json() == expected
+
+    def assert_export_matches_sql():
+        monkeypatch.setattr(analytics, "ANALYTICS_ENGINE", "columnar")
+        columnar_csv = seeded_client.get("/analytics/sales-export").text
+        columnar_rows = analytics.export_row_count(db_session, None, None)
+        monkeypatch.setattr(analytics, "ANALYTICS_ENGINE", "sql")
+        assert columnar_csv == seeded_client.get("/analytics/sales-export").text
+        assert columnar_rows == analytics.export_row_count(db_session, None, None)
+
+    assert_matches_pandas()
+    state = columnar_replica.refresh(db_session)
+    assert (state["watermark"], state["recent_orders"], len(state["parts"])) == (2, 0, 1)
+
+    # An unchanged replica is checked with index lookups, never a count of every order.
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    columnar_replica.refresh(db_session)
+    event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert all("count(" not in statement or "orders.id >" in statement for statement in statements)
+
+    # New orders are appended as their own parts; a backdated one makes the parts
+    # overlap, and one-row batches make the export merge them row by row.
+    monkeypatch.setattr(columnar_replica, "REFRESH_BATCH_ROWS", 1)
+    for order_date in ("2024-02-20T08:30:00", "2023-12-31T23:00:00"):
+        seeded_client.post(
+            "/orders",
+            json={"customer_id": 1, "order_date": order_date, "items": [{"product_id": 1, "quantity": 4}]},
+        )
+        assert_matches_pandas()
+    state = columnar_replica.refresh(db_session)
+    assert (state["watermark"], state["recent_orders"], len(state["parts"])) == (4, 1, 3)
+    assert_export_matches_sql()
+
+    # Past the part limit, the parts are merged into one sorted part.
+    monkeypatch.setattr(columnar_replica, "COLUMNAR_MAX_PARTS", 3)
+    seeded_client.post(
+        "/orders",
+        json={"customer_id": 2, "order_date": "2024-01-05T12:00:00", "items": [{"product_id": 2, "quantity": 1}]},
+    )
+    assert_export_matches_sql()
+    state = columnar_replica.refresh(db_session)
+    assert (state["watermark"], len(state["parts"])) == (5, 1)
+    dates = pq.read_table(columnar_replica.replica_dir(db_session) / state["parts"][0])["order_date"]
+    assert dates.to_pylist() == sorted(dates.to_pylist())
+
+    # Archiving changes the order generation, so the replica is rebuilt.
+    generation = state["generation"]
+    partitioning.archive_before(db_session, datetime(2024, 2, 1))
+    db_session.commit()
+    cache.bump_version()
+    assert_matches_pandas()
+    assert_export_matches_sql()
+    state = columnar_replica.refresh(db_session)
+    assert state["generation"] != generation
+    assert (state["watermark"], len(state["parts"])) == (3, 1)
+    assert columnar_replica.count_lines(db_session, None, None) == 1
+
+
+def test_parallel_engine_matches_pandas(seeded_client, db_session, monkeypatch):
+    start, end = datetime(2023, 12, 30), datetime(2024, 1, 9)
+    shards = parallel.date_shards(db_session, start, end, 4)
+    assert shards[0][0] == start and shards[-1][1] == end
+    assert all(later[0] - earlier[1] == timedelta(microseconds=1) for earlier, later in zip(shards, shards[1:]))
+
+    monkeypatch.setattr(parallel, "WORKERS", 2)
+    try:
+        for path, params in [
+            ("/analytics/sales-over-time", {"interval": "daily"}),
+            ("/analytics/top-products", {"limit": 2, "start_date": "2024-01-01T00:00:01"}),
+            ("/analytics/category-summary", {}),
+            ("/analytics/dashboard", {"interval": "weekly"}),
+        ]:
+            expected = seeded_client.get(path, params={**params, "engine": "pandas"}).json()
+            assert seeded_client.get(path, params={**params, "engine": "parallel"}).json() == expected
+    finally:
+        parallel.shutdown()
+
+
+def _wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/analytics/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.2)
+
+
+def test_customer_rfm_and_cohorts_from_maintained_summaries(seeded_client, db_session):
+    alice, bob = (customer.id for customer in db_session.query(models.Customer).order_by(models.Customer.id))
+    notebook, lamp = (product.id for product in db_session.query(models.Product).order_by(models.Product.id))
+    def order(customer_id, order_date, product_id, quantity):
+        items = [{"product_id": product_id, "quantity": quantity}]
+        return {"customer_id": customer_id, "order_date": order_date, "items": items}
+
+    seeded_client.post("/orders", json=order(alice, "2024-02-15T09:00:00", notebook, 1))
+    seeded_client.post(
+        "/orders/bulk",
+        json=[order(bob, "2024-03-03T12:00:00", lamp, 1), order(alice, "2024-03-20T18:00:00", notebook, 2)],
+    )
+
+    def snapshot():
+        summaries = db_session.query(models.CustomerSummary).order_by(models.CustomerSummary.customer_id)
+        months = db_session.query(models.CustomerMonth).order_by(
+            models.CustomerMonth.customer_id, models.CustomerMonth.month
+        )
+        return (
+            [(row.first_order_date, row.last_order_date, row.order_count, row.revenue) for row in summaries],
+            [(row.customer_id, row.month.isoformat(), row.order_count, row.revenue) for row in months],
+        )
+
+    maintained = snapshot()
+    assert maintained[0] == [
+        (datetime(2024, 1, 1), datetime(2024, 3, 20, 18), 3, 70.0),
+        (datetime(2024, 1, 8), datetime(2024, 3, 3, 12), 2, 120.0),
+    ]
+    assert customer_summary.rebuild(db_session) == (2, 5)
+    assert snapshot() == maintained
+
+    rfm = seeded_client.get("/analytics/customers/rfm").json()
+    assert rfm["as_of"] == "2024-03-20T18:00:00"
+    assert rfm["customer_count"] == 2
+    assert [(row["name"], row["rfm_score"], row["recency_days"], row["segment"]) for row in rfm["customers"]] == [
+        ("Alice", "221", 0, "hibernating"),
+        ("Bob", "112", 17, "lost"),
+    ]
+    top = seeded_client.get("/analytics/customers/rfm", params={"limit": 1}).json()["customers"]
+    assert [row["name"] for row in top] == ["Alice"]
+
+    cohorts = seeded_client.get("/analytics/cohorts").json()
+    assert cohorts == [
+        {
+            "cohort": "2024-01-01",
+            "customers": 2,
+            "periods": [
+                {"period": 0, "active_customers": 2, "retention": 1.0, "revenue": 135.0},
+                {"period": 1, "active_customers": 1, "retention": 0.5, "revenue": 5.0},
+                {"period": 2, "active_customers": 2, "retention": 1.0, "revenue": 50.0},
+            ],
+        }
+    ]
+    first_period = seeded_client.get("/analytics/cohorts", params={"periods": 1}).json()[0]["periods"]
+    assert first_period == cohorts[0]["periods"][:1]
+    assert seeded_client.get("/analytics/cohorts", params={"start_date": "2024-02-01T00:00:00"}).json() == []
+
+
+def test_cube_query_matches_endpoints_and_reuses_plans(seeded_client):
+    olap.clear_plans()
+
+    def query(**body):
+        response = seeded_client.post("/analytics/query", json=body)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    by_category = query(dimensions=["category"], measures=["revenue", "quantity"], order_by=["-revenue"])
+    assert by_category["source"] == "daily_sales_rollup"
+    assert by_category["rows"] == seeded_client.get("/analytics/category-summary").json()
+
+    # Counting orders needs the order lines; the revenue must not change.
+    with_orders = query(dimensions=["category"], measures=["revenue", "orders"], order_by=["-revenue"])
+    assert with_orders["source"] == "order_items"
+    assert [(row["category"], row["revenue"], row["orders"]) for row in with_orders["rows"]] == [
+        ("Electronics", 120.0, 2),
+        ("Stationery", 15.0, 1),
+    ]
+
+    top = query(dimensions=["product"], measures=["revenue", "quantity"], order_by=["-revenue"], limit=1)
+    expected = seeded_client.get("/analytics/top-products", params={"limit": 1}).json()
+    assert [{**row, "category": "Electronics"} for row in top["rows"]] == expected
+
+    assert query(dimensions=["status"], measures=["orders", "customers"])["rows"] == [
+        {"status": "completed", "orders": 2, "customers": 2}
+    ]
+    for customer, revenue in (("Alice", 55.0), ("Bob", 80.0)):
+        body = query(
+            dimensions=["customer", "month"],
+            measures=["revenue"],
+            filters={"start_date": "2024-01-01T00:00:00", "customer_ids": [1 if customer == "Alice" else 2]},
+        )
+        assert body["source"] == "orders_with_items"
+        assert [(row["customer_name"], row["month"], row["revenue"]) for row in body["rows"]] == [
+            (customer, "2024-01-01", revenue)
+        ]
+    # The second customer query only changed filter values, so it reused the first one's plan.
+    assert seeded_client.get("/analytics/cache-stats").json()["query_plans"] == {
+        "hits": 1,
+        "misses": 5,
+        "entries": 5,
+    }
+
+    assert seeded_client.post("/analytics/query", json={"dimensions": ["region"]}).status_code == 400
+    assert seeded_client.post("/analytics/query", json={"order_by": ["revenue"], "measures": []}).status_code == 400
+    assert seeded_client.post("/analytics/query", json={"order_by": ["quantity"]}).status_code == 400
+
+
+def test_live_stream_pushes_todays_aggregates(seeded_client, db_session, monkeypatch):
+    monkeypatch.setattr(live, "LIVE_PUSH_INTERVAL", 0.01)
+
+    def receive_until(websocket, orders):
+        while True:
+            snapshot = websocket.receive_json()
+            if snapshot["orders"] == orders:
+                return snapshot
+
+    with seeded_client.websocket_connect("/analytics/stream") as first:
+        # The sample orders are from 2024, so today starts empty.
+        initial = first.receive_json()
+        assert (initial["day"], initial["revenue"], initial["top_products"]) == (
+            datetime.utcnow().date().isoformat(),
+            0,
+            [],
+        )
+        seeded_client.post("/orders", json={"customer_id": 1, "items": [{"product_id": 1, "quantity": 2}]})
+        seeded_client.post(
+            "/orders/bulk",
+            json=[
+                {"customer_id": 2, "items": [{"product_id": 2, "quantity": 1}]},
+                {"customer_id": 2, "order_date": "2024-05-01T00:00:00", "items": [{"product_id": 2, "quantity": 9}]},
+            ],
+        )
+        pushed = receive_until(first, 2)
+        assert (pushed["revenue"], pushed["quantity"]) == (50.0, 3)
+        assert [(row["product_name"], row["revenue"]) for row in pushed["top_products"]] == [
+            ("Desk Lamp", 40.0),
+            ("Notebook", 10.0),
+        ]
+        # Later watchers share the same snapshot, and a fresh seed agrees with the events.
+        with seeded_client.websocket_connect("/analytics/stream") as second:
+            assert second.receive_json() == pushed
+        live.aggregates.seed(db_session)
+        assert {**live.aggregates.snapshot(), "sequence": None} == {**pushed, "sequence": None}
+        # An event arriving late for an order the seed already counted is ignored.
+        latest = db_session.query(models.Order).order_by(models.Order.id.desc()).first()
+        live.publish_order(latest.id, datetime.utcnow(), [(1, "Notebook", "Stationery", 5, 5.0)])
+        assert live.aggregates.snapshot()["revenue"] == 50.0
+
+    async def first_event():
+        events = live.sse_events()
+        try:
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    event = asyncio.run(first_event())
+    assert event.startswith("event: snapshot\ndata: {") and event.endswith("\n\n")
+    assert live.subscriber_count() == 0
+
+
+def test_background_jobs_match_direct_endpoints(seeded_client, job_queue):
+    report = seeded_client.post("/analytics/jobs", json={"kind": "category-summary"})
+    export = seeded_client.post("/analytics/jobs", json={"kind": "export", "format": "csv"})
+    assert report.status_code == export.status_code == 202
+    assert report.json()["status"] == "queued"
+
+    job = _wait_for_job(seeded_client, report.json()["id"])
+    assert job["status"] == "succeeded" and job["progress"] == 1.0
+    result = seeded_client.get(job["result_url"])
+    assert result.headers["content-type"] == "application/json"
+    assert result.json() == seeded_client.get("/analytics/category-summary").json()
+
+    job = _wait_for_job(seeded_client, export.json()["id"])
+    assert job["status"] == "succeeded"
+    assert job["rows_processed"] == job["total_rows"] == 3
+    result = seeded_client.get(job["result_url"])
+    assert result.text == seeded_client.get("/analytics/sales-export").text
+
+
+def test_background_jobs_survive_dead_workers_and_restarts(seeded_client, job_queue):
+    def submit():
+        return seeded_client.post("/analytics/jobs", json={"kind": "category-summary"}).json()["id"]
+
+    assert _wait_for_job(seeded_client, submit())["status"] == "succeeded"
+    # Killing the workers breaks the pool; the next submission starts a new one.
+    broken = jobs._executor
+    for process in list(broken._processes.values()):
+        process.kill()
+    deadline = time.monotonic() + 10
+    while not broken._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _wait_for_job(seeded_client, submit())["status"] == "succeeded"
+    assert jobs._executor is not broken
+
+    # A job killed mid-run fails instead of staying "running".
+    job_id = submit()
+    for process in list(jobs._executor._processes.values()):
+        process.kill()
+    job = _wait_for_job(seeded_client, job_id)
+    assert job["status"] in ("succeeded", "failed")
+    assert job["status"] == "succeeded" or "exited unexpectedly" in job["error"]
+
+    # Jobs left unfinished by an API process that has exited fail on the next start.
+    queue = jobs._queue(jobs.JOBS_DIR)
+    with queue.begin() as connection:
+        connection.execute(
+            jobs.job_table.insert().values(
+                id="orphan",
+                kind="dashboard",
+                params="{}",
+                status="running",
+                created_at=datetime.utcnow(),
+                owner=f"{jobs.socket.gethostname()}:999999999",
+            )
+        )
+    jobs._recovered.clear()
+    orphan = seeded_client.get("/analytics/jobs/orphan").json()
+    assert orphan["status"] == "failed" and "exited" in orphan["error"]
+
+
+def test_background_job_validation_limits_and_expiry(seeded_client, job_queue, monkeypatch):
+    assert seeded_client.post("/analytics/jobs", json={"kind": "pivot"}).status_code == 400
+    assert seeded_client.post("/analytics/jobs", json={"kind": "export", "format": "xml"}).status_code == 400
+    assert seeded_client.get("/analytics/jobs/missing").status_code == 404
+
+    job = seeded_client.post("/analytics/jobs", json={"kind": "top-products", "limit": 1}).json()
+    with monkeypatch.context() as patch:
+        patch.setattr(jobs, "JOB_MAX_PENDING", 0)
+        assert seeded_client.post("/analytics/jobs", json={"kind": "dashboard"}).status_code == 429
+
+    job = _wait_for_job(seeded_client, job["id"])
+    assert [row["product_name"] for row in seeded_client.get(job["result_url"]).json()] == ["Desk Lamp"]
+    with jobs._queue(jobs.JOBS_DIR).begin() as connection:
+        connection.execute(jobs.job_table.update().values(expires_at=datetime(2000, 1, 1)))
+    assert seeded_client.get(f"/analytics/jobs/{job['id']}").status_code == 404
+    assert not (Path(jobs.JOBS_DIR) / job["id"]).exists()
+
+
+def test_sales_export_streams_csv(seeded_client):
+    response = seeded_client.get("/analytics/sales-export")
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == ",".join(analytics.EXPORT_COLUMNS)
+    assert len(lines) == 4
+
+
+def test_sales_export_empty_range(seeded_client):
+    response = seeded_client.get("/analytics/sales-export", params={"start_date": "2030-01-01T00:00:00"})
+    assert response.status_code == 204
+
+
+def test_sales_csv_chunks(seeded_client, db_session, monkeypatch):
+    monkeypatch.setattr(analytics, "EXPORT_CHUNK_BYTES", 32)
+    monkeypatch.setattr(analytics, "EXPORT_BATCH_SIZE", 1)
+    chunks = list(analytics.iter_sales_csv(db_session, None, None))
+    assert len(chunks) > 1
+    assert "".join(chunks) == analytics.sales_csv(db_session, None, None)
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_sales_export_columnar(seeded_client, fmt):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    response = seeded_client.get("/analytics/sales-export", params={"format": fmt, "compression": "zstd"})
+    assert response.status_code == 200
+    source = pa.BufferReader(response.content)
+    table = pq.read_table(source) if fmt == "parquet" else pa.ipc.open_stream(source).read_all()
+    assert table.column_names == analytics.EXPORT_COLUMNS
+    assert table.num_rows == 3
+    assert sum(table.column("revenue").to_pylist()) == 135.0
+
+
+def test_sales_export_gzip_csv(seeded_client):
+    import gzip
+
+    response = seeded_client.get("/analytics/sales-export", params={"compression": "gzip"})
+    assert response.status_code == 200
+    assert gzip.decompress(response.content).decode() == seeded_client.get("/analytics/sales-export").text
+
+
+def test_sales_export_invalid_format(seeded_client):
+    assert seeded_client.get("/analytics/sales-export", params={"format": "xlsx"}).status_code == 400
+    response = seeded_client.get("/analytics/sales-export", params={"format": "arrow", "compression": "brotli"})
+    assert response.status_code == 400
+
+
+def test_generated_data_accepts_new_writes(client, db_session):
+    from scripts.generate_data import generate
+
+    summary = generate(db_session, 40, products=5, customers=8, days=20, log=lambda _: None)
+    assert summary["orders"] == 40
+    product = client.post("/products", json={"name": "Extra", "category": "Misc", "price": 3})
+    customer = client.post("/customers", json={"name": "Extra", "email": "extra@example.com"})
+    assert (product.status_code, customer.status_code) == (201, 201)
+    assert (product.json()["id"], customer.json()["id"]) == (6, 9)
+    order = {"customer_id": 1, "items": [{"product_id": product.json()["id"], "quantity": 1}]}
+    response = client.post("/orders", json=order)
+    assert response.status_code == 201 and response.json()["id"] == 41
+
+
+def test_bulk_orders_report_per_order_errors(client):
+    customer = client.post("/customers", json={"name": "Dana", "email": "dana@example.com"}).json()
+    product = client.post("/products", json={"name": "Binder", "category": "Office", "price": 4}).json()
+    good = {
+        "customer_id": customer["id"],
+        "order_date": "2024-02-01T10:00:00",
+        "items": [{"product_id": product["id"], "quantity": 3}],
+    }
+    bad = {"customer_id": customer["id"], "items": [{"product_id": 999, "quantity": 1}]}
+
+    response = client.post("/orders/bulk", json=[good, bad, good])
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert body["results"][1] == {"index": 1, "order_id": None, "error": "Product 999 not found."}
+    assert len(client.get("/orders").json()) == 2
+
+    summary = client.get("/analytics/category-summary").json()
+    assert summary == [{"category": "Office", "revenue": 24.0, "quantity": 6}]
+
+
+def test_orders_keyset_pagination(client):
+    customer = client.post("/customers", json={"name": "Erin", "email": "erin@example.com"}).json()
+    product = client.post("/products", json={"name": "Folder", "category": "Office", "price": 1}).json()
+    orders = [
+        {
+            "customer_id": customer["id"],
+            "order_date": "2024-03-01T09:00:00",
+            "status": "completed" if index % 2 else "created",
+            "items": [{"product_id": product["id"], "quantity": index + 1}],
+        }
+        for index in range(5)
+    ]
+    client.post("/orders/bulk", json=orders)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/orders", params=params)
+        seen.extend(order["id"] for order in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == 5
+
+    completed = client.get("/orders", params={"status": "completed"}).json()
+    assert len(completed) == 2
+    assert client.get("/orders", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_products_pagination(client):
+    for name in ("A", "B", "C"):
+        client.post("/products", json={"name": name, "category": "Misc", "price": 1})
+    first = client.get("/products", params={"limit": 2})
+    assert [product["name"] for product in first.json()] == ["A", "B"]
+    second = client.get("/products", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [product["name"] for product in second.json()] == ["C"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_analytics_cache_invalidated_by_writes(seeded_client):
+    first = seeded_client.get("/analytics/top-products", params={"limit": 5}).json()
+    assert seeded_client.get("/analytics/top-products", params={"limit": 5}).json() == first
+    stats = seeded_client.get("/analytics/cache-stats").json()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    product = seeded_client.post("/products", json={"name": "Globe", "category": "Decor", "price": 200}).json()
+    seeded_client.post(
+        "/orders",
+        json={"customer_id": 1, "order_date": "2024-01-02T12:00:00", "items": [{"product_id": product["id"], "quantity": 1}]},
+    )
+    refreshed = seeded_client.get("/analytics/top-products", params={"limit": 5}).json()
+    assert refreshed[0]["product_name"] == "Globe"
+    assert seeded_client.get("/analytics/cache-stats").json()["misses"] == 2
+
+
+def test_conditional_get_answers_304_until_data_changes(seeded_client, monkeypatch):
+    params = {"engine": "pandas"}
+    first = seeded_client.get("/analytics/category-summary", params=params)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"].startswith("public, max-age=")
+    assert seeded_client.get("/analytics/category-summary", params={}).headers["etag"] != etag
+
+    def no_scan(*args):
+        raise AssertionError("conditional requests must not load order lines")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(analytics, "_fetch_sales_rows", no_scan)
+        cache.clear()
+        revalidated = seeded_client.get(
+            "/analytics/category-summary", params=params, headers={"If-None-Match": etag}
+        )
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+        since = seeded_client.get(
+            "/analytics/category-summary",
+            params=params,
+            headers={"If-Modified-Since": first.headers["last-modified"]},
+        )
+        assert since.status_code == 304
+
+    products = seeded_client.get("/products")
+    assert seeded_client.get("/products", headers={"If-None-Match": products.headers["etag"]}).status_code == 304
+    seeded_client.post(
+        "/orders",
+        json={"customer_id": 1, "order_date": "2024-01-03T09:00:00", "items": [{"product_id": 1, "quantity": 1}]},
+    )
+    changed = seeded_client.get("/analytics/category-summary", params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def _async_app():
+    pytest.importorskip("aiosqlite")
+    from fastapi import FastAPI
+
+    from app import async_routes
+    from app.database import create_async_session_factory, get_async_db, get_async_read_db
+    from app.main import app
+
+    from .conftest import TEST_DB_URL
+
+    async_engine, AsyncTestingSession = create_async_session_factory(TEST_DB_URL)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async_app = FastAPI()
+    async_app.router.routes.extend(app.router.routes)
+    async_routes.install(async_app)
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+    async_app.dependency_overrides[get_async_read_db] = override_get_async_db
+    return async_app
+
+
+def test_async_routes_match_sync(seeded_client):
+    from fastapi.testclient import TestClient
+
+    with TestClient(_async_app()) as async_client:
+        created = async_client.post("/products", json={"name": "Ruler", "category": "Stationery", "price": 2})
+        assert created.status_code == 201
+        for path in (
+            "/products",
+            "/customers",
+            "/orders",
+            "/analytics/top-products",
+            "/analytics/category-summary",
+            "/analytics/dashboard",
+        ):
+            assert async_client.get(path).json() == seeded_client.get(path).json()
+        assert async_client.get("/analytics/sales-over-time", params={"interval": "yearly"}).status_code == 400
+
+
+def test_async_analytics_do_not_block_the_event_loop(seeded_client, monkeypatch):
+    import httpx
+
+    async_app = _async_app()
+    pandas_top_products = analytics._pandas_top_products
+
+    def slow_top_products(df, limit):
+        time.sleep(0.5)
+        return pandas_top_products(df, limit)
+
+    monkeypatch.setattr(analytics, "_pandas_top_products", slow_top_products)
+
+    async def health_during_slow_request():
+        transport = httpx.ASGITransport(app=async_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.create_task(client.get("/analytics/top-products", params={"engine": "pandas"}))
+            await asyncio.sleep(0.1)
+            started = time.perf_counter()
+            health = await client.get("/health")
+            waited = time.perf_counter() - started
+            slow_done = slow.done()
+            return health, waited, slow_done, await slow
+
+    health, waited, slow_done, slow = asyncio.run(health_during_slow_request())
+    assert health.status_code == 200 and waited < 0.3
+    assert not slow_done
+    assert slow.json() == seeded_client.get("/analytics/top-products").json()
+
+
+def test_read_routes_use_healthy_replicas_and_fall_back(tmp_path, client, db_session):
+    from sqlalchemy import create_engine
+
+    from app import database
+    from app.database import get_read_db
+
+    from .conftest import TestingSessionLocal
+
+    replica_path = tmp_path / "replica.db"
+    replica_engine = create_engine(f"sqlite:///{replica_path}")
+    models.Base.metadata.create_all(bind=replica_engine)
+    with replica_engine.begin() as connection:
+        connection.execute(models.Product.__table__.insert().values(name="Replica only", category="Misc", price=1))
+    replica_engine.dispose()
+
+    replicas = database.ReadReplicas(
+        [f"sqlite:///{replica_path}", f"sqlite:///{tmp_path / 'missing.db'}"],
+        health_interval=0,
+        primary=TestingSessionLocal,
+    )
+    client.app.dependency_overrides[get_read_db] = replicas.get_db
+    try:
+        client.post("/products", json={"name": "Primary only", "category": "Misc", "price": 2})
+        for _ in range(3):
+            assert [row["name"] for row in client.get("/products").json()] == ["Replica only"]
+        assert not (tmp_path / "missing.db").exists()
+        healthy = [replica["healthy"] for replica in replicas.stats()["replicas"]]
+        assert healthy == [True, False]
+
+        for replica in replicas.replicas:
+            replica.engine.dispose()
+        replica_path.unlink()
+        assert [row["name"] for row in client.get("/products").json()] == ["Primary only"]
+        assert replicas.stats()["fallbacks_to_primary"] >= 1
+    finally:
+        client.app.dependency_overrides.pop(get_read_db, None)
+
+    urls = [f"sqlite:///{tmp_path / name}" for name in ("a.db", "b.db")]
+    for url in urls:
+        models.Base.metadata.create_all(bind=create_engine(url))
+    least_loaded = database.ReadReplicas(urls, "least-loaded", 3600)
+    busy = least_loaded.replicas[0].engine.connect()
+    try:
+        assert least_loaded.choose() is least_loaded.replicas[1]
+    finally:
+        busy.close()
+
+
+def test_engine_tuning_and_pool_stats(tmp_path, client):
+    from sqlalchemy import create_engine, text
+
+    from app import database
+
+    url = f"sqlite:///{tmp_path / 'tuned.db'}"
+    tuned = create_engine(url, **database.engine_options(url))
+    database.apply_sqlite_pragmas(tuned)
+    with tuned.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+    stats = database.pool_stats(tuned)
+    assert stats["checkouts"] == 1
+    assert stats["capacity"] == database.POOL_SETTINGS["pool_size"] + database.POOL_SETTINGS["max_overflow"]
+    tuned.dispose()
+
+    response = client.get("/stats/db-pool")
+    assert response.status_code == 200
+    assert "saturation" in response.json()["primary"]
+
+
+def test_index_advisor_flags_missing_indexes(seeded_client, db_session):
+    from sqlalchemy import text
+
+    from app import index_advisor
+
+    report = index_advisor.run(db_session)
+    assert {entry["query"] for entry in report} >= {"top_products", "category_summary_rollup", "orders_page"}
+    assert [entry for entry in report if entry["sequential_scans"]] == []
+
+    bind = db_session.get_bind()
+    with bind.begin() as connection:
+        connection.execute(text("DROP INDEX ix_orders_order_date_id"))
+    flagged = {entry["query"] for entry in index_advisor.run(db_session) if entry["sequential_scans"]}
+    assert "sales_over_time" in flagged
+
+    assert index_advisor.create_missing_indexes(bind) == ["ix_orders_order_date_id"]
+    assert not any(entry["sequential_scans"] for entry in index_advisor.run(db_session))
+
+
+def test_profiling_middleware(seeded_client, profiled_client, tmp_path):
+    response = profiled_client.get("/analytics/top-products", params={"engine": "pandas"})
+    timing = response.headers["server-timing"]
+    for name in ("sql;", "rows;", "dataframe;", "aggregate;", "serialize;", "total;"):
+        assert name in timing
+    assert list(tmp_path.glob("*.prof"))
+
+    body = profiled_client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/analytics/top-products",status="200"} 1' in body
+    assert 'db_queries_total{method="GET",route="/analytics/top-products"}' in body
+
+    # The routes are shared with the main app, so uninstalling must leave them as they were.
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from app import profiling
+    from app.main import app
+
+    profiling.uninstall(profiled_client.app)
+    calls = [route.dependant.call for route in app.router.routes if hasattr(route, "dependant")]
+    assert not any(getattr(call, "_profiling_wrapped", False) for call in calls)
+    assert not event.contains(Engine, "before_cursor_execute", profiling._before_cursor_execute)
+
+
+def test_fetch_sales_rows_typed_columns(seeded_client, db_session):
+    df = analytics._fetch_sales_rows(db_session, None, None)
+    assert str(df["order_date"].dtype) == "datetime64[us]"
+    assert df["product_id"].dtype == "int32"
+    assert df["unit_price"].dtype == "float64"
+    assert df["category"].dtype == "category"
+    assert sorted(df["category"].astype(str)) == ["Electronics", "Electronics", "Stationery"]
+    assert df["revenue"].sum() == 135.0
+    assert analytics._fetch_sales_rows(db_session, datetime(2030, 1, 1), None).empty